@@ -10,21 +10,155 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY")
     
+    # Pool assíncrono do Supabase (PostgREST)
+    SUPABASE_TIMEOUT_SECONDS: float = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+    SUPABASE_POOL_SIZE: int = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+    # (Opcional) Conexão direta ao Postgres via asyncpg (ex: postgresql://...:6543/postgres)
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    # Usa a RPC query_context (sql/query_context.sql) para buscar o contexto do /query em uma chamada
+    USE_QUERY_CONTEXT_RPC: bool = os.getenv("USE_QUERY_CONTEXT_RPC", "false").lower() == "true"
+    
     # Gemini AI
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY")
+    # Chamada de intenção: resposta JSON curta (o schema limita os campos)
+    INTENT_MAX_OUTPUT_TOKENS: int = int(os.getenv("INTENT_MAX_OUTPUT_TOKENS", "512"))
+    # Raciocínio do modelo conta em max_output_tokens; "minimal" mantém a resposta rápida e dentro do limite
+    INTENT_THINKING_LEVEL: str = os.getenv("INTENT_THINKING_LEVEL", "minimal")
+    # Orçamento (estimado) do prompt de intenção: corta histórico antigo e depois exemplos
+    PROMPT_TOKEN_BUDGET: int = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+    # Mensagens recentes que vão inteiras no prompt (as anteriores entram no resumo da sessão)
+    PROMPT_HISTORY_TURNS: int = int(os.getenv("PROMPT_HISTORY_TURNS", "4"))
+    PROMPT_MIN_EXAMPLES: int = int(os.getenv("PROMPT_MIN_EXAMPLES", "4"))
+    # Resumo contínuo da conversa (sql/memoria_resumo.sql), atualizado em background
+    SUMMARY_ENABLED: bool = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+    SUMMARY_MAX_CHARS: int = int(os.getenv("SUMMARY_MAX_CHARS", "600"))
+    # Mensagens fora da janela recente necessárias para chamar o LLM de resumo
+    SUMMARY_MIN_NEW_MESSAGES: int = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "4"))
+    SUMMARY_MAX_CONCURRENCY: int = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "2"))
+    # Shortlist de categorias no prompt (catálogos com mais de CATEGORY_SHORTLIST_MIN categorias)
+    CATEGORY_SHORTLIST_MIN: int = int(os.getenv("CATEGORY_SHORTLIST_MIN", "40"))
+    CATEGORY_SHORTLIST_TOP_K: int = int(os.getenv("CATEGORY_SHORTLIST_TOP_K", "15"))
+    # Prazo do embedding da mensagem; estourou = lexicais + lista de fallback
+    CATEGORY_SHORTLIST_TIMEOUT: float = float(os.getenv("CATEGORY_SHORTLIST_TIMEOUT", "1.5"))
+    # Sem índice pronto ou sem embedding da mensagem: lista inteira, até este tamanho
+    CATEGORY_SHORTLIST_FALLBACK_MAX: int = int(os.getenv("CATEGORY_SHORTLIST_FALLBACK_MAX", "150"))
+    # Context cache explícito do prefixo estático (o modelo exige um mínimo de tokens no cache)
+    PROMPT_CONTEXT_CACHE: bool = os.getenv("PROMPT_CONTEXT_CACHE", "false").lower() == "true"
+    PROMPT_CONTEXT_CACHE_TTL_SECONDS: int = int(os.getenv("PROMPT_CONTEXT_CACHE_TTL_SECONDS", "3600"))
     
     # Configurações da API
     PRODUCTS_LIMIT: int = int(os.getenv("PRODUCTS_LIMIT", "5"))
     MAX_CONCURRENT_AI_REQUESTS: int = int(os.getenv("MAX_CONCURRENT_AI_REQUESTS", "5"))
     AI_QUEUE_TIMEOUT: int = int(os.getenv("AI_QUEUE_TIMEOUT", "30"))
     
+    # Rate limit global do Gemini (compartilhado entre réplicas via Redis)
+    GEMINI_CHAT_RPM: int = int(os.getenv("GEMINI_CHAT_RPM", "120"))
+    GEMINI_CHAT_BURST: int = int(os.getenv("GEMINI_CHAT_BURST", "10"))
+    GEMINI_EMBED_RPM: int = int(os.getenv("GEMINI_EMBED_RPM", "600"))
+    GEMINI_EMBED_BURST: int = int(os.getenv("GEMINI_EMBED_BURST", "20"))
+    # Fração do bucket que só o tráfego interativo pode consumir (o worker espera)
+    GEMINI_INTERACTIVE_RESERVE: float = float(os.getenv("GEMINI_INTERACTIVE_RESERVE", "0.3"))
+    
+    # Prazo de ponta a ponta do /query (o header X-Request-Timeout, em segundos, pode reduzir)
+    REQUEST_DEADLINE_SECONDS: float = float(os.getenv("REQUEST_DEADLINE_SECONDS", "25"))
+    # Circuit breakers (Gemini chat, Gemini embeddings, Supabase): abre após N falhas seguidas
+    BREAKER_FAILURE_THRESHOLD: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RESET_SECONDS: float = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+    # Falha ou timeout depois deste tempo conta mesmo com o prazo do cliente esgotado (0 = desligado)
+    BREAKER_SLOW_CALL_SECONDS: float = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "8"))
+    
+    # Hedged requests ao Gemini (intenção e embedding de consulta): cópia da chamada
+    # se não houver resposta no percentil HEDGE_PERCENTILE das latências recentes
+    HEDGE_ENABLED: bool = os.getenv("HEDGE_ENABLED", "false").lower() == "true"
+    HEDGE_PERCENTILE: float = float(os.getenv("HEDGE_PERCENTILE", "95"))
+    HEDGE_MIN_DELAY_MS: float = float(os.getenv("HEDGE_MIN_DELAY_MS", "300"))
+    HEDGE_MAX_DELAY_MS: float = float(os.getenv("HEDGE_MAX_DELAY_MS", "10000"))
+    HEDGE_BUDGET_RATIO: float = float(os.getenv("HEDGE_BUDGET_RATIO", "0.05")) # máx. de chamadas extras
+    HEDGE_MIN_SAMPLES: int = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    # Modelo da cópia da chamada de intenção (vazio = mesmo modelo). Embeddings sempre
+    # usam o mesmo modelo: vetores de outro modelo não são comparáveis aos salvos.
+    HEDGE_FALLBACK_CHAT_MODEL: str = os.getenv("HEDGE_FALLBACK_CHAT_MODEL", "")
+    
+    # Cache de páginas de busca (invalidado pela versão do catálogo; TTL é só backstop).
+    # O TTL longo só vale com o barramento de invalidação conectado; sem ele, o curto
+    SEARCH_CACHE_ENABLED: bool = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() == "true"
+    SEARCH_CACHE_TTL_SECONDS: int = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "600"))
+    SEARCH_CACHE_FALLBACK_TTL_SECONDS: int = int(os.getenv("SEARCH_CACHE_FALLBACK_TTL_SECONDS", "60"))
+    
+    # Cache L1 em memória na frente do Redis (categorias, buscas, embeddings de consulta).
+    # Invalidação entre réplicas por Redis pub/sub; sem a assinatura, vale o TTL curto.
+    CACHE_L1_ENABLED: bool = os.getenv("CACHE_L1_ENABLED", "true").lower() == "true"
+    CACHE_L1_TTL_SECONDS: float = float(os.getenv("CACHE_L1_TTL_SECONDS", "300"))
+    CACHE_L1_FALLBACK_TTL_SECONDS: float = float(os.getenv("CACHE_L1_FALLBACK_TTL_SECONDS", "5"))
+    CACHE_L1_MAX_ENTRIES: int = int(os.getenv("CACHE_L1_MAX_ENTRIES", "5000"))
+    CACHE_INVALIDATION_CHANNEL: str = os.getenv("CACHE_INVALIDATION_CHANNEL", "cache:invalidate")
+    
+    # Prefetch da próxima página (calculada em background após respostas com has_more)
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "true").lower() == "true"
+    PREFETCH_MAX_CONCURRENCY: int = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "2"))
+    PREFETCH_TTL_SECONDS: int = int(os.getenv("PREFETCH_TTL_SECONDS", "120"))
+    # "ver mais" / "mais opções" com página pré-carregada responde sem chamar o LLM
+    PREFETCH_FAST_PATH: bool = os.getenv("PREFETCH_FAST_PATH", "true").lower() == "true"
+    
+    # Snapshot local dos embeddings (volume compartilhado entre worker e API; vazio = desabilitado)
+    VECTOR_SNAPSHOT_DIR: str = os.getenv("VECTOR_SNAPSHOT_DIR", "")
+    # float16 (2 bytes/dim) ou int8 (1 byte/dim + escala por vetor)
+    VECTOR_SNAPSHOT_DTYPE: str = os.getenv("VECTOR_SNAPSHOT_DTYPE", "float16")
+    # Guarda também os vetores em float32 para reordenar candidatos com score próximo
+    VECTOR_SNAPSHOT_FULL_PRECISION: bool = os.getenv("VECTOR_SNAPSHOT_FULL_PRECISION", "true").lower() == "true"
+    VECTOR_SNAPSHOT_RELOAD_SECONDS: float = float(os.getenv("VECTOR_SNAPSHOT_RELOAD_SECONDS", "30"))
+    VECTOR_SNAPSHOT_RESCORE_MARGIN: float = float(os.getenv("VECTOR_SNAPSHOT_RESCORE_MARGIN", "0.02"))
+    
     # Configurações do Worker
-    EMBEDDING_UPDATE_INTERVAL_MINUTES: int = int(os.getenv("EMBEDDING_UPDATE_INTERVAL_MINUTES", "10"))
+    # Varredura completa (rede de segurança): alterações chegam pela fila em segundos
+    EMBEDDING_UPDATE_INTERVAL_MINUTES: int = int(os.getenv("EMBEDDING_UPDATE_INTERVAL_MINUTES", "60"))
+    
+    # Pipeline do worker (scan -> texto -> embed -> escrita). O scan é um só (keyset por id)
+    TEXT_CONCURRENCY: int = int(os.getenv("TEXT_CONCURRENCY", "1"))
+    EMBED_BATCH_SIZE: int = int(os.getenv("EMBED_BATCH_SIZE", "50")) # máx. 100 no batchEmbedContents
+    EMBED_CONCURRENCY: int = int(os.getenv("EMBED_CONCURRENCY", "2"))
+    WRITE_BATCH_SIZE: int = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+    WRITE_CONCURRENCY: int = int(os.getenv("WRITE_CONCURRENCY", "2"))
+    # Itens em espera entre estágios (backpressure)
+    PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "200"))
+    # Progresso da varredura (retomada após queda). Vazio = sem checkpoint
+    EMBEDDING_CHECKPOINT_FILE: str = os.getenv("EMBEDDING_CHECKPOINT_FILE", "embeddings_checkpoint.json")
+    
+    # Eleição de líder do worker (lease no Redis). Sem renovação por este tempo, outra cópia assume
+    WORKER_LEASE_TTL_SECONDS: float = float(os.getenv("WORKER_LEASE_TTL_SECONDS", "30"))
+    # Partições da varredura por hash do id (uma por cópia do worker; 1 = só o líder trabalha)
+    WORKER_SHARDS: int = int(os.getenv("WORKER_SHARDS", "1"))
+    
+    # Fila de produtos alterados (webhook /internal/products-changed e LISTEN/NOTIFY)
+    CHANGE_QUEUE_STREAM: str = os.getenv("CHANGE_QUEUE_STREAM", "products:changed")
+    CHANGE_BATCH_SIZE: int = int(os.getenv("CHANGE_BATCH_SIZE", "100"))
+    # Espera para juntar alterações em massa em um único lote
+    CHANGE_BATCH_WINDOW_MS: int = int(os.getenv("CHANGE_BATCH_WINDOW_MS", "500"))
+    # Canal do NOTIFY: tem que ser o argumento do trigger em sql/products_changed_notify.sql
+    # (produtos_changed). Vazio = sem LISTEN. Requer DATABASE_URL
+    PRODUCTS_NOTIFY_CHANNEL: str = os.getenv("PRODUCTS_NOTIFY_CHANNEL", "")
+    # Sem Redis, a própria API processa a fila de alterações
+    CHANGE_QUEUE_IN_PROCESS: bool = os.getenv("CHANGE_QUEUE_IN_PROCESS", "true").lower() == "true"
+    # Nome do consumidor no consumer group (vazio = hostname, que muda a cada task do Swarm)
+    CHANGE_QUEUE_CONSUMER: str = os.getenv("CHANGE_QUEUE_CONSUMER", "")
+    # Mensagens pendentes paradas há mais que isso são reavidas de outros consumidores (XAUTOCLAIM)
+    CHANGE_QUEUE_CLAIM_IDLE_MS: int = int(os.getenv("CHANGE_QUEUE_CLAIM_IDLE_MS", "60000"))
+    
+    # Startup: prazo do warm-up (pools, categorias, caches) antes do /ready responder 200
+    STARTUP_WARMUP_TIMEOUT: float = float(os.getenv("STARTUP_WARMUP_TIMEOUT", "15"))
+    
+    # Debug/profiling (/debug/*, header X-Debug-Key). Vazio = desligado, sem custo algum
+    DEBUG_API_KEY: str = os.getenv("DEBUG_API_KEY", "")
+    PROFILE_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+    PROFILE_MAX_REQUESTS: int = int(os.getenv("PROFILE_MAX_REQUESTS", "50"))
+    LOOP_LAG_INTERVAL_MS: float = float(os.getenv("LOOP_LAG_INTERVAL_MS", "500"))
     
     # Redis (Cache)
     REDIS_URL: str = os.getenv("REDIS_URL", "")
 
     # Segurança
     API_KEY: str = os.getenv("API_KEY", "")
+    # Assinatura (HMAC) do next_cursor. Vazio = derivada da SUPABASE_KEY
+    CURSOR_SECRET: str = os.getenv("CURSOR_SECRET", "")
 
 settings = Settings()
@@ -1,177 +1,235 @@
-from app.core.gemini_service import get_chat_model
+from app.core.gemini_service import get_api_key, get_http_client, CHAT_MODEL_NAME, GeminiError, is_dependency_failure
+from app.core.hedging import hedger_from_settings
+from app.core.circuit_breaker import gemini_chat_breaker, CircuitOpen
+from app.core.deadline import timeout_for, DeadlineExceeded
+from app.core.cache import cache
+from app.core.prompt_builder import prompt_builder, ContextCache
+from app.core.category_index import category_index, categories_digest
+from app.core.rate_limiter import chat_limiter, INTERACTIVE
+from app.core.singleflight import SingleFlight, normalize_key
+from app.core.metrics import metrics, ratio
+from app.config import settings
+from app.models import Intent
+from pydantic import ValidationError
 import os
 import asyncio
-
-# Instancia o modelo via serviço centralizado
-model = get_chat_model()
+import hashlib
 
 # Configuração de Concorrência
 MAX_CONCURRENT = int(os.environ.get("MAX_CONCURRENT_AI_REQUESTS", 10))
 TIMEOUT_SECONDS = int(os.environ.get("AI_QUEUE_TIMEOUT", 30))
 semaphore = asyncio.Semaphore(MAX_CONCURRENT)
 
-# Nota: O User pediu Gemini 3.0 Flash, mas atualmente o disponível via API 
-# pode ser o gemini-1.5-flash ou gemini-2.0-flash-exp. 
-# Vou usar o gemini-2.0-flash-exp como proxy ou o mais recente disponível.
-# Se der erro, fallback para gemini-1.5-flash.
+_intent_flight = SingleFlight("intent")
+# Cópia da chamada quando a resposta demora mais que o percentil recente (opt-in: HEDGE_ENABLED)
+_intent_hedger = hedger_from_settings("intent")
+
+# Schema da resposta (modo application/json do Gemini): o modelo só gera esses campos
+_NULLABLE_NUMBER = {"type": "NUMBER", "nullable": True}
+_BOOLEAN = {"type": "BOOLEAN"}
+INTENT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "type": {"type": "STRING", "enum": ["search_product", "search_category", "conversation"]},
+        "term": {"type": "STRING", "nullable": True},
+        "tag": {"type": "STRING", "nullable": True},
+        "price_min": _NULLABLE_NUMBER,
+        "price_max": _NULLABLE_NUMBER,
+        "price_exact": _NULLABLE_NUMBER,
+        "price_min_exclusive": _BOOLEAN,
+        "price_max_exclusive": _BOOLEAN,
+        "page": {"type": "INTEGER"},
+        "sort": {"type": "STRING", "enum": ["price_asc", "price_desc"], "nullable": True},
+        "ai_reply": {"type": "STRING"},
+        "is_category_list": _BOOLEAN,
+    },
+    "required": ["type", "ai_reply"],
+    "propertyOrdering": [
+        "type", "term", "tag", "price_min", "price_max", "price_exact",
+        "price_min_exclusive", "price_max_exclusive", "page", "sort",
+        "ai_reply", "is_category_list",
+    ],
+}
+
+# Context cache explícito do prefixo estático (opcional; o cache implícito do Gemini
+# já aproveita o prefixo idêntico no início de cada requisição)
+context_cache = ContextCache(CHAT_MODEL_NAME, settings.PROMPT_CONTEXT_CACHE_TTL_SECONDS) if settings.PROMPT_CONTEXT_CACHE else None
+
+# Resposta padrão quando a chamada falha ou o JSON não passa na validação
+FALLBACK_INTENT = Intent(ai_reply="Desculpe, não entendi. Pode repetir?")
 
-import json
+# Intenções de mensagens sem histórico ficam em cache: servem de degradação
+# quando o Gemini está fora (circuito aberto ou erro na chamada)
+INTENT_CACHE_TTL_SECONDS = 6 * 3600
 
-# ... (imports mantidos)
+metrics.register_gauge(
+    "intent.parse_failure_ratio",
+    lambda: ratio(metrics.get("intent.parse_failures"), metrics.get("intent.calls")),
+)
 
-async def process_user_message(message: str, history: list, categories: list) -> dict:
-    print("🚀 [DEBUG] process_user_message: USANDO VERSÃO HTTP REQUESTS")
+async def process_user_message(message: str, history: list, categories: list, summary: dict = None) -> Intent:
     """
     Processa a mensagem com contexto (Versão Async).
-    Retorna um dicionário com:
-    - type: 'search_product' | 'search_category' | 'conversation'
-    - term: termo de busca ou nome da categoria
-    - ai_reply: resposta textual da IA para o usuário
+    `summary`: resumo da sessão + última busca ativa (memoria_resumo), se houver.
+    Retorna um Intent (type, term, filtros de preço/tag, página, ai_reply...).
     """
-    
-    # Formatar histórico para o prompt
-    history_text = ""
-    for h in history[-5:]: # Ultimas 5 interacoes
-        role = "Usuário" if h['role'] == 'user' else "Assistente"
-        history_text += f"{role}: {h['content']}\n"
-        
-    categories_text = ", ".join(categories)
-    
-    prompt = f"""
-    Você é um assistente de e-commerce inteligente.
-    
-    CATEGORIAS DISPONÍVEIS NO BANCO: [{categories_text}]
-    
-    HISTÓRICO RECENTE:
-    {history_text}
-    
-    MENSAGEM ATUAL DO USUÁRIO: "{message}"
-    
-    SUA TAREFA:
-    1. Analise se o usuário quer um produto específico ou ver uma categoria.
-    2. Se for categoria, verifique se ela existe na lista (ou algo próximo).
-    3. Se o usuário disser "sim", "quero", "mais", "ver restante" ou "continuar", isso é paginação. Mantenha o termo da busca anterior e incremente a pagina mentalmente (ou apenas sinalize page: N).
-    4. Se o usuário perguntar O QUE TEM, O QUE VENDE, QUAIS OPCOES (perguntas genéricas), sua resposta DEVE listar as categorias disponíveis separadas por vírgula e marcar "is_category_list": true.
-    5. Se o usuário pedir uma CARACTERÍSTICA ESPECÍFICA (ex: vegano, sem glúten, fitness), extraia isso como 'tag'.
-       - IMPORTANTE: Padronize a tag com a primeira letra maiúscula e o resto minúsculo (Title Case). 
-       - CORRIJA GÊNERO E NÚMERO: Se o usuário falar "Vegana" ou "Veganas", converta para o padrão do banco que é singular masculino "Vegano". O mesmo para "Sem Glutens" -> "Sem Glúten".
-    6. Se o usuário mencionar VALORES (preço), extraia:
-       - 'price_min': Para "acima de", "partir de", "mais caro que", "maior que".
-       - 'price_max': Para "até", "abaixo de", "mais barato que", "menos de", "menor que".
-       - 'price_exact': Para "exatamente", "no valor de".
-       - 'price_min_exclusive': true se for "maior que", "acima de". false se for "a partir de", "de".
-       - 'price_max_exclusive': true se for "menor que", "abaixo de", "menos de". false se for "até", "no máximo".
-    7. ORDENAÇÃO (Importante):
-       - Se o usuário pedir "mais barato", "menor preço", "mais em conta" -> defina "sort": "price_asc".
-       - Se o usuário pedir "mais caro", "maior preço", "luxuoso", "premium" -> defina "sort": "price_desc".
-       - Se não especificar ordem, mantenha "sort": null.
-    8. REGRA DE OURO PARA TERMOS:
-       - Se o usuário NÃO disser explicitamente o nome de um produto ou categoria (ex: "algo barato", "presente até 50 reais"), o campo "term" DEVE SER NULL. NÃO INVENTE CATEGORIAS.
-
-    RETORNE APENAS UM JSON VÁLIDO (sem markdown) no seguinte formato:
-    {{
-        "type": "search_product" OU "search_category" OU "conversation",
-        "term": "termo de busca ou nome exato da categoria",
-        "tag": "nome da tag (ex: vegano) ou null",
-        "price_min": 10.50 ou null,
-        "price_max": 50.00 ou null,
-        "price_exact": null,
-        "price_min_exclusive": true ou false,
-        "price_max_exclusive": true ou false,
-        "page": 1,
-        "sort": "price_asc" OU "price_desc" OU null,
-        "ai_reply": "Sua resposta curta.",
-        "is_category_list": true ou false
-    }}
-    
-    Exemplos:
-    - User: "Tem algo vegano?" -> {{"type": "search_product", "term": null, "tag": "Vegano", "price_min": null, "price_max": null, "price_exact": null, "price_min_exclusive": false, "price_max_exclusive": false, "page": 1, "sort": null, "ai_reply": "Buscando opções veganas...", "is_category_list": false}}
-    - User: "Doces sem açúcar até 20 reais" -> {{"type": "search_product", "term": "Doces", "tag": "Sem Açúcar", "price_min": null, "price_max": 20.00, "price_exact": null, "price_min_exclusive": false, "price_max_exclusive": false, "page": 1, "sort": null, "ai_reply": "Doces sem açúcar até R$20.", "is_category_list": false}}
-    - User: "Algo para comer com menos de 20 reais" -> {{"type": "search_product", "term": null, "tag": null, "price_min": null, "price_max": 20.00, "price_exact": null, "price_min_exclusive": false, "price_max_exclusive": true, "page": 1, "sort": null, "ai_reply": "Opções por menos de R$20.", "is_category_list": false}}
-    - User: "Fone mais caro que 100" -> {{"type": "search_product", "term": "Fone", "tag": null, "price_min": 100.00, "price_max": null, "price_exact": null, "price_min_exclusive": true, "price_max_exclusive": false, "page": 1, "sort": null, "ai_reply": "Fones acima de R$100.", "is_category_list": false}}
-    - User: "Camisa de 50 reais" -> {{"type": "search_product", "term": "Camisa", "tag": null, "price_min": null, "price_max": null, "price_exact": 50.00, "price_min_exclusive": false, "price_max_exclusive": false, "page": 1, "sort": null, "ai_reply": "Camisas de R$50.", "is_category_list": false}}
-    - User: "Mostre os mais baratos" -> {{"type": "search_product", "term": null, "tag": null, "price_min": null, "price_max": null, "price_exact": null, "page": 1, "sort": "price_asc", "ai_reply": "Aqui estão os produtos de menor preço.", "is_category_list": false}}
-    - User: "Qual é o produto mais caro?" -> {{"type": "search_product", "term": null, "tag": null, "price_min": null, "price_max": null, "price_exact": null, "page": 1, "sort": "price_desc", "ai_reply": "Este é o nosso produto de maior valor.", "is_category_list": false}}
-    - User: "O que voces tem?" -> {{"type": "conversation", "term": null, "tag": null, "price_min": null, "price_max": null, "price_exact": null, "page": 1, "ai_reply": "Temos: Frutas, Massas...", "is_category_list": true}}
-    - User: "Quero abacate" -> {{"type": "search_product", "term": "Abacate", "tag": null, "price_min": null, "price_max": null, "price_exact": null, "page": 1, "ai_reply": "Busquei por abacate.", "is_category_list": false}}
-    - User: "Quais frutas tem?" -> {{"type": "search_category", "term": "Frutas", "tag": null, "price_min": null, "price_max": null, "price_exact": null, "page": 1, "ai_reply": "Aqui estão frutas.", "is_category_list": false}}
-    - User: "Ver mais" (contexto anterior era frutas) -> {{"type": "search_category", "term": "Frutas", "tag": null, "price_min": null, "price_max": null, "price_exact": null, "page": 2, "ai_reply": "Aqui estão mais opções.", "is_category_list": false}}
-    - User: "Sim" (após ver frutas) -> {{"type": "search_category", "term": "Frutas", "tag": null, "price_min": null, "price_max": null, "price_exact": null, "ai_reply": "Entendido, buscando mais opções de frutas..."}}
-    - User: "Oi" -> {{"type": "conversation", "term": null, "tag": null, "price_min": null, "price_max": null, "price_exact": null, "ai_reply": "Olá! Como posso ajudar na sua compra hoje?"}}
+    if gemini_chat_breaker.is_open():
+        # Gemini fora: nem entra na fila
+        return _degraded_intent(message, categories, "Circuito do Gemini aberto", Intent(server_busy=True))
+    if history or summary:
+        return await _interpret_message(message, history, categories, summary)
+
+    # Sem histórico a intenção depende só da mensagem e das categorias:
+    # mensagens iguais simultâneas compartilham a mesma chamada ao LLM.
+    key = (normalize_key(message), hash(tuple(categories)))
+    result = await _intent_flight.do(key, lambda: _interpret_message(message, history, categories))
+    # Cópia para que cada chamador possa alterar seu próprio objeto
+    return result.model_copy()
+
+def _intent_cache_key(message: str, categories: list) -> str:
+    raw = f"{normalize_key(message)}|{categories_digest(categories)}"
+    return "intent:" + hashlib.sha1(raw.encode()).hexdigest()
+
+def _degraded_intent(message: str, categories: list, reason: str, default: Intent) -> Intent:
+    """Intenção já calculada para a mesma mensagem (se houver) ou `default`."""
+    cached = cache.get_cache(_intent_cache_key(message, categories))
+    if cached:
+        metrics.inc("degraded.intent_cached")
+        print(f"⚠️ [AI] {reason}: usando intenção em cache.")
+        return Intent.model_validate(cached)
+    metrics.inc("degraded.intent_default")
+    print(f"⚠️ [AI] {reason}: sem intenção em cache.")
+    return default.model_copy()
+
+def _record_usage(resp_json: dict):
+    """Tokens gastos na chamada de intenção (usageMetadata do Gemini)."""
+    usage = resp_json.get("usageMetadata") or {}
+    print(f"🧮 [PROMPT] Tokens do prompt: {usage.get('promptTokenCount', '?')} (em cache: {usage.get('cachedContentTokenCount', 0)})")
+    metrics.inc("intent.tokens.prompt", usage.get("promptTokenCount", 0))
+    metrics.inc("intent.tokens.cached", usage.get("cachedContentTokenCount", 0))
+    metrics.inc("intent.tokens.output", usage.get("candidatesTokenCount", 0))
+    metrics.inc("intent.tokens.thoughts", usage.get("thoughtsTokenCount", 0))
+    metrics.inc("intent.tokens.total", usage.get("totalTokenCount", 0))
+
+def parse_intent(resp_json: dict) -> Intent:
+    """Extrai e valida o Intent da resposta do Gemini. Levanta ValueError se inválido."""
+    try:
+        candidate = resp_json['candidates'][0]
+        text_resp = candidate['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError):
+        raise ValueError(f"Resposta sem conteúdo: {resp_json}")
+    if candidate.get("finishReason") == "MAX_TOKENS":
+        # JSON cortado: INTENT_MAX_OUTPUT_TOKENS baixo demais
+        metrics.inc("intent.truncated")
+    try:
+        return Intent.model_validate_json(text_resp)
+    except ValidationError as e:
+        raise ValueError(f"JSON de intenção inválido ({e.error_count()} erros): {text_resp[:200]}")
+
+def _fallback_payload(payload: dict, system: str) -> dict:
+    """
+    Payload para o modelo de fallback do hedge: prefixo sempre como systemInstruction
+    (o context cache é do modelo principal) e sem thinkingConfig (específico do modelo).
     """
+    fallback = {
+        "contents": payload["contents"],
+        "generationConfig": dict(payload["generationConfig"]),
+        "systemInstruction": {"parts": [{"text": system}]},
+    }
+    fallback["generationConfig"].pop("thinkingConfig", None)
+    return fallback
+
+async def _generate_content(model: str, payload: dict, api_key: str) -> dict:
+    """POST generateContent (cancelável). Levanta exceção em erro HTTP."""
+    response = await get_http_client().post(
+        f"/models/{model}:generateContent",
+        params={"key": api_key},
+        json=payload,
+        timeout=timeout_for(60),
+    )
+    if response.status_code != 200:
+        print(f"❌ Erro HTTP Gemini ({model}): {response.text}")
+        raise GeminiError(response.status_code, response.text)
+    return response.json()
+
+async def _interpret_message(message: str, history: list, categories: list, summary: dict = None) -> Intent:
+    # Catálogos grandes: só as categorias relevantes para a mensagem vão ao prompt
+    shortlist = await category_index.shortlist(message, categories)
+    
+    # Prefixo estático (pré-montado) + sufixo da requisição, dentro do orçamento de tokens
+    prompt = prompt_builder.build(message, history, shortlist, total_categories=len(categories), summary=summary)
+    print(f"🧮 [PROMPT] ~{prompt.tokens} tokens estimados | histórico: {prompt.history_turns} turnos | exemplos: {prompt.examples} | categorias: {len(shortlist)}/{len(categories)}")
+    metrics.inc("prompt.tokens_estimated", prompt.tokens)
     
     try:
-        # Tenta pegar o semáforo com timeout
-        async with asyncio.timeout(TIMEOUT_SECONDS):
+        # Tenta pegar o semáforo com timeout (nunca além do prazo da requisição)
+        async with asyncio.timeout(timeout_for(TIMEOUT_SECONDS)):
+            # Orçamento global do projeto (todas as réplicas + worker)
+            await chat_limiter.acquire_async(priority=INTERACTIVE)
             async with semaphore:
-                # --- HARDCORE HTTP FIX ---
-                # Bypass total do SDK do Google que está bugado no ambiente async
-                import requests
-                
-                # Ler chave bruta (Garantia absoluta)
-                c_key = None
-                try:
-                     with open(".env", "r", encoding="utf-8") as f:
-                        for line in f:
-                            if line.strip().startswith("GEMINI_API_KEY="):
-                                c_key = line.strip().split("=", 1)[1].strip().strip('"').strip("'")
-                except:
-                    c_key = os.environ.get("GEMINI_API_KEY")
+                # Chave resolvida uma vez por processo (ambiente ou .env)
+                c_key = get_api_key()
                 
                 if not c_key:
                     raise Exception("Chave API não encontrada nem no .env nem no ambiente.")
 
-                # Chamada REST Manual
-                url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-3-flash-preview:generateContent?key={c_key}"
-                headers = {"Content-Type": "application/json"}
+                # Chamada REST (sem o SDK do Google, que está bugado no ambiente async)
                 payload = {
                     "contents": [{
-                        "parts": [{"text": prompt}]
+                        "role": "user",
+                        "parts": [{"text": prompt.user}]
                     }],
                     "generationConfig": {
-                        "response_mime_type": "text/plain",
+                        "responseMimeType": "application/json",
+                        "responseSchema": INTENT_RESPONSE_SCHEMA,
+                        "maxOutputTokens": settings.INTENT_MAX_OUTPUT_TOKENS,
                         "temperature": 1.0
                     }
                 }
+                fallback_payload = _fallback_payload(payload, prompt.system)
+                if settings.INTENT_THINKING_LEVEL:
+                    payload["generationConfig"]["thinkingConfig"] = {"thinkingLevel": settings.INTENT_THINKING_LEVEL}
                 
-                def _do_request():
-                    return requests.post(url, headers=headers, json=payload, timeout=60)
+                # Prefixo estático: do context cache quando disponível, senão como systemInstruction
+                cached_name = await asyncio.to_thread(context_cache.get, prompt.system, c_key) if context_cache else None
+                if cached_name:
+                    payload["cachedContent"] = cached_name
+                else:
+                    payload["systemInstruction"] = {"parts": [{"text": prompt.system}]}
                 
-                # Executa requests em thread para não travar o loop
-                response = await asyncio.to_thread(_do_request)
+                fallback_model = settings.HEDGE_FALLBACK_CHAT_MODEL or CHAT_MODEL_NAME
+                resp_json = await gemini_chat_breaker.call(
+                    lambda: _intent_hedger.run(
+                        lambda: _generate_content(CHAT_MODEL_NAME, payload, c_key),
+                        hedge_call=lambda: _generate_content(
+                            fallback_model, payload if fallback_model == CHAT_MODEL_NAME else fallback_payload, c_key
+                        ),
+                        # A cópia não espera na fila do rate limit: sem token livre, não há hedge
+                        can_hedge=lambda: chat_limiter.acquire_now(priority=INTERACTIVE),
+                    ),
+                    is_failure=is_dependency_failure,
+                )
                 
-                if response.status_code != 200:
-                    print(f"❌ Erro HTTP Gemini: {response.text}")
-                    raise Exception(f"Erro na API do Google: {response.status_code} - {response.text}")
-                    
-                resp_json = response.json()
+                metrics.inc("intent.calls")
+                _record_usage(resp_json)
                 try:
-                    text_resp = resp_json['candidates'][0]['content']['parts'][0]['text']
-                except Exception as e:
-                    print(f"❌ Erro parse JSON Gemini: {resp_json}")
-                    raise e
-
-                text_resp = text_resp.replace("```json", "").replace("```", "").strip()
-                data = json.loads(text_resp)
-                return data
-                # --------------------------
+                    intent = parse_intent(resp_json)
+                except ValueError as e:
+                    metrics.inc("intent.parse_failures")
+                    print(f"❌ Erro parse JSON Gemini: {e}")
+                    return FALLBACK_INTENT.model_copy()
+                if not history and not summary:
+                    cache.set_cache(_intent_cache_key(message, categories), intent.model_dump(), ttl_seconds=INTENT_CACHE_TTL_SECONDS)
+                return intent
         
-    except asyncio.TimeoutError:
-        print(f"⚠️ [AI] Timeout de {TIMEOUT_SECONDS}s na fila.")
-        return {"server_busy": True}
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        print(f"⚠️ [AI] Timeout na fila/chamada (limite {TIMEOUT_SECONDS}s ou prazo da requisição).")
+        return Intent(server_busy=True)
+    
+    except CircuitOpen as e:
+        return _degraded_intent(message, categories, str(e), Intent(server_busy=True))
         
     except Exception as e:
         print(f"Erro AI: {e}")
-        # Fallback
-        return {
-            "type": "conversation",
-            "term": None,
-            "tag": None,
-            "page": 1,
-            "ai_reply": "Desculpe, não entendi. Pode repetir?",
-            "tag": None,
-            "page": 1,
-            "sort": None,
-            "ai_reply": "Desculpe, não entendi. Pode repetir?",
-            "is_category_list": False
-        }
+        metrics.inc("intent.errors")
+        return _degraded_intent(message, categories, "Erro na chamada ao Gemini", FALLBACK_INTENT)
@@ -1,17 +1,38 @@
 import os
 import json
 import time
+import threading
 from dotenv import load_dotenv
 
+from app.config import settings
+
 load_dotenv()
 
+# Falha rápida se o Redis não responder (não trava o startup nem as requisições)
+REDIS_CONNECT_TIMEOUT = float(os.environ.get("REDIS_CONNECT_TIMEOUT", "2"))
+# Timeout de leitura/escrita: um Redis que para de responder no meio da conexão não trava
+# quem chamou. Precisa ser maior que o BLOCK do XREADGROUP do worker (5s)
+REDIS_SOCKET_TIMEOUT = float(os.environ.get("REDIS_SOCKET_TIMEOUT", "10"))
+
+# Chaves lidas com frequência e invalidadas pelo barramento (app/core/invalidation.py)
+# ganham uma cópia em memória (L1) na frente do Redis. Chaves de sessão ficam de fora:
+# são escritas por qualquer réplica e não publicam invalidação.
+L1_PREFIXES = ("categories_", "search:", "qemb:", "category_index:")
+
 class CacheManager:
     def __init__(self):
         self.use_redis = False
         self.local_cache = {}
         self.redis_client = None
+        # L1: chave -> (valor, expira_em). TTL longo só com o barramento de invalidação conectado
+        self._l1 = {}
+        self._l1_lock = threading.Lock()
+        self.l1_ttl_seconds = settings.CACHE_L1_FALLBACK_TTL_SECONDS
+        self.l1_hits = 0
+        self.l1_misses = 0
         
-        # Tenta conectar ao Redis se as variáveis estiverem presentes
+        # Só monta o cliente (sem I/O): a conexão é aberta e testada em connect(),
+        # chamado no lifespan da API / início do worker, e não no import
         redis_url = os.environ.get("REDIS_URL")
         redis_host = os.environ.get("REDIS_HOST")
         
@@ -19,32 +40,106 @@ class CacheManager:
             try:
                 import redis
                 if redis_url:
-                    self.redis_client = redis.from_url(redis_url)
+                    self.redis_client = redis.from_url(
+                        redis_url,
+                        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                        socket_timeout=REDIS_SOCKET_TIMEOUT,
+                    )
                 else:
                     self.redis_client = redis.Redis(
                         host=redis_host, 
                         port=int(os.environ.get("REDIS_PORT", 6379)),
                         password=os.environ.get("REDIS_PASSWORD"),
-                        decode_responses=True
+                        decode_responses=True,
+                        socket_connect_timeout=REDIS_CONNECT_TIMEOUT,
+                        socket_timeout=REDIS_SOCKET_TIMEOUT
                     )
-                
-                # Teste de conexão
-                self.redis_client.ping()
                 self.use_redis = True
-                print("✅ [CACHE] Conectado ao Redis com sucesso.")
             except Exception as e:
-                print(f"⚠️ [CACHE] Falha ao conectar no Redis ({e}). Usando Memória Local.")
+                print(f"⚠️ [CACHE] Falha ao configurar o Redis ({e}). Usando Memória Local.")
                 self.use_redis = False
         else:
             print("ℹ️ [CACHE] Variáveis do Redis não encontradas. Usando Memória Local.")
 
+    def connect(self) -> bool:
+        """Testa a conexão com o Redis. Sem resposta, passa a usar a memória local."""
+        if self.redis_client is None:
+            return False
+        try:
+            self.redis_client.ping()
+            self.use_redis = True
+            print("✅ [CACHE] Conectado ao Redis com sucesso.")
+        except Exception as e:
+            print(f"⚠️ [CACHE] Falha ao conectar no Redis ({e}). Usando Memória Local.")
+            self.use_redis = False
+        return self.use_redis
+
+    def ping(self) -> bool:
+        """Redis respondendo agora? (usado pelo /ready)"""
+        if self.redis_client is None:
+            return False
+        try:
+            return bool(self.redis_client.ping())
+        except Exception:
+            return False
+
+    def _l1_enabled(self, key: str) -> bool:
+        return settings.CACHE_L1_ENABLED and self.use_redis and key.startswith(L1_PREFIXES)
+
+    def _l1_get(self, key: str):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._l1[key]
+                entry = None
+        if entry is None:
+            self.l1_misses += 1
+            return None
+        self.l1_hits += 1
+        return entry[0]
+
+    def _l1_put(self, key: str, value, ttl_seconds: float):
+        with self._l1_lock:
+            if len(self._l1) >= settings.CACHE_L1_MAX_ENTRIES:
+                # Remove a entrada mais antiga (ordem de inserção)
+                self._l1.pop(next(iter(self._l1)))
+            self._l1[key] = (value, time.monotonic() + min(ttl_seconds, self.l1_ttl_seconds))
+
+    def evict_local(self, keys: list = None, prefixes: tuple = None) -> int:
+        """
+        Remove cópias L1 desta réplica (chamado pelo barramento de invalidação).
+        Sem argumentos, limpa o L1 inteiro. Retorna quantas entradas saíram.
+        """
+        with self._l1_lock:
+            if keys is None and prefixes is None:
+                removed = len(self._l1)
+                self._l1.clear()
+                return removed
+            doomed = [k for k in (keys or []) if k in self._l1]
+            if prefixes:
+                doomed += [k for k in self._l1 if k.startswith(tuple(prefixes))]
+            for k in doomed:
+                self._l1.pop(k, None)
+            return len(doomed)
+
+    def l1_size(self) -> int:
+        return len(self._l1)
+
     def get_cache(self, key: str):
         """Recupera valor do cache."""
         if self.use_redis:
+            l1 = self._l1_enabled(key)
+            if l1:
+                value = self._l1_get(key)
+                if value is not None:
+                    return value
             try:
                 data = self.redis_client.get(key)
                 if data:
-                    return json.loads(data)
+                    value = json.loads(data)
+                    if l1:
+                        self._l1_put(key, value, self.l1_ttl_seconds)
+                    return value
                 return None
             except Exception as e:
                 print(f"❌ [CACHE] Erro ao ler do Redis: {e}")
@@ -67,6 +162,8 @@ class CacheManager:
             try:
                 json_val = json.dumps(value)
                 self.redis_client.setex(key, ttl_seconds, json_val)
+                if self._l1_enabled(key):
+                    self._l1_put(key, value, ttl_seconds)
             except Exception as e:
                 print(f"❌ [CACHE] Erro ao salvar no Redis: {e}")
         else:
@@ -75,5 +172,39 @@ class CacheManager:
                 'expires_at': time.time() + ttl_seconds
             }
 
+    def delete_cache(self, key: str):
+        """Remove uma chave do cache (a cópia L1 das outras réplicas sai pelo barramento)."""
+        if self.use_redis:
+            self.evict_local(keys=[key])
+            try:
+                self.redis_client.delete(key)
+            except Exception as e:
+                print(f"❌ [CACHE] Erro ao remover do Redis: {e}")
+        else:
+            self.local_cache.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        """Incrementa um contador (atômico no Redis) e retorna o novo valor."""
+        if self.use_redis:
+            try:
+                return int(self.redis_client.incr(key))
+            except Exception as e:
+                print(f"❌ [CACHE] Erro ao incrementar no Redis: {e}")
+        entry = self.local_cache.get(key)
+        value = (entry['value'] if entry else 0) + 1
+        self.local_cache[key] = {'value': value, 'expires_at': float('inf')}
+        return value
+
+    def get_counter(self, key: str) -> int:
+        """Lê um contador criado com incr (0 se não existir)."""
+        if self.use_redis:
+            try:
+                value = self.redis_client.get(key)
+                return int(value) if value else 0
+            except Exception as e:
+                print(f"❌ [CACHE] Erro ao ler do Redis: {e}")
+        entry = self.local_cache.get(key)
+        return entry['value'] if entry else 0
+
 # Instância global para ser importada
 cache = CacheManager()
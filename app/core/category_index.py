@@ -0,0 +1,159 @@
+"""
+Shortlist de categorias para o prompt de intenção.
+
+Com centenas de categorias, mandar a lista inteira ao LLM em toda requisição
+aumenta tokens e latência. Aqui as categorias ganham embeddings (calculados
+uma vez por lista de categorias, em background) e o prompt recebe só:
+- as top-k categorias mais próximas do embedding da mensagem;
+- as que batem lexicalmente com a mensagem (substring ou difflib).
+
+Enquanto o índice da lista atual não fica pronto (ou sem o embedding da
+mensagem), vão as lexicais seguidas da lista inteira, limitada a
+CATEGORY_SHORTLIST_FALLBACK_MAX: sem categorias o modelo não consegue conferir
+se a categoria pedida existe. Listas pequenas (até CATEGORY_SHORTLIST_MIN) vão inteiras.
+"""
+import asyncio
+import difflib
+import hashlib
+import time
+import unicodedata
+
+import numpy as np
+
+from app.config import settings
+from app.core.cache import cache
+from app.core.embeddings import generate_embeddings_batch, generate_query_embedding_async
+from app.core.metrics import metrics
+
+# Embeddings das categorias ficam no cache compartilhado (as réplicas calculam uma vez)
+_INDEX_TTL_SECONDS = 7 * 24 * 3600
+_EMBED_BATCH = 100 # máx. do batchEmbedContents
+# Espera antes de tentar gerar o índice de novo após uma falha
+_RETRY_SECONDS = 60
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c)).strip()
+
+
+def categories_digest(categories: list) -> str:
+    return hashlib.sha1("\n".join(sorted(categories)).encode()).hexdigest()[:16]
+
+
+def format_category_list(categories: list) -> str:
+    """Lista completa para respostas is_category_list (montada no servidor, não pelo LLM)."""
+    return ", ".join(sorted(categories, key=_normalize))
+
+
+class CategoryIndex:
+    def __init__(self, top_k: int, min_categories: int, timeout: float, fallback_max: int):
+        self.top_k = top_k
+        self.min_categories = min_categories
+        self.timeout = timeout
+        self.fallback_max = fallback_max
+        self._digest = None
+        self._names = []
+        self._matrix = None # vetores normalizados (n x dim)
+        self._building = None
+        self._failed_at = 0.0
+
+    def lexical_matches(self, message: str, categories: list) -> list:
+        """Categorias citadas na mensagem (substring) ou parecidas com alguma palavra dela."""
+        text = _normalize(message)
+        words = [w for w in text.replace(",", " ").split() if len(w) >= 3]
+        normalized = {_normalize(c): c for c in categories}
+        found = []
+        for norm, name in normalized.items():
+            if norm and (norm in text or any(w in norm.split() for w in words)):
+                found.append(name)
+        for word in words:
+            for norm in difflib.get_close_matches(word, list(normalized), n=3, cutoff=0.8):
+                found.append(normalized[norm])
+        return list(dict.fromkeys(found))
+
+    def _ready_for(self, digest: str) -> bool:
+        return self._digest == digest and self._matrix is not None
+
+    def _load_or_build(self, categories: list, digest: str):
+        """Carrega o índice do cache ou gera os embeddings (thread de background)."""
+        key = f"category_index:{digest}"
+        stored = cache.get_cache(key)
+        if not stored:
+            names = sorted(categories)
+            vectors = []
+            for start in range(0, len(names), _EMBED_BATCH):
+                vectors.extend(generate_embeddings_batch(names[start:start + _EMBED_BATCH]))
+            pairs = [(n, v) for n, v in zip(names, vectors) if v]
+            if not pairs:
+                print("⚠️ [CATEGORIAS] Falha ao gerar embeddings das categorias.")
+                self._failed_at = time.monotonic()
+                return
+            stored = {"names": [n for n, _ in pairs], "vectors": [v for _, v in pairs]}
+            cache.set_cache(key, stored, ttl_seconds=_INDEX_TTL_SECONDS)
+            metrics.inc("category_index.builds")
+            print(f"🏷️ [CATEGORIAS] Embeddings de {len(pairs)} categorias gerados.")
+
+        matrix = np.asarray(stored["vectors"], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        self._names, self._matrix, self._digest = stored["names"], matrix, digest
+
+    def _schedule_build(self, categories: list, digest: str):
+        if self._building is not None and not self._building.done():
+            return
+        if time.monotonic() - self._failed_at < _RETRY_SECONDS:
+            return
+        self._building = asyncio.create_task(asyncio.to_thread(self._load_or_build, list(categories), digest))
+
+    def _nearest(self, vector: list) -> list:
+        query = np.asarray(vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        scores = self._matrix @ query
+        k = min(self.top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self._names[i] for i in top[np.argsort(-scores[top])]]
+
+    def warm(self, categories: list):
+        """Agenda o índice da lista atual (warm-up do startup), se a lista for grande."""
+        if len(categories) > self.min_categories:
+            digest = categories_digest(categories)
+            if not self._ready_for(digest):
+                self._schedule_build(categories, digest)
+
+    async def shortlist(self, message: str, categories: list) -> list:
+        """Categorias que vão para o prompt (lexicais primeiro, depois as mais próximas)."""
+        if len(categories) <= self.min_categories:
+            return categories
+
+        lexical = self.lexical_matches(message, categories)
+        digest = categories_digest(categories)
+        if not self._ready_for(digest):
+            self._schedule_build(categories, digest)
+            metrics.inc("category_index.fallbacks")
+            return self._fallback(lexical, categories)
+
+        vector = None
+        try:
+            vector = await asyncio.wait_for(generate_query_embedding_async(message), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("category_index.timeouts")
+        if not vector:
+            # Circuito aberto, rate limit ou timeout
+            metrics.inc("category_index.fallbacks")
+            return self._fallback(lexical, categories)
+        metrics.inc("category_index.shortlists")
+        return list(dict.fromkeys(lexical + self._nearest(vector)))
+
+    def _fallback(self, lexical: list, categories: list) -> list:
+        """Lexicais primeiro, completadas pela lista (em ordem alfabética) até fallback_max."""
+        limit = max(self.fallback_max, len(lexical))
+        return list(dict.fromkeys(lexical + sorted(categories, key=_normalize)))[:limit]
+
+
+# Instância global
+category_index = CategoryIndex(
+    top_k=settings.CATEGORY_SHORTLIST_TOP_K,
+    min_categories=settings.CATEGORY_SHORTLIST_MIN,
+    timeout=settings.CATEGORY_SHORTLIST_TIMEOUT,
+    fallback_max=settings.CATEGORY_SHORTLIST_FALLBACK_MAX,
+)
@@ -0,0 +1,208 @@
+"""
+Fila de produtos alterados (ids) para o worker de embeddings.
+
+Produtores: o endpoint /internal/products-changed (webhook do banco) e o
+listener opcional de LISTEN/NOTIFY. Consumidor: o worker, em lotes com ids
+deduplicados.
+
+Com Redis a fila é um stream (`XADD` / `XREADGROUP` / `XACK`) com consumer
+group: mensagens não confirmadas são relidas quando o worker reinicia. Como o
+nome do consumidor muda a cada task do Swarm, mensagens paradas há mais de
+CHANGE_QUEUE_CLAIM_IDLE_MS com qualquer consumidor são reavidas (`XAUTOCLAIM`)
+na partida e periodicamente. Sem Redis, cai em uma fila em memória consumida
+dentro do próprio processo da API.
+"""
+import json
+import queue
+import socket
+import time
+
+from app.config import settings
+from app.core.cache import cache
+from app.core.metrics import metrics
+
+CONSUMER_GROUP = "embeddings-worker"
+# Tamanho aproximado máximo do stream (mensagens antigas são descartadas)
+_STREAM_MAXLEN = 100_000
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class ChangeBatch:
+    """Lote de ids deduplicados + ids das mensagens para confirmar (XACK)."""
+
+    def __init__(self, product_ids, message_ids=None):
+        self.product_ids = sorted(product_ids)
+        self.message_ids = message_ids or []
+
+    def __len__(self):
+        return len(self.product_ids)
+
+
+class ChangeQueue:
+    def __init__(self, stream: str, redis_client=None):
+        self.stream = stream
+        self.redis = redis_client
+        # CHANGE_QUEUE_CONSUMER fixa o nome; o hostname muda a cada task, daí o XAUTOCLAIM
+        self.consumer = settings.CHANGE_QUEUE_CONSUMER or socket.gethostname()
+        self.claim_idle_ms = settings.CHANGE_QUEUE_CLAIM_IDLE_MS
+        self._next_claim = 0.0
+        self._local = queue.Queue()
+        self._group_ready = False
+        # Na primeira leitura, relê mensagens entregues a este consumidor e não confirmadas
+        self._pending_checked = False
+
+        metrics.register_gauge("change_queue.local_size", self._local.qsize)
+
+    @property
+    def durable(self) -> bool:
+        return self.redis is not None
+
+    def publish(self, product_ids) -> int:
+        """Enfileira ids de produtos alterados. Retorna quantos foram enfileirados."""
+        ids = sorted({int(pid) for pid in product_ids if pid is not None})
+        if not ids:
+            return 0
+        if self.redis is not None:
+            try:
+                self.redis.xadd(self.stream, {"ids": json.dumps(ids)}, maxlen=_STREAM_MAXLEN, approximate=True)
+                metrics.inc("change_queue.published", len(ids))
+                return len(ids)
+            except Exception as e:
+                print(f"❌ [QUEUE] Erro ao publicar no Redis ({e}). Usando fila local.")
+        for pid in ids:
+            self._local.put(pid)
+        metrics.inc("change_queue.published", len(ids))
+        return len(ids)
+
+    def _ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(self.stream, CONSUMER_GROUP, id="0", mkstream=True)
+        except Exception as e:
+            # BUSYGROUP: grupo já existe
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    def _read_stream(self, batch_size: int, block_ms: int, start_id: str = ">"):
+        self._ensure_group()
+        response = self.redis.xreadgroup(
+            CONSUMER_GROUP, self.consumer, {self.stream: start_id},
+            count=batch_size, block=block_ms if start_id == ">" else None,
+        )
+        messages = response[0][1] if response else []
+        ids, message_ids = set(), []
+        for message_id, fields in messages:
+            message_ids.append(_text(message_id))
+            # Pendente cujo conteúdo já saiu do stream (MAXLEN): só confirma
+            payload = (fields or {}).get(b"ids", (fields or {}).get("ids"))
+            if payload is not None:
+                ids.update(json.loads(_text(payload)))
+        return ids, message_ids
+
+    def _claim_stale(self) -> int:
+        """
+        Transfere para este consumidor as mensagens pendentes paradas há mais de
+        `claim_idle_ms` (de consumidores que sumiram). Depois elas saem na leitura "0".
+        """
+        self._ensure_group()
+        claimed, start_id = 0, "0-0"
+        try:
+            while True:
+                response = self.redis.xautoclaim(
+                    self.stream, CONSUMER_GROUP, self.consumer, self.claim_idle_ms,
+                    start_id=start_id, count=100,
+                )
+                # [próximo start_id, mensagens, ...]; com justid o redis-py descarta o start_id
+                start_id = _text(response[0])
+                claimed += len(response[1])
+                if start_id == "0-0":
+                    break
+        except Exception as e:
+            # Redis < 6.2 não tem XAUTOCLAIM: XPENDING + XCLAIM
+            if "unknown command" not in str(e).lower():
+                raise
+            pending = self.redis.xpending_range(self.stream, CONSUMER_GROUP, min="-", max="+", count=1000)
+            stale = [item["message_id"] for item in pending if item["time_since_delivered"] >= self.claim_idle_ms]
+            if stale:
+                claimed = len(self.redis.xclaim(
+                    self.stream, CONSUMER_GROUP, self.consumer, self.claim_idle_ms, stale, justid=True,
+                ))
+        if claimed:
+            metrics.inc("change_queue.claimed", claimed)
+            print(f"♻️ [QUEUE] {claimed} mensagens pendentes reavidas de outros consumidores.")
+        return claimed
+
+    def _read_local(self, batch_size: int, block_ms: int):
+        ids = set()
+        try:
+            ids.add(self._local.get(timeout=block_ms / 1000) if block_ms else self._local.get_nowait())
+        except queue.Empty:
+            return ids, []
+        while len(ids) < batch_size:
+            try:
+                ids.add(self._local.get_nowait())
+            except queue.Empty:
+                break
+        return ids, []
+
+    def consume(self, batch_size: int = None, block_ms: int = 5000, window_ms: int = None) -> ChangeBatch:
+        """
+        Espera até `block_ms` pela primeira alteração e depois junta o que chegar
+        em `window_ms` (atualizações em massa viram um único lote), até `batch_size` ids.
+        """
+        batch_size = batch_size or settings.CHANGE_BATCH_SIZE
+        window_ms = settings.CHANGE_BATCH_WINDOW_MS if window_ms is None else window_ms
+        read = self._read_stream if self.redis is not None else self._read_local
+
+        if self.redis is not None and time.monotonic() >= self._next_claim:
+            # Na partida e periodicamente: pendentes de consumidores que não voltaram
+            self._next_claim = time.monotonic() + self.claim_idle_ms / 1000
+            if self._claim_stale():
+                self._pending_checked = False
+
+        if self.redis is not None and not self._pending_checked:
+            # Mensagens entregues a este consumidor (ou reavidas) e nunca confirmadas
+            ids, message_ids = self._read_stream(batch_size, None, start_id="0")
+            if message_ids:
+                metrics.inc("change_queue.messages", len(message_ids))
+                return ChangeBatch(ids, message_ids)
+            self._pending_checked = True
+
+        ids, message_ids = read(batch_size, block_ms)
+        if ids or message_ids:
+            deadline = time.monotonic() + window_ms / 1000
+            while len(ids) < batch_size:
+                remaining_ms = int((deadline - time.monotonic()) * 1000)
+                if remaining_ms <= 0:
+                    break
+                more_ids, more_messages = read(batch_size - len(ids), remaining_ms)
+                if not more_ids and not more_messages:
+                    break
+                ids.update(more_ids)
+                message_ids.extend(more_messages)
+
+        if message_ids:
+            metrics.inc("change_queue.messages", len(message_ids))
+        return ChangeBatch(ids, message_ids)
+
+    def retry_pending(self):
+        """Após uma falha, a próxima leitura volta a entregar as mensagens não confirmadas."""
+        self._pending_checked = False
+
+    def ack(self, batch: ChangeBatch):
+        """Confirma o lote (só depois de processado: se o worker cair, ele é relido)."""
+        if self.redis is not None and batch.message_ids:
+            self.redis.xack(self.stream, CONSUMER_GROUP, *batch.message_ids)
+        metrics.inc("change_queue.processed", len(batch))
+
+
+# Instância global (stream no Redis compartilhado; fila local se não houver Redis)
+change_queue = ChangeQueue(
+    settings.CHANGE_QUEUE_STREAM,
+    redis_client=cache.redis_client if cache.use_redis else None,
+)
@@ -0,0 +1,142 @@
+"""
+Circuit breakers por dependência (Gemini chat, Gemini embeddings, Supabase).
+
+Depois de BREAKER_FAILURE_THRESHOLD falhas seguidas o circuito abre: as chamadas
+falham na hora (CircuitOpen) durante BREAKER_RESET_SECONDS, sem martelar uma
+dependência que já está fora. Passado esse tempo, uma única chamada de teste
+(meio-aberto) decide se o circuito fecha ou abre de novo.
+
+Chamadas que falham (ou são canceladas por timeout) depois de pelo menos
+BREAKER_SLOW_CALL_SECONDS contam como falha mesmo quando o prazo do cliente
+acabou primeiro: uma dependência travada precisa abrir o circuito.
+
+Quem chama decide a degradação: sem embeddings a busca segue só com a perna
+exata, sem chat vale a intenção em cache (ou server_busy), sem banco o /query
+responde server_busy na hora.
+
+Estado em /metrics: breaker.<nome>.state (0 fechado, 1 meio-aberto, 2 aberto).
+"""
+import asyncio
+import time
+
+from app.config import settings
+from app.core.deadline import remaining
+from app.core.metrics import metrics
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Circuito aberto: a dependência está sendo poupada."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuito {name} aberto")
+        self.name = name
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float, slow_call_seconds: float = 0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        # 0 = desligado (só conta o que falhar antes do prazo do cliente)
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_started = 0.0
+
+        metrics.register_gauge(f"breaker.{name}.state", lambda: _STATE_GAUGE[self.state])
+        metrics.register_gauge(f"breaker.{name}.failures", lambda: self._failures)
+
+    def is_open(self) -> bool:
+        """Aberto e ainda dentro do tempo de espera (sem efeitos colaterais)."""
+        return self.state == OPEN and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def allow(self) -> bool:
+        """True se a chamada pode sair agora (no meio-aberto, só uma chamada de teste)."""
+        now = time.monotonic()
+        if self.state == OPEN and now - self._opened_at >= self.reset_seconds:
+            self.state = HALF_OPEN
+            self._probe_started = 0.0
+        if self.state == HALF_OPEN:
+            # Chamada de teste travada (ex: cancelada sem registrar): libera outra depois do reset
+            if self._probe_started and now - self._probe_started < self.reset_seconds:
+                return False
+            self._probe_started = now
+            return True
+        return self.state == CLOSED
+
+    def check(self):
+        """Levanta CircuitOpen se a chamada não pode sair."""
+        if not self.allow():
+            metrics.inc(f"breaker.{self.name}.rejected")
+            raise CircuitOpen(self.name)
+
+    def record_success(self):
+        if self.state != CLOSED:
+            print(f"✅ [BREAKER] {self.name} fechado.")
+        self.state = CLOSED
+        self._failures = 0
+
+    def record_failure(self):
+        self._failures += 1
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != OPEN:
+                metrics.inc(f"breaker.{self.name}.opened")
+                print(f"🔌 [BREAKER] {self.name} aberto por {self.reset_seconds:g}s ({self._failures} falhas seguidas).")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+    def _slow(self, started: float) -> bool:
+        return self.slow_call_seconds > 0 and time.monotonic() - started >= self.slow_call_seconds
+
+    async def call(self, fn, is_failure=None):
+        """
+        Executa `fn()` (corrotina) pelo circuito. `is_failure(exc)` decide se a exceção
+        conta como falha da dependência (padrão: toda exceção).
+        """
+        self.check()
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # asyncio.timeout/wait_for cancelam a chamada: travada há muito tempo é falha
+            if self._slow(started):
+                metrics.inc(f"breaker.{self.name}.slow_calls")
+                self.record_failure()
+            elif self.state == HALF_OPEN:
+                # Cancelamento rápido (cliente desistiu) não decide nada: libera a chamada de teste
+                self._probe_started = 0.0
+            raise
+        except Exception as e:
+            if is_failure is not None and not is_failure(e):
+                # Erro do pedido (4xx, query inválida), não da dependência: mesmo lento, não conta
+                self.record_success()
+                raise
+            if self._slow(started):
+                # Falhou depois de esgotar o tempo: conta mesmo se o prazo do cliente acabou antes
+                metrics.inc(f"breaker.{self.name}.slow_calls")
+                self.record_failure()
+                raise
+            left = remaining()
+            if left is not None and left <= 0:
+                # Timeout curto cortado pelo prazo do cliente, não lentidão da dependência
+                raise
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+
+def _breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name, settings.BREAKER_FAILURE_THRESHOLD, settings.BREAKER_RESET_SECONDS, settings.BREAKER_SLOW_CALL_SECONDS,
+    )
+
+
+# Instâncias globais (uma por dependência)
+gemini_chat_breaker = _breaker("gemini_chat")
+gemini_embed_breaker = _breaker("gemini_embed")
+supabase_breaker = _breaker("supabase")
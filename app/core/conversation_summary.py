@@ -0,0 +1,165 @@
+"""
+Resumo contínuo das conversas (tabela memoria_resumo, ver sql/memoria_resumo.sql).
+
+O prompt de intenção leva um resumo curto + as últimas mensagens, em vez de
+um histórico bruto que cresce com a sessão. Depois de cada resposta o
+resumo é atualizado em background (fora do caminho da requisição):
+mensagens mais antigas que a janela recente são incorporadas ao resumo por
+uma chamada curta ao Gemini com prioridade de background.
+
+A última busca ativa (type, term, tag, preços, sort, page) é guardada como
+estado estruturado (last_filters), sem passar pelo LLM.
+"""
+import asyncio
+
+import requests
+
+from app.config import settings
+from app.core import deadline
+from app.core.circuit_breaker import gemini_chat_breaker
+from app.core.embeddings import _get_api_key
+from app.core.gemini_service import CHAT_MODEL_NAME
+from app.core.metrics import metrics
+from app.core.rate_limiter import chat_limiter, BACKGROUND
+from app.db.database import (
+    get_session_summary_async,
+    save_session_summary_async,
+    get_memory_since_async,
+)
+
+# Filtros da busca (search_filters do /query) -> nomes dos campos do Intent
+_FILTER_FIELDS = {
+    "tag": "tag",
+    "min_price": "price_min",
+    "max_price": "price_max",
+    "exact_price": "price_exact",
+    "min_price_exclusive": "price_min_exclusive",
+    "max_price_exclusive": "price_max_exclusive",
+    "order_by": "sort",
+}
+
+_SUMMARY_PROMPT = """Você mantém o resumo de uma conversa de um cliente com um assistente de e-commerce.
+Atualize o resumo com as novas mensagens. Guarde só o que ajuda a entender pedidos futuros:
+produtos e categorias de interesse, preferências (tags, faixa de preço, ordenação), o que já foi mostrado.
+Ignore saudações e listas longas. Responda só com o resumo, em até {max_chars} caracteres.
+
+RESUMO ATUAL:
+{summary}
+
+NOVAS MENSAGENS:
+{messages}"""
+
+
+def last_filters_from(intent_type: str, term: str, page: int, search_filters: dict) -> dict:
+    """Estado estruturado da última busca, com os nomes do Intent (só campos preenchidos)."""
+    data = {"type": intent_type, "term": term}
+    for key, field in _FILTER_FIELDS.items():
+        data[field] = search_filters.get(key)
+    data["page"] = page
+    return {k: v for k, v in data.items() if v not in (None, False)}
+
+
+class ConversationSummarizer:
+    def __init__(self, max_concurrency: int, keep_recent: int, min_new: int, max_chars: int):
+        self.max_concurrency = max_concurrency
+        self.keep_recent = keep_recent # Mensagens que vão brutas no prompt (fora do resumo)
+        self.min_new = min_new # Mínimo de mensagens para valer uma chamada ao LLM
+        self.max_chars = max_chars
+        self._running = set() # Sessões com atualização em andamento
+        self._tasks = set()
+
+        metrics.register_gauge("summary.running", lambda: len(self._running))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def save_filters(self, session_id: str, last_filters: dict):
+        """Grava a última busca ativa em background."""
+        if settings.SUMMARY_ENABLED:
+            self._spawn(save_session_summary_async(session_id, {"last_filters": last_filters}))
+
+    def schedule(self, session_id: str):
+        """Agenda a atualização do resumo (não bloqueia; descarta se já houver uma da sessão ou sem vagas)."""
+        if not settings.SUMMARY_ENABLED:
+            return
+        if session_id in self._running or len(self._running) >= self.max_concurrency:
+            metrics.inc("summary.skipped")
+            return
+        self._running.add(session_id)
+        self._spawn(self._run(session_id))
+
+    async def _run(self, session_id: str):
+        deadline.clear() # Não herda o prazo da requisição que agendou
+        try:
+            if gemini_chat_breaker.is_open():
+                # Gemini fora: o resumo fica para o próximo turno
+                metrics.inc("summary.skipped")
+                return
+            row = await get_session_summary_async(session_id) or {}
+            messages = await get_memory_since_async(session_id, row.get("summarized_at"))
+            # As últimas `keep_recent` mensagens já vão inteiras no prompt
+            fold = messages[:-self.keep_recent] if self.keep_recent else messages
+            if len(fold) < self.min_new:
+                return
+            summary = await asyncio.to_thread(self._summarize, row.get("summary") or "", fold)
+            if summary is None:
+                return
+            await save_session_summary_async(session_id, {
+                "summary": summary,
+                "summarized_at": fold[-1]["created_at"],
+            })
+            metrics.inc("summary.updates")
+        except Exception as e:
+            metrics.inc("summary.errors")
+            print(f"⚠️ [RESUMO] Falha ao atualizar resumo da sessão: {e}")
+        finally:
+            self._running.discard(session_id)
+
+    def _summarize(self, summary: str, messages: list):
+        """Chamada síncrona ao Gemini (roda em thread). Retorna o novo resumo ou None."""
+        api_key = _get_api_key()
+        if not api_key:
+            return None
+        # Prioridade de background: espera o quanto for preciso sem tirar vaga do tráfego interativo
+        chat_limiter.acquire(priority=BACKGROUND)
+
+        lines = []
+        for m in messages:
+            role = "Usuário" if m.get("role") == "user" else "Assistente"
+            lines.append(f"{role}: {' '.join(str(m.get('content', '')).split())[:500]}")
+        prompt = _SUMMARY_PROMPT.format(
+            max_chars=self.max_chars,
+            summary=summary or "(vazio)",
+            messages="\n".join(lines),
+        )
+        url = f"https://generativelanguage.googleapis.com/v1beta/models/{CHAT_MODEL_NAME}:generateContent?key={api_key}"
+        payload = {
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {
+                "maxOutputTokens": settings.INTENT_MAX_OUTPUT_TOKENS,
+                "temperature": 1.0,
+            },
+        }
+        if settings.INTENT_THINKING_LEVEL:
+            payload["generationConfig"]["thinkingConfig"] = {"thinkingLevel": settings.INTENT_THINKING_LEVEL}
+
+        response = requests.post(url, json=payload, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ [RESUMO] Erro HTTP Gemini ({response.status_code}): {response.text[:200]}")
+            return None
+        try:
+            text = response.json()['candidates'][0]['content']['parts'][0]['text']
+        except (KeyError, IndexError, TypeError):
+            return None
+        return " ".join(text.split())[:self.max_chars]
+
+
+# Instância global
+summarizer = ConversationSummarizer(
+    max_concurrency=settings.SUMMARY_MAX_CONCURRENCY,
+    keep_recent=settings.PROMPT_HISTORY_TURNS,
+    min_new=settings.SUMMARY_MIN_NEW_MESSAGES,
+    max_chars=settings.SUMMARY_MAX_CHARS,
+)
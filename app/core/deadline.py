@@ -0,0 +1,58 @@
+"""
+Prazo (deadline) de ponta a ponta por requisição.
+
+O /query define um prazo (REQUEST_DEADLINE_SECONDS, ou o header X-Request-Timeout
+se for menor) guardado em um contextvar. Tasks e threads (asyncio.to_thread)
+criadas durante a requisição herdam o contexto, então cada chamada ao Gemini e
+ao Supabase usa como timeout o menor entre o próprio limite e o tempo que resta.
+
+Tarefas de background disparadas pela requisição (prefetch, resumo) chamam
+clear() ao começar: elas não devem morrer junto com o prazo do cliente.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from app.core.metrics import metrics
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """O prazo da requisição acabou antes da chamada."""
+
+
+@contextmanager
+def request_deadline(seconds: Optional[float]):
+    """Define o prazo (em segundos a partir de agora) enquanto o bloco executa."""
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def clear():
+    """Remove o prazo do contexto atual (início de tarefas de background)."""
+    _deadline.set(None)
+
+
+def remaining() -> Optional[float]:
+    """Segundos até o prazo (pode ser negativo) ou None se não houver prazo."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout_for(limit: Optional[float] = None) -> Optional[float]:
+    """
+    Timeout de uma chamada: o menor entre `limit` e o tempo restante.
+    Levanta DeadlineExceeded se o prazo já acabou (não vale a pena nem tentar).
+    """
+    left = remaining()
+    if left is None:
+        return limit
+    if left <= 0:
+        metrics.inc("deadline.exceeded")
+        raise DeadlineExceeded("Prazo da requisição esgotado")
+    return left if limit is None else min(limit, left)
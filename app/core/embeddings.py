@@ -2,31 +2,33 @@
 import requests
 import os
 import time
+import hashlib
+from app.config import settings
+from app.core.gemini_service import get_api_key, get_http_client, GeminiError, is_dependency_failure
+from app.core.hedging import hedger_from_settings
+from app.core.circuit_breaker import gemini_embed_breaker, CircuitOpen
+from app.core.deadline import timeout_for, DeadlineExceeded
+from app.core.metrics import metrics
+from app.core.cache import cache
+from app.core.rate_limiter import embedding_limiter, INTERACTIVE, BACKGROUND
+from app.core.singleflight import SingleFlight, normalize_key
 
 def _get_api_key():
-    """Lê a chave diretamente do arquivo .env ou ambiente."""
-    c_key = None
-    try:
-         with open(".env", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip().startswith("GEMINI_API_KEY="):
-                    c_key = line.strip().split("=", 1)[1].strip().strip('"').strip("'")
-    except:
-        pass
-    
-    if not c_key:
-        c_key = os.environ.get("GEMINI_API_KEY")
-        
-    if not c_key:
-        return None
-    return c_key
+    """Chave do Gemini (resolvida uma vez por processo, ver gemini_service)."""
+    return get_api_key()
 
-def _call_embedding_api(text: str, task_type: str = "retrieval_document"):
+def _call_embedding_api(text: str, task_type: str = "retrieval_document", priority: str = BACKGROUND):
     api_key = _get_api_key()
     if not api_key:
         print("❌ [EMBEDDING] Sem API Key.")
         return None
 
+    # Queries do usuário têm prioridade e prazo; o worker espera o quanto for preciso
+    timeout = settings.AI_QUEUE_TIMEOUT if priority == INTERACTIVE else None
+    if not embedding_limiter.acquire(priority=priority, timeout=timeout):
+        print("⚠️ [EMBEDDING] Rate limit global atingido. Ignorando embedding.")
+        return None
+
     # URL correta para o modelo de embeddings
     url = f"https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent?key={api_key}"
     
@@ -60,10 +62,133 @@ def generate_embedding(text: str):
     if not text or not isinstance(text, str):
         return None
     text = text.replace("\n", " ").strip()
-    return _call_embedding_api(text, "retrieval_document")
+    return _call_embedding_api(text, "retrieval_document", BACKGROUND)
+
+def generate_embeddings_batch(texts: list, task_type: str = "retrieval_document") -> list:
+    """
+    Gera embeddings de vários textos em uma chamada (batchEmbedContents).
+    Retorna uma lista alinhada com `texts` (None nas posições que falharam).
+    Uso do worker: prioridade de background, cada texto consome um token do rate limit.
+    """
+    if not texts:
+        return []
+    api_key = _get_api_key()
+    if not api_key:
+        print("❌ [EMBEDDING] Sem API Key.")
+        return [None] * len(texts)
+
+    for _ in texts:
+        embedding_limiter.acquire(priority=BACKGROUND)
+
+    url = f"https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:batchEmbedContents?key={api_key}"
+    payload = {
+        "requests": [
+            {
+                "model": "models/text-embedding-004",
+                "content": {"parts": [{"text": (text or "").replace("\n", " ").strip()}]},
+                "taskType": task_type
+            }
+            for text in texts
+        ]
+    }
+
+    try:
+        response = requests.post(url, headers={"Content-Type": "application/json"}, json=payload, timeout=60)
+        if response.status_code != 200:
+            print(f"❌ Erro Embedding em lote HTTP ({response.status_code}): {response.text}")
+            return [None] * len(texts)
+        embeddings = response.json().get("embeddings") or []
+        vectors = [item.get("values") for item in embeddings]
+        return vectors + [None] * (len(texts) - len(vectors))
+    except Exception as e:
+        print(f"❌ Erro Conexão Embedding em lote: {e}")
+        return [None] * len(texts)
 
 def generate_query_embedding(text: str):
     """
     Gera embedding específico para queries de busca.
     """
-    return _call_embedding_api(text, "retrieval_query")
+    return _call_embedding_api(text, "retrieval_query", INTERACTIVE)
+
+_query_flight = SingleFlight("query_embedding")
+
+# Embeddings de query ficam em cache: páginas seguintes e o prefetch reusam o vetor
+QUERY_EMBEDDING_TTL_SECONDS = 600
+
+def _query_embedding_key(text: str) -> str:
+    return "qemb:" + hashlib.sha1(normalize_key(text).encode()).hexdigest()
+
+def get_cached_query_embedding(text: str):
+    """Embedding de query já calculado (ou None), sem chamar a API."""
+    if not text:
+        return None
+    return cache.get_cache(_query_embedding_key(text))
+
+# Hedge só com o mesmo modelo: o vetor precisa ser comparável aos embeddings salvos
+_query_hedger = hedger_from_settings("query_embedding")
+
+async def _embed_query_request(text: str, api_key: str) -> list:
+    """POST embedContent (cancelável). Levanta exceção em erro HTTP."""
+    response = await get_http_client().post(
+        "/models/text-embedding-004:embedContent",
+        params={"key": api_key},
+        json={
+            "model": "models/text-embedding-004",
+            "content": {"parts": [{"text": text}]},
+            "taskType": "retrieval_query",
+        },
+        timeout=timeout_for(30),
+    )
+    if response.status_code != 200:
+        raise GeminiError(response.status_code, response.text)
+    return response.json()['embedding']['values']
+
+async def _call_query_embedding_async(text: str):
+    """
+    Versão assíncrona de generate_query_embedding, com hedge (opt-in).
+    Circuito aberto ou prazo esgotado: retorna None na hora e a busca segue sem a perna vetorial.
+    """
+    api_key = _get_api_key()
+    if not api_key:
+        print("❌ [EMBEDDING] Sem API Key.")
+        return None
+    if gemini_embed_breaker.is_open():
+        metrics.inc("degraded.vector_leg_skipped")
+        return None
+    try:
+        if not await embedding_limiter.acquire_async(priority=INTERACTIVE, timeout=timeout_for(settings.AI_QUEUE_TIMEOUT)):
+            print("⚠️ [EMBEDDING] Rate limit global atingido. Ignorando embedding.")
+            return None
+        return await gemini_embed_breaker.call(
+            lambda: _query_hedger.run(
+                lambda: _embed_query_request(text, api_key),
+                # A cópia não espera na fila do rate limit: sem token livre, não há hedge
+                can_hedge=lambda: embedding_limiter.acquire_now(priority=INTERACTIVE),
+            ),
+            is_failure=is_dependency_failure,
+        )
+    except (CircuitOpen, DeadlineExceeded) as e:
+        metrics.inc("degraded.vector_leg_skipped")
+        print(f"⚠️ [EMBEDDING] {e}: busca sem a perna vetorial.")
+        return None
+    except Exception as e:
+        print(f"❌ Erro Conexão Embedding: {e}")
+        return None
+
+async def _generate_and_cache(text: str):
+    vector = await _call_query_embedding_async(text)
+    if vector:
+        cache.set_cache(_query_embedding_key(text), vector, ttl_seconds=QUERY_EMBEDDING_TTL_SECONDS)
+    return vector
+
+async def generate_query_embedding_async(text: str):
+    """
+    Versão assíncrona de generate_query_embedding.
+    Mensagens iguais em andamento (após normalização) compartilham a mesma chamada.
+    """
+    if not text:
+        return None
+    cached = get_cached_query_embedding(text)
+    if cached:
+        return cached
+    return await _query_flight.do(normalize_key(text), lambda: _generate_and_cache(text))
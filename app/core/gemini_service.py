@@ -1,10 +1,10 @@
-
 import os
-import google.generativeai as genai
-from dotenv import load_dotenv
+from functools import lru_cache
+
+import httpx
 
-# Force load configuration
-load_dotenv(override=True)
+# O SDK do Google (google.generativeai) é pesado (~0,6s de import) e não é usado
+# nas rotas: as chamadas são REST. Ele só é importado se get_chat_model() for chamado.
 
 def get_key_from_file():
     """Manual fallback to read key directly from file to avoid env var caching issues."""
@@ -19,29 +19,70 @@ def get_key_from_file():
         return None
     return None
 
-# Try env first, then file fallback
-API_KEY = os.environ.get("GEMINI_API_KEY")
-if not API_KEY or "YOUR_KEY" in API_KEY:
-    # Fallback manual
-    manual_key = get_key_from_file()
-    if manual_key:
-        print(f"⚠️ [GEMINI SERVICE] Usando chave lida manualmente do .env (Environment falhou/inválido)")
-        API_KEY = manual_key
-
-if not API_KEY:
-    print("❌ [GEMINI SERVICE] API Key not found in environment!")
-else:
-    print(f"🔑 [GEMINI SERVICE] Key Loaded: {API_KEY[:5]}...{API_KEY[-5:]}")
+@lru_cache(maxsize=1)
+def get_api_key():
+    """
+    Chave do Gemini, resolvida uma única vez por processo:
+    ambiente primeiro, depois leitura manual do .env (fallback).
+    """
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key or "YOUR_KEY" in api_key:
+        # Fallback manual
+        manual_key = get_key_from_file()
+        if manual_key:
+            print(f"⚠️ [GEMINI SERVICE] Usando chave lida manualmente do .env (Environment falhou/inválido)")
+            api_key = manual_key
 
-# Configure globally once
-genai.configure(api_key=API_KEY)
+    if not api_key:
+        print("❌ [GEMINI SERVICE] API Key not found in environment!")
+        return None
+    print(f"🔑 [GEMINI SERVICE] Key Loaded: {api_key[:5]}...{api_key[-5:]}")
+    return api_key
 
 # Constants
 CHAT_MODEL_NAME = "gemini-3-flash-preview"  # As requested by user
 EMBEDDING_MODEL_NAME = "models/text-embedding-004"
 
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+class GeminiError(Exception):
+    """Resposta de erro da API do Gemini (status HTTP != 200)."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Erro na API do Google: {status_code} - {body}")
+        self.status_code = status_code
+
+def is_dependency_failure(e: Exception) -> bool:
+    """Erros 4xx (exceto 429) são da requisição, não do Gemini: não abrem o circuito."""
+    return not (isinstance(e, GeminiError) and 400 <= e.status_code < 500 and e.status_code != 429)
+
+_http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP assíncrono (pool de conexões) das chamadas da API ao Gemini.
+    Assíncrono para que uma chamada perdedora (hedge) possa ser cancelada de fato.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            base_url=GEMINI_API_BASE,
+            timeout=60,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _http_client
+
+async def close_http_client():
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 def get_chat_model():
-    """Returns the configured GenerativeModel for chat."""
+    """Returns the configured GenerativeModel for chat (SDK importado sob demanda)."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=get_api_key())
     generation_config = {
         "temperature": 1,
         "top_p": 0.95,
@@ -0,0 +1,130 @@
+"""
+Hedged requests: corta a cauda de latência das chamadas ao Gemini.
+
+A chamada principal sai normalmente. Se não responder dentro do percentil
+HEDGE_PERCENTILE das latências recentes, uma cópia é disparada (opcionalmente
+para um modelo de fallback); a primeira resposta bem-sucedida vence e a outra
+é cancelada. Uma falha não vence: espera-se a outra chamada.
+
+Orçamento: no máximo HEDGE_BUDGET_RATIO de chamadas extras (ex: 5%) e só se
+houver token livre no rate limit global naquele instante (a cópia nunca espera).
+Sem amostras suficientes (HEDGE_MIN_SAMPLES) não há hedge.
+"""
+import asyncio
+import inspect
+import time
+from collections import deque
+
+from app.config import settings
+from app.core.metrics import metrics, ratio
+
+
+class LatencyTracker:
+    """Janela das latências mais recentes (segundos)."""
+
+    def __init__(self, window: int):
+        self._samples = deque(maxlen=window)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        ordered = sorted(self._samples)
+        index = min(int(len(ordered) * p / 100), len(ordered) - 1)
+        return ordered[index]
+
+
+class Hedger:
+    def __init__(self, name: str, enabled: bool, percentile: float, min_delay: float, max_delay: float,
+                 budget_ratio: float, min_samples: int, window: int = 200):
+        self.name = name
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker(window)
+        self._calls = 0
+        self._sent = 0
+
+        metrics.register_gauge(f"hedge.{name}.delay_ms", lambda: round((self.delay() or 0) * 1000, 1))
+        metrics.register_gauge(
+            f"hedge.{name}.extra_ratio",
+            lambda: ratio(metrics.get(f"hedge.{name}.sent"), metrics.get(f"hedge.{name}.calls")),
+        )
+
+    def delay(self):
+        """Espera antes da cópia (percentil das latências recentes) ou None se ainda sem amostras."""
+        if len(self.latencies) < max(self.min_samples, 1):
+            return None
+        return min(max(self.latencies.percentile(self.percentile), self.min_delay), self.max_delay)
+
+    def _within_budget(self) -> bool:
+        return self._sent + 1 <= self.budget_ratio * self._calls
+
+    async def run(self, call, hedge_call=None, can_hedge=None):
+        """
+        Executa `call()` (corrotina) com hedge. `hedge_call()` gera a cópia (padrão: `call`);
+        `can_hedge()` (função ou corrotina) é checado na hora do disparo (ex: token livre no rate limit).
+        Retorna o primeiro resultado bem-sucedido; se as duas falharem, levanta o erro da principal.
+        """
+        self._calls += 1
+        metrics.inc(f"hedge.{self.name}.calls")
+        started = time.monotonic()
+        delay = self.delay() if self.enabled else None
+
+        primary = asyncio.ensure_future(call())
+        if delay is None:
+            result = await primary
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        allowed = not done and self._within_budget()
+        if allowed and can_hedge is not None:
+            allowed = can_hedge()
+            if inspect.isawaitable(allowed):
+                allowed = await allowed
+        if not allowed:
+            if not done:
+                metrics.inc(f"hedge.{self.name}.skipped")
+            result = await primary
+            self.latencies.record(time.monotonic() - started)
+            return result
+
+        self._sent += 1
+        metrics.inc(f"hedge.{self.name}.sent")
+        hedge = asyncio.ensure_future((hedge_call or call)())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            metrics.inc(f"hedge.{self.name}.won")
+                        # Latência vista pelo usuário (a da principal fica censurada quando a cópia vence)
+                        self.latencies.record(time.monotonic() - started)
+                        return task.result()
+            # As duas falharam
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+
+def hedger_from_settings(name: str) -> Hedger:
+    return Hedger(
+        name,
+        enabled=settings.HEDGE_ENABLED,
+        percentile=settings.HEDGE_PERCENTILE,
+        min_delay=settings.HEDGE_MIN_DELAY_MS / 1000,
+        max_delay=settings.HEDGE_MAX_DELAY_MS / 1000,
+        budget_ratio=settings.HEDGE_BUDGET_RATIO,
+        min_samples=settings.HEDGE_MIN_SAMPLES,
+    )
@@ -0,0 +1,55 @@
+"""
+Uma página da busca híbrida (exata + vetorial) a partir de um cursor.
+Usado pelo /query e pelo prefetch da próxima página.
+"""
+from app.core.embeddings import generate_query_embedding_async, get_cached_query_embedding
+from app.core.pagination import PageCursor, merge_page
+from app.db.filters import order_for, build_product_filters
+from app.db.query_context import fetch_search_context
+
+
+async def fetch_hybrid_page(search_filters: dict, cursor: PageCursor, limit: int, offset: int = 0, cached_embedding_only: bool = False):
+    """
+    Retorna (MergedPage, QueryContext).
+    - search_filters: filtros com os nomes de search_products (inclui order_by)
+    - offset: só para a primeira consulta sem cursor salvo (paginação antiga)
+    - cached_embedding_only: não chama o Gemini; se o embedding não estiver em
+      cache retorna (None, None). Usado pelo prefetch para não gastar cota.
+    """
+    # Truque: buscar limit + 1 para saber se tem proxima pagina
+    fetch_limit = limit + 1
+
+    # Busca vetorial junto (se não for busca muito específica).
+    # Usa o texto da primeira página: "ver mais" não descreve produto nenhum.
+    vector = None
+    if not search_filters.get("exact_price") and cursor.query and not cursor.vector_done:
+        if cached_embedding_only:
+            vector = get_cached_query_embedding(cursor.query)
+            if vector is None:
+                return None, None
+        else:
+            vector = await generate_query_embedding_async(cursor.query)
+
+    search_ctx = await fetch_search_context(
+        search_filters,
+        limit=fetch_limit,
+        offset=offset,
+        embedding=vector,
+        match_count=fetch_limit,
+        after=cursor.exact_after,
+        vector_after=cursor.vector_after,
+        vector_depth=cursor.vector_depth,
+        include_exact=not cursor.exact_done
+    )
+
+    # Combinar resultados (exata primeiro, sem repetidos) e avançar o cursor
+    merged = merge_page(
+        search_ctx.exact,
+        search_ctx.vector,
+        limit,
+        fetch_limit,
+        order_for(search_filters.get("order_by")),
+        cursor,
+        exact_filters=build_product_filters(**{k: v for k, v in search_filters.items() if k != "order_by"})
+    )
+    return merged, search_ctx
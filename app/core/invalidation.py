@@ -0,0 +1,143 @@
+"""
+Barramento de invalidação de cache entre réplicas (Redis pub/sub).
+
+Cada réplica guarda cópias L1 em memória de chaves quentes (ver L1_PREFIXES em
+app/core/cache.py). Quem altera dados (worker, /internal/products-changed,
+trigger do catálogo) publica um evento com namespace:
+
+    {"ns": "catalog", "version": 42, "origin": "..."}  # versão do catálogo mudou
+    {"ns": "keys", "keys": ["categories_list"], ...}    # chaves específicas
+
+Uma thread de background em cada réplica assina o canal e remove na hora as
+entradas L1 afetadas. Se a assinatura cair, o L1 volta ao TTL curto
+(CACHE_L1_FALLBACK_TTL_SECONDS) até reconectar; ao reconectar o L1 é limpo,
+porque eventos publicados no intervalo foram perdidos.
+"""
+import json
+import threading
+import time
+import uuid
+
+from app.config import settings
+from app.core.cache import cache
+from app.core.metrics import metrics
+
+# Namespace -> prefixos de chave removidos do L1
+NAMESPACE_PREFIXES = {
+    "catalog": ("categories_", "search:"),
+}
+
+_RECONNECT_SECONDS = 5
+# PING na conexão de assinatura: detecta conexão morta mesmo sem eventos
+_PING_SECONDS = 15
+
+
+class InvalidationBus:
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.origin = uuid.uuid4().hex[:12] # Eventos da própria réplica já foram aplicados
+        self.connected = False
+        self._handlers = {} # namespace -> [fn(evento)]
+        self._thread = None
+        self._stop = threading.Event()
+
+        metrics.register_gauge("invalidation.connected", lambda: int(self.connected))
+        metrics.register_gauge("cache.l1.size", cache.l1_size)
+        metrics.register_gauge("cache.l1.hits", lambda: cache.l1_hits)
+        metrics.register_gauge("cache.l1.misses", lambda: cache.l1_misses)
+
+    def on(self, namespace: str, handler):
+        """Registra um callback extra para eventos do namespace (roda na thread do barramento)."""
+        self._handlers.setdefault(namespace, []).append(handler)
+
+    def publish(self, namespace: str, keys: list = None, version: int = None):
+        """Aplica o evento localmente e avisa as outras réplicas (sem Redis, só local)."""
+        event = {"ns": namespace, "origin": self.origin}
+        if keys:
+            event["keys"] = list(keys)
+        if version is not None:
+            event["version"] = version
+        self._apply(event)
+        if not cache.use_redis:
+            return
+        try:
+            cache.redis_client.publish(self.channel, json.dumps(event))
+            metrics.inc("invalidation.published")
+        except Exception as e:
+            metrics.inc("invalidation.publish_errors")
+            print(f"⚠️ [INVALIDATION] Falha ao publicar evento {namespace}: {e}")
+
+    def _apply(self, event: dict):
+        namespace = event.get("ns")
+        removed = cache.evict_local(keys=event.get("keys") or [], prefixes=NAMESPACE_PREFIXES.get(namespace, ()))
+        metrics.inc("invalidation.evicted", removed)
+        for handler in self._handlers.get(namespace, []):
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"⚠️ [INVALIDATION] Erro no handler de {namespace}: {e}")
+
+    def _set_connected(self, connected: bool):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected:
+            # Eventos perdidos enquanto desconectado: começa do zero
+            cache.evict_local()
+            cache.l1_ttl_seconds = settings.CACHE_L1_TTL_SECONDS
+            print(f"📡 [INVALIDATION] Assinando '{self.channel}' (L1 com TTL de {settings.CACHE_L1_TTL_SECONDS:g}s).")
+        else:
+            cache.l1_ttl_seconds = settings.CACHE_L1_FALLBACK_TTL_SECONDS
+            cache.evict_local()
+            metrics.inc("invalidation.disconnects")
+            print(f"⚠️ [INVALIDATION] Assinatura perdida: L1 só com TTL de {settings.CACHE_L1_FALLBACK_TTL_SECONDS:g}s.")
+
+    def _listen(self):
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = cache.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                self._set_connected(True)
+                last_ping = time.monotonic()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "message":
+                        event = json.loads(message["data"])
+                        if event.get("origin") != self.origin:
+                            metrics.inc("invalidation.received")
+                            self._apply(event)
+                    if time.monotonic() - last_ping > _PING_SECONDS:
+                        pubsub.ping()
+                        last_ping = time.monotonic()
+            except Exception as e:
+                self._set_connected(False)
+                print(f"⚠️ [INVALIDATION] {e}. Tentando de novo em {_RECONNECT_SECONDS}s.")
+                self._stop.wait(_RECONNECT_SECONDS)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+        self.connected = False
+        cache.l1_ttl_seconds = settings.CACHE_L1_FALLBACK_TTL_SECONDS
+
+    def start(self):
+        """Inicia a assinatura em background (só com Redis e L1 habilitados)."""
+        if not (cache.use_redis and settings.CACHE_L1_ENABLED):
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=_RECONNECT_SECONDS)
+
+
+# Instância global
+invalidation_bus = InvalidationBus(settings.CACHE_INVALIDATION_CHANNEL)
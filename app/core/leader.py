@@ -0,0 +1,197 @@
+"""
+Eleição de líder por lease no Redis (SET NX PX + renovação).
+
+Só quem detém o lease executa a varredura do worker de embeddings; cópias
+extras (scale up, deploy com start-first) ficam de reserva e assumem quando
+o lease expira. Com WORKER_SHARDS > 1 cada cópia pega uma partição livre
+(faixa do hash do id do produto) e a vazão escala sem chamadas duplicadas.
+Partições sem dono (réplica que caiu ou menos réplicas que partições) são
+adotadas temporariamente por quem terminou a própria: pega, varre e libera.
+
+Sem Redis não há coordenação: o processo se considera dono de tudo.
+"""
+import threading
+import time
+import uuid
+import zlib
+
+from app.core.metrics import metrics
+
+# Renova/libera só se o lease ainda for nosso (compara o token)
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaseLost(Exception):
+    """O lease expirou ou foi tomado por outro processo durante o trabalho."""
+
+
+def shard_of(product_id, shards: int) -> int:
+    """Partição do produto: faixa do hash (crc32) do id, estável entre processos."""
+    if shards <= 1:
+        return 0
+    return (zlib.crc32(str(product_id).encode()) * shards) >> 32
+
+
+class LeaseLock:
+    def __init__(self, name: str, ttl_seconds: float, redis_client=None):
+        self.key = f"lease:{name}"
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.redis = redis_client
+        self.token = uuid.uuid4().hex
+        self.held = False
+        if redis_client is not None:
+            self._renew = redis_client.register_script(_RENEW_SCRIPT)
+            self._release = redis_client.register_script(_RELEASE_SCRIPT)
+
+    def try_acquire(self) -> bool:
+        if self.redis is None:
+            self.held = True
+            return True
+        try:
+            self.held = bool(self.redis.set(self.key, self.token, nx=True, px=self.ttl_ms))
+        except Exception as e:
+            # Sem Redis não dá para garantir exclusividade: fica de reserva
+            print(f"⚠️ [LEADER] Erro ao pegar lease {self.key}: {e}")
+            self.held = False
+        return self.held
+
+    def acquire(self, timeout: float) -> bool:
+        """Tenta até `timeout` segundos."""
+        deadline = time.monotonic() + timeout
+        while not self.try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.5)
+        return True
+
+    def renew(self) -> bool:
+        if self.redis is None:
+            return self.held
+        try:
+            self.held = bool(self._renew(keys=[self.key], args=[self.token, self.ttl_ms]))
+        except Exception as e:
+            # Sem conseguir renovar não dá para garantir exclusividade
+            print(f"⚠️ [LEADER] Erro ao renovar lease {self.key}: {e}")
+            self.held = False
+        return self.held
+
+    def release(self):
+        if self.redis is not None and self.held:
+            try:
+                self._release(keys=[self.key], args=[self.token])
+            except Exception as e:
+                print(f"⚠️ [LEADER] Erro ao liberar lease {self.key}: {e}")
+        self.held = False
+
+
+class LeaderElector:
+    """
+    Mantém uma partição própria (lease) por processo e a renova em uma thread
+    a cada ttl/3. `ensure()` tenta pegar uma partição livre; `adopt()` pega
+    emprestada uma partição órfã, devolvida com `release_shard()`.
+    """
+
+    def __init__(self, name: str, shards: int, ttl_seconds: float, redis_client=None):
+        if redis_client is None and shards > 1:
+            print("⚠️ [LEADER] WORKER_SHARDS > 1 exige Redis. Processando o catálogo inteiro.")
+            shards = 1
+        self.shards = shards
+        self.ttl_seconds = ttl_seconds
+        self.redis_client = redis_client
+        self._locks = [LeaseLock(f"{name}:{i}/{shards}", ttl_seconds, redis_client) for i in range(shards)]
+        self._lock = None
+        self.shard = None
+        # Partições órfãs adotadas durante uma varredura (índice -> lease)
+        self._adopted = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+        metrics.register_gauge("leader.shard", lambda: -1 if self.shard is None else self.shard)
+
+    @property
+    def held(self) -> bool:
+        return self._lock is not None and self._lock.held
+
+    def ensure(self):
+        """Partição que este processo detém (tenta pegar uma se não tiver) ou None."""
+        if self.held:
+            return self.shard
+        self._lock, self.shard = None, None
+        for index, lock in enumerate(self._locks):
+            if lock.try_acquire():
+                self._lock, self.shard = lock, index
+                metrics.inc("leader.acquired")
+                label = "líder" if self.shards == 1 else f"dono da partição {index + 1}/{self.shards}"
+                print(f"👑 [LEADER] Este worker agora é {label}.")
+                self._start_renewal()
+                return index
+        return None
+
+    def adopt(self, exclude=()):
+        """
+        Pega uma partição sem dono (além da própria e das em `exclude`) para varrê-la
+        uma vez. Retorna o índice ou None. Só quem já tem a própria partição adota.
+        """
+        if self.shards <= 1 or not self.held:
+            return None
+        for index, lock in enumerate(self._locks):
+            if index == self.shard or index in self._adopted or index in exclude:
+                continue
+            if lock.try_acquire():
+                self._adopted[index] = lock
+                metrics.inc("leader.adopted")
+                print(f"🧩 [LEADER] Partição órfã {index + 1}/{self.shards} adotada para uma varredura.")
+                return index
+        return None
+
+    def release_shard(self, index: int):
+        """Devolve uma partição adotada."""
+        lock = self._adopted.pop(index, None)
+        if lock is not None:
+            lock.release()
+
+    def check(self, shard: int = None):
+        """Levanta LeaseLost se o lease foi perdido (chamado entre páginas do trabalho)."""
+        lock = self._lock if shard is None or shard == self.shard else self._adopted.get(shard)
+        if lock is None or not lock.held:
+            raise LeaseLost(f"Lease da partição {self.shard if shard is None else shard} perdido.")
+
+    def _start_renewal(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._renew_loop, name="lease-renewal", daemon=True)
+        self._thread.start()
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl_seconds / 3):
+            for lock in list(self._adopted.values()):
+                if not lock.renew():
+                    metrics.inc("leader.lost")
+                    print(f"⚠️ [LEADER] Lease perdido ({lock.key}). Varredura da partição adotada interrompida.")
+            lock = self._lock
+            if lock is None:
+                return
+            if not lock.renew():
+                metrics.inc("leader.lost")
+                print(f"⚠️ [LEADER] Lease perdido ({lock.key}). Voltando para reserva.")
+                return
+
+    def release(self):
+        self._stop.set()
+        for index in list(self._adopted):
+            self.release_shard(index)
+        if self._lock is not None:
+            self._lock.release()
+        self._lock, self.shard = None, None
@@ -0,0 +1,56 @@
+"""
+Métricas em memória do processo (contadores e gauges).
+Expostas em JSON pelo endpoint /metrics.
+"""
+import threading
+from collections import defaultdict
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._gauge_fns = {}
+
+    def inc(self, name: str, value: float = 1):
+        """Incrementa um contador."""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value):
+        """Define o valor atual de um gauge."""
+        with self._lock:
+            self._gauges[name] = value
+
+    def register_gauge(self, name: str, fn):
+        """Registra um gauge calculado no momento da leitura (ex: razões, tamanhos de fila)."""
+        with self._lock:
+            self._gauge_fns[name] = fn
+
+    def get(self, name: str) -> float:
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self) -> dict:
+        """Retorna todos os valores atuais."""
+        with self._lock:
+            data = dict(self._counters)
+            data.update(self._gauges)
+            fns = list(self._gauge_fns.items())
+
+        for name, fn in fns:
+            try:
+                data[name] = fn()
+            except Exception as e:
+                data[name] = f"error: {e}"
+        return dict(sorted(data.items()))
+
+
+def ratio(numerator: float, denominator: float) -> float:
+    """Razão segura (0 quando não há amostras)."""
+    return round(numerator / denominator, 4) if denominator else 0.0
+
+
+# Instância global
+metrics = Metrics()
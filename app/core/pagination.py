@@ -0,0 +1,197 @@
+"""
+Paginação por cursor (keyset) da busca híbrida.
+
+O cursor guarda, para cada perna da busca, a posição da última linha
+consumida: (valor de ordenação, id) na busca exata e (similaridade, id) na
+vetorial. A próxima página continua exatamente dali, com custo constante
+independente da profundidade e sem "pular" itens se o catálogo mudar.
+
+O cursor volta para o cliente de forma opaca (`next_cursor`) e também fica
+guardado por sessão, para que um "ver mais" no turno seguinte continue de
+onde parou. O token é assinado (HMAC) e validado campo a campo: as posições
+entram nos filtros do PostgREST e nos parâmetros do asyncpg.
+"""
+import base64
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass, asdict, field
+from typing import List, Optional
+
+from app.config import settings
+from app.core.cache import cache
+from app.db.filters import sort_key, row_matches
+
+SESSION_CURSOR_TTL_SECONDS = 30 * 60
+
+
+@dataclass
+class PageCursor:
+    sig: str                            # digest dos filtros da busca
+    page: int = 1                       # número da página que este cursor abre
+    query: Optional[str] = None         # texto usado no embedding (mantém a perna vetorial estável)
+    exact_after: Optional[list] = None  # [valor de ordenação, id]
+    exact_done: bool = False
+    vector_after: Optional[list] = None # [similaridade, id]
+    vector_done: bool = False
+    vector_depth: int = 0               # linhas vetoriais já consumidas (fallback sem RPC paginada)
+
+
+# Chave da assinatura: CURSOR_SECRET ou, sem ela, derivada da chave do Supabase (igual em todas as réplicas)
+_SIGNING_KEY = (settings.CURSOR_SECRET or settings.SUPABASE_KEY or "").encode()
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(_SIGNING_KEY, payload.encode(), hashlib.sha256).digest()[:16])
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _valid_position(position) -> bool:
+    """[valor, id]: valor numérico ou None (bloco dos nulos), id inteiro."""
+    if position is None:
+        return True
+    if not isinstance(position, list) or len(position) != 2:
+        return False
+    value, last_id = position
+    return (value is None or _is_number(value)) and isinstance(last_id, int) and not isinstance(last_id, bool)
+
+
+def cursor_from_dict(data) -> Optional[PageCursor]:
+    """Monta o PageCursor validando os tipos de cada campo. Retorna None se algo não bater."""
+    if not isinstance(data, dict) or set(data) - set(PageCursor.__dataclass_fields__):
+        return None
+    try:
+        cursor = PageCursor(**data)
+    except TypeError:
+        return None
+    valid = (
+        isinstance(cursor.sig, str)
+        and isinstance(cursor.page, int) and not isinstance(cursor.page, bool) and cursor.page >= 1
+        and (cursor.query is None or isinstance(cursor.query, str))
+        and isinstance(cursor.exact_done, bool)
+        and isinstance(cursor.vector_done, bool)
+        and isinstance(cursor.vector_depth, int) and not isinstance(cursor.vector_depth, bool)
+        and cursor.vector_depth >= 0
+        and _valid_position(cursor.exact_after)
+        and _valid_position(cursor.vector_after)
+    )
+    return cursor if valid else None
+
+
+def encode_cursor(cursor: PageCursor) -> str:
+    raw = json.dumps(asdict(cursor), separators=(",", ":"), ensure_ascii=False).encode()
+    payload = _b64encode(raw)
+    return f"{payload}.{_sign(payload)}"
+
+
+def decode_cursor(token: str) -> Optional[PageCursor]:
+    """Decodifica e valida o cursor opaco. Retorna None se for inválido ou a assinatura não bater."""
+    if not token:
+        return None
+    payload, _, signature = token.partition(".")
+    # Bytes: compare_digest recusa str com caracteres não ASCII (cursor vem do cliente)
+    if not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        data = json.loads(_b64decode(payload))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return cursor_from_dict(data)
+
+
+def _session_key(session_id: str) -> str:
+    return f"pagination:{session_id}"
+
+
+def save_session_cursor(session_id: str, cursor: Optional[PageCursor]):
+    if cursor is None:
+        return
+    cache.set_cache(_session_key(session_id), asdict(cursor), ttl_seconds=SESSION_CURSOR_TTL_SECONDS)
+
+
+def clear_session_cursor(session_id: str):
+    """Turno sem busca: um "ver mais" depois disso não deve continuar a busca antiga."""
+    cache.delete_cache(_session_key(session_id))
+
+
+def load_session_cursor(session_id: str) -> Optional[PageCursor]:
+    data = cache.get_cache(_session_key(session_id))
+    if not data:
+        return None
+    return cursor_from_dict(data)
+
+
+@dataclass
+class MergedPage:
+    rows: List[dict] = field(default_factory=list)
+    has_more: bool = False
+    next_cursor: Optional[PageCursor] = None
+
+
+def merge_page(exact_rows: list, vector_rows: Optional[list], limit: int, fetch_limit: int, order: list, cursor: PageCursor, exact_filters: list = None) -> MergedPage:
+    """
+    Monta a página: resultados exatos primeiro, completados pelos vetoriais,
+    sem repetir IDs. Cada perna foi buscada com `fetch_limit` (limit + 1) linhas
+    a partir da sua posição no cursor; só o que entrou (ou foi descartado como
+    repetido) conta como consumido.
+
+    Com `exact_filters`, linhas vetoriais que satisfazem a busca exata são
+    descartadas: elas já apareceram (ou vão aparecer) pela perna exata, o que
+    evita repetição entre páginas.
+    """
+    exact_rows = exact_rows or []
+    page = []
+    seen_ids = set()
+
+    exact_used = 0
+    for row in exact_rows:
+        if len(page) >= limit:
+            break
+        exact_used += 1
+        if row.get("id") in seen_ids:
+            continue
+        seen_ids.add(row.get("id"))
+        page.append(row)
+
+    vector_used = 0
+    for row in vector_rows or []:
+        if len(page) >= limit:
+            break
+        vector_used += 1
+        if row.get("id") in seen_ids:
+            continue
+        if exact_filters is not None and row_matches(exact_filters, row):
+            continue
+        seen_ids.add(row.get("id"))
+        page.append(row)
+
+    next_cursor = PageCursor(
+        sig=cursor.sig,
+        page=cursor.page + 1,
+        query=cursor.query,
+        exact_after=sort_key(exact_rows[exact_used - 1], order) if exact_used else cursor.exact_after,
+        exact_done=cursor.exact_done or (exact_used == len(exact_rows) and len(exact_rows) < fetch_limit),
+        vector_after=cursor.vector_after,
+        vector_done=cursor.vector_done or vector_rows is None,
+        vector_depth=cursor.vector_depth + vector_used,
+    )
+    if vector_rows is not None:
+        if vector_used:
+            last = vector_rows[vector_used - 1]
+            next_cursor.vector_after = [last.get("similarity"), last.get("id")]
+        next_cursor.vector_done = vector_used == len(vector_rows) and len(vector_rows) < fetch_limit
+
+    has_more = not (next_cursor.exact_done and next_cursor.vector_done)
+    # O cursor volta mesmo esgotado: um "ver mais" depois do fim responde "não há mais"
+    return MergedPage(rows=page, has_more=has_more, next_cursor=next_cursor)
@@ -0,0 +1,119 @@
+"""
+Prefetch da próxima página de resultados.
+
+Depois de uma resposta com `has_more`, a próxima mensagem mais provável é
+"ver mais" / "mais opções". A página N+1 é calculada em background (mesmos filtros,
+mesmo cursor) e guardada em um slot curto por sessão. Quando o turno seguinte
+resolve para paginação, a página sai direto do slot.
+
+A concorrência é limitada e o prefetch nunca espera: se todas as vagas estão
+ocupadas ele é simplesmente descartado, para não competir com tráfego real.
+Ele também não chama o Gemini (só usa embeddings já em cache).
+"""
+import asyncio
+from dataclasses import asdict
+
+from app.config import settings
+from app.core.cache import cache
+from app.core import deadline
+from app.core.hybrid_search import fetch_hybrid_page
+from app.core.metrics import metrics, ratio
+from app.core.pagination import PageCursor, MergedPage, encode_cursor
+from app.core.search_cache import ROW_FIELDS
+from app.core.singleflight import normalize_key
+
+# Mensagens que, depois de uma página com has_more, só podem significar "próxima página"
+PAGINATION_MESSAGES = {
+    "ver mais", "mais", "mostrar mais", "mostra mais", "quero ver mais",
+    "mais opções", "mais opcoes", "próxima página", "proxima pagina",
+    "continuar", "continua", "ver restante", "ver o restante",
+}
+
+
+def is_pagination_message(message: str) -> bool:
+    return normalize_key(message).strip(" .!?") in PAGINATION_MESSAGES
+
+
+class Prefetcher:
+    def __init__(self, max_concurrency: int, ttl_seconds: int):
+        self.max_concurrency = max_concurrency
+        self.ttl_seconds = ttl_seconds
+        self._running = 0
+        self._tasks = set()
+
+        metrics.register_gauge("prefetch.running", lambda: self._running)
+        metrics.register_gauge(
+            "prefetch.hit_ratio",
+            lambda: ratio(metrics.get("prefetch.hits"), metrics.get("prefetch.stored")),
+        )
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"prefetch:{session_id}"
+
+    def schedule(self, session_id: str, search_filters: dict, cursor: PageCursor, limit: int, meta: dict = None):
+        """Agenda o cálculo da página de `cursor` (não bloqueia, pode descartar)."""
+        if not settings.PREFETCH_ENABLED or cursor is None:
+            return
+        if self._running >= self.max_concurrency:
+            metrics.inc("prefetch.skipped")
+            return
+
+        self._running += 1
+        task = asyncio.create_task(self._run(session_id, dict(search_filters), cursor, limit, meta or {}))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, session_id: str, search_filters: dict, cursor: PageCursor, limit: int, meta: dict):
+        deadline.clear() # Não herda o prazo da requisição que agendou
+        try:
+            merged, _ = await fetch_hybrid_page(search_filters, cursor, limit, cached_embedding_only=True)
+            if merged is None:
+                metrics.inc("prefetch.skipped")
+                return
+            slot = {
+                "cursor": encode_cursor(cursor),
+                "filters": search_filters,
+                "meta": meta,
+                "rows": [[row.get(f) for f in ROW_FIELDS] for row in merged.rows],
+                "has_more": merged.has_more,
+                "next_cursor": asdict(merged.next_cursor),
+            }
+            cache.set_cache(self._key(session_id), slot, ttl_seconds=self.ttl_seconds)
+            metrics.inc("prefetch.stored")
+        except Exception as e:
+            metrics.inc("prefetch.errors")
+            print(f"⚠️ [PREFETCH] Falha ao pré-carregar página: {e}")
+        finally:
+            self._running -= 1
+
+    def discard(self, session_id: str):
+        """Descarta a página pré-carregada da sessão (a conversa mudou de assunto)."""
+        cache.delete_cache(self._key(session_id))
+
+    def take(self, session_id: str, cursor: PageCursor):
+        """
+        Retorna (MergedPage, slot) se houver página pré-carregada exatamente para
+        `cursor`; senão (None, None). O slot é consumido.
+        """
+        if cursor is None:
+            return None, None
+        slot = cache.get_cache(self._key(session_id))
+        if not slot or slot.get("cursor") != encode_cursor(cursor):
+            return None, None
+
+        cache.delete_cache(self._key(session_id))
+        metrics.inc("prefetch.hits")
+        page = MergedPage(
+            rows=[dict(zip(ROW_FIELDS, values)) for values in slot["rows"]],
+            has_more=slot["has_more"],
+            next_cursor=PageCursor(**slot["next_cursor"]),
+        )
+        return page, slot
+
+
+# Instância global
+prefetcher = Prefetcher(
+    max_concurrency=settings.PREFETCH_MAX_CONCURRENCY,
+    ttl_seconds=settings.PREFETCH_TTL_SECONDS,
+)
@@ -0,0 +1,235 @@
+"""
+Profiling sob demanda das réplicas (endpoints /debug/*, protegidos por DEBUG_API_KEY).
+
+- SamplingProfiler: amostra as pilhas de todas as threads (loop do asyncio e workers do
+  asyncio.to_thread) a cada PROFILE_SAMPLE_INTERVAL_MS enquanto houver requisição
+  perfilada em andamento. Saída no formato "folded" (uma pilha por linha + contagem),
+  pronto para flamegraph.pl, speedscope ou inferno. Perfila as próximas N requisições
+  (arm) ou as que trazem o header X-Profile junto com X-Debug-Key.
+- MemoryTracker: snapshots do tracemalloc e diff contra o snapshot anterior (vazamentos).
+- LoopLagMonitor: atraso do event loop (quanto um sleep acorda depois do previsto).
+- executor_stats(): threads e fila do executor padrão (asyncio.to_thread).
+
+Custo zero quando desligado: sem DEBUG_API_KEY o middleware nem é instalado e o monitor
+de loop não sobe; com a chave, a thread de amostragem só existe durante um perfil e o
+tracemalloc só roda entre start e stop.
+"""
+import asyncio
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, deque
+
+from app.config import settings
+from app.core.metrics import metrics
+
+# Threads paradas esperando trabalho (topo da pilha): não é tempo de ninguém
+_IDLE_FRAMES = {("threading.py", "wait"), ("thread.py", "_worker")}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _fold(frame, max_depth: int) -> str:
+    """Pilha da raiz até `frame`, separada por ';' (formato folded)."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float, max_depth: int = 64, keep: int = 20):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.armed = 0
+        self.armed_path = None
+        self.results = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        self._active = {}
+        self._thread = None
+        self._ids = itertools.count(1)
+
+    def arm(self, requests: int, path: str = None):
+        """Perfila as próximas `requests` requisições (opcionalmente só as que começam com `path`)."""
+        with self._lock:
+            self.armed = requests
+            self.armed_path = path
+
+    def take_armed(self, path: str) -> bool:
+        """Consome uma vaga do arm se a requisição se qualifica."""
+        if self.armed <= 0 or path.startswith("/debug"):
+            return False
+        with self._lock:
+            if self.armed <= 0 or (self.armed_path and not path.startswith(self.armed_path)):
+                return False
+            self.armed -= 1
+            return True
+
+    def start(self, label: str) -> int:
+        profile_id = next(self._ids)
+        with self._lock:
+            self._active[profile_id] = {"label": label, "started": time.perf_counter(), "stacks": Counter(), "samples": 0}
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._thread.start()
+        return profile_id
+
+    def stop(self, profile_id: int, status: int = None) -> dict:
+        with self._lock:
+            session = self._active.pop(profile_id)
+        result = {
+            "id": profile_id,
+            "label": session["label"],
+            "status": status,
+            "duration_ms": round((time.perf_counter() - session["started"]) * 1000, 1),
+            "samples": session["samples"],
+            "stacks": session["stacks"],
+        }
+        self.results.append(result)
+        metrics.inc("profiler.requests")
+        return result
+
+    def get(self, profile_id: int):
+        return next((r for r in self.results if r["id"] == profile_id), None)
+
+    def summaries(self) -> list:
+        return [{k: v for k, v in r.items() if k != "stacks"} for r in reversed(self.results)]
+
+    @staticmethod
+    def folded(result: dict) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in result["stacks"].most_common())
+
+    def _sample_loop(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                sessions = list(self._active.values())
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = f"{names.get(ident, ident)};{_fold(frame, self.max_depth)}"
+                for session in sessions:
+                    session["stacks"][stack] += 1
+            for session in sessions:
+                session["samples"] += 1
+            time.sleep(self.interval)
+
+
+class MemoryTracker:
+    def __init__(self):
+        self._previous = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def snapshot(self, limit: int, key_type: str = "lineno") -> dict:
+        """Maiores alocações vivas e o que mudou desde o snapshot anterior."""
+        snap = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        report = {
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": [_stat(s) for s in snap.statistics(key_type)[:limit]],
+            "diff": None,
+        }
+        if self._previous is not None:
+            report["diff"] = [_stat(s) for s in snap.compare_to(self._previous, key_type)[:limit]]
+        self._previous = snap
+        return report
+
+
+def _stat(stat) -> dict:
+    item = {"where": str(stat.traceback[0]), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+    if hasattr(stat, "size_diff"):
+        item["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        item["count_diff"] = stat.count_diff
+    return item
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float, window: int = 240):
+        self.interval = interval
+        self._lags = deque(maxlen=window)
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            metrics.register_gauge("loop.lag_p99_ms", lambda: self.stats().get("p99_ms", 0))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self._lags.append(max(time.perf_counter() - started - self.interval, 0.0))
+
+    def stats(self) -> dict:
+        if not self._lags:
+            return {"running": self._task is not None, "samples": 0}
+        ordered = sorted(self._lags)
+        pick = lambda p: round(ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] * 1000, 2)
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "samples": len(ordered),
+            "last_ms": round(self._lags[-1] * 1000, 2),
+            "p50_ms": pick(50),
+            "p99_ms": pick(99),
+            "max_ms": round(ordered[-1] * 1000, 2),
+        }
+
+
+def executor_stats() -> dict:
+    """Executor padrão do loop (asyncio.to_thread) e threads vivas por prefixo do nome."""
+    executor = asyncio.get_running_loop()._default_executor
+    default = {"started": executor is not None}
+    if executor is not None:
+        default.update(
+            max_workers=executor._max_workers,
+            threads=len(executor._threads),
+            queued=executor._work_queue.qsize(),
+            idle=executor._idle_semaphore._value,
+        )
+    threads = threading.enumerate()
+    return {
+        "default_executor": default,
+        "threads_total": len(threads),
+        "threads_by_name": dict(Counter(t.name.rsplit("_", 1)[0].split("-", 1)[0] for t in threads)),
+    }
+
+
+# Instâncias globais
+profiler = SamplingProfiler(settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+memory_tracker = MemoryTracker()
+loop_monitor = LoopLagMonitor(settings.LOOP_LAG_INTERVAL_MS / 1000)
@@ -0,0 +1,204 @@
+"""
+Montagem do prompt de intenção.
+
+O prompt é dividido em duas partes:
+- prefixo estático (instruções + exemplos): montado uma vez, vai como
+  systemInstruction e pode ficar no context cache do Gemini;
+- sufixo dinâmico (categorias, histórico e mensagem): pequeno, por requisição.
+
+O histórico antigo chega como resumo + última busca ativa (memoria_resumo).
+Um orçamento de tokens (PROMPT_TOKEN_BUDGET) corta primeiro o histórico mais
+antigo e depois os exemplos menos importantes.
+"""
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+
+import requests
+
+from app.config import settings
+from app.core.metrics import metrics
+
+INSTRUCTIONS = """Você é um assistente de e-commerce inteligente. Interprete a mensagem atual do usuário.
+
+REGRAS:
+1. Analise se o usuário quer um produto específico ou ver uma categoria.
+2. Se for categoria, verifique se ela existe na lista (ou algo próximo).
+3. Se o usuário disser "sim", "quero", "mais", "ver restante" ou "continuar", isso é paginação. Mantenha o termo e os filtros da busca anterior (ÚLTIMA BUSCA ATIVA, se houver) e incremente "page".
+4. Se o usuário perguntar O QUE TEM, O QUE VENDE, QUAIS OPCOES (perguntas genéricas), marque "is_category_list": true com uma frase curta de introdução. NÃO liste as categorias: o sistema anexa a lista completa.
+5. Se o usuário pedir uma CARACTERÍSTICA ESPECÍFICA (ex: vegano, sem glúten, fitness), extraia isso como "tag".
+   - Padronize a tag em Title Case.
+   - CORRIJA GÊNERO E NÚMERO para o padrão do banco (singular masculino): "Veganas" -> "Vegano", "Sem Glutens" -> "Sem Glúten".
+6. VALORES (preço):
+   - "price_min": "acima de", "a partir de", "mais caro que", "maior que".
+   - "price_max": "até", "abaixo de", "mais barato que", "menos de", "menor que".
+   - "price_exact": "exatamente", "no valor de".
+   - "price_min_exclusive": true para "maior que", "acima de"; false para "a partir de", "de".
+   - "price_max_exclusive": true para "menor que", "abaixo de", "menos de"; false para "até", "no máximo".
+7. ORDENAÇÃO: "mais barato", "menor preço", "mais em conta" -> "sort": "price_asc". "mais caro", "maior preço", "luxuoso", "premium" -> "sort": "price_desc". Sem ordem pedida -> null.
+8. REGRA DE OURO PARA TERMOS: se o usuário NÃO disser explicitamente o nome de um produto ou categoria (ex: "algo barato", "presente até 50 reais"), "term" DEVE SER null. NÃO INVENTE CATEGORIAS.
+
+Responda no formato JSON definido pelo schema. Nos exemplos, campos omitidos têm o valor padrão (null, false, page 1)."""
+
+# Ordem = prioridade: o orçamento de tokens remove os exemplos do fim da lista primeiro
+EXAMPLES = [
+    ('"Tem algo vegano?"', {"type": "search_product", "tag": "Vegano", "ai_reply": "Buscando opções veganas..."}),
+    ('"Doces sem açúcar até 20 reais"', {"type": "search_product", "term": "Doces", "tag": "Sem Açúcar", "price_max": 20.0, "ai_reply": "Doces sem açúcar até R$20."}),
+    ('"Ver mais" (contexto anterior era frutas)', {"type": "search_category", "term": "Frutas", "page": 2, "ai_reply": "Aqui estão mais opções."}),
+    ('"O que voces tem?"', {"type": "conversation", "ai_reply": "Estas são as nossas categorias:", "is_category_list": True}),
+    ('"Quais frutas tem?"', {"type": "search_category", "term": "Frutas", "ai_reply": "Aqui estão frutas."}),
+    ('"Algo para comer com menos de 20 reais"', {"type": "search_product", "price_max": 20.0, "price_max_exclusive": True, "ai_reply": "Opções por menos de R$20."}),
+    ('"Mostre os mais baratos"', {"type": "search_product", "sort": "price_asc", "ai_reply": "Aqui estão os produtos de menor preço."}),
+    ('"Fone mais caro que 100"', {"type": "search_product", "term": "Fone", "price_min": 100.0, "price_min_exclusive": True, "ai_reply": "Fones acima de R$100."}),
+    ('"Quero abacate"', {"type": "search_product", "term": "Abacate", "ai_reply": "Busquei por abacate."}),
+    ('"Camisa de 50 reais"', {"type": "search_product", "term": "Camisa", "price_exact": 50.0, "ai_reply": "Camisas de R$50."}),
+    ('"Qual é o produto mais caro?"', {"type": "search_product", "sort": "price_desc", "ai_reply": "Este é o nosso produto de maior valor."}),
+    ('"Sim" (após ver frutas)', {"type": "search_category", "term": "Frutas", "page": 2, "ai_reply": "Entendido, buscando mais opções de frutas..."}),
+    ('"Oi"', {"type": "conversation", "ai_reply": "Olá! Como posso ajudar na sua compra hoje?"}),
+]
+
+# Respostas longas do assistente (ex: listas de categorias) não precisam ir inteiras no histórico
+HISTORY_MAX_CHARS = 300
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata (~4 caracteres por token), usada só para o orçamento."""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class BuiltPrompt:
+    system: str # Prefixo estático (systemInstruction / context cache)
+    user: str # Sufixo dinâmico da requisição
+    tokens: int # Estimativa do total
+    history_turns: int
+    examples: int
+
+
+class PromptBuilder:
+    def __init__(self, token_budget: int, history_turns: int, min_examples: int):
+        self.token_budget = token_budget
+        self.history_turns = history_turns
+        self.min_examples = min(min_examples, len(EXAMPLES))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def system_prefix(examples: int) -> str:
+        """Instruções + os `examples` primeiros exemplos (montado uma vez por tamanho)."""
+        lines = [INSTRUCTIONS, "", "Exemplos:"]
+        for message, intent in EXAMPLES[:examples]:
+            lines.append(f"- User: {message} -> {json.dumps(intent, ensure_ascii=False, separators=(',', ':'))}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_history(history: list) -> str:
+        lines = []
+        for h in history:
+            role = "Usuário" if h['role'] == 'user' else "Assistente"
+            content = " ".join(str(h['content']).split())
+            if len(content) > HISTORY_MAX_CHARS:
+                content = content[:HISTORY_MAX_CHARS] + "..."
+            lines.append(f"{role}: {content}")
+        return "\n".join(lines)
+
+    def _dynamic_suffix(self, message: str, history: list, categories: list, total_categories: int, summary: dict = None) -> str:
+        if total_categories > len(categories):
+            # Shortlist (app/core/category_index.py): só as categorias relevantes para a mensagem
+            header = f"CATEGORIAS RELEVANTES PARA A MENSAGEM (de {total_categories} no catálogo)"
+        else:
+            header = "CATEGORIAS DISPONÍVEIS NO BANCO"
+        parts = [f"{header}: [{', '.join(categories)}]"]
+        if summary:
+            # Resumo da sessão (app/core/conversation_summary.py): tamanho fixo, não cresce com a conversa
+            if summary.get("summary"):
+                parts.append(f"RESUMO DA CONVERSA: {summary['summary'][:settings.SUMMARY_MAX_CHARS]}")
+            if summary.get("last_filters"):
+                filters = json.dumps(summary["last_filters"], ensure_ascii=False, separators=(',', ':'))
+                parts.append(f"ÚLTIMA BUSCA ATIVA: {filters}")
+        parts.append(f"HISTÓRICO RECENTE:\n{self._format_history(history) or '(vazio)'}")
+        parts.append(f"MENSAGEM ATUAL DO USUÁRIO: \"{message}\"")
+        return "\n\n".join(parts)
+
+    def build(self, message: str, history: list, categories: list, total_categories: int = None, summary: dict = None) -> BuiltPrompt:
+        """
+        Monta o prompt dentro do orçamento. Ordem de corte: histórico mais antigo
+        (até sobrar 1 turno), exemplos (até min_examples), o último turno.
+        `total_categories` > len(categories) indica que `categories` é uma shortlist.
+        `summary`: linha de memoria_resumo (resumo + última busca ativa).
+        """
+        total_categories = len(categories) if total_categories is None else total_categories
+        history = list(history[-self.history_turns:]) if self.history_turns > 0 else []
+        examples = len(EXAMPLES)
+        while True:
+            system = self.system_prefix(examples)
+            user = self._dynamic_suffix(message, history, categories, total_categories, summary)
+            tokens = estimate_tokens(system) + estimate_tokens(user)
+            if tokens <= self.token_budget:
+                break
+            if len(history) > 1:
+                history.pop(0)
+            elif examples > self.min_examples:
+                examples -= 1
+            elif history:
+                history.pop(0)
+            else:
+                metrics.inc("prompt.over_budget")
+                break
+        return BuiltPrompt(system, user, tokens, len(history), examples)
+
+
+class ContextCache:
+    """
+    Context cache explícito do Gemini (cachedContents) para o prefixo estático.
+    Se a criação falhar (ex: prefixo abaixo do mínimo de tokens do modelo),
+    a chamada segue com systemInstruction e a tentativa só é repetida após o TTL.
+    """
+
+    def __init__(self, model: str, ttl_seconds: int):
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = {} # hash do prefixo -> (nome ou None, expira_em)
+
+    def get(self, system: str, api_key: str):
+        """Nome do cachedContent para o prefixo (cria se preciso) ou None."""
+        digest = hashlib.sha1(system.encode()).hexdigest()
+        with self._lock:
+            name, expires_at = self._entries.get(digest, (None, 0))
+            if time.time() < expires_at:
+                return name
+            name = self._create(system, api_key)
+            # Margem para não usar um cache prestes a expirar no Gemini
+            self._entries[digest] = (name, time.time() + self.ttl_seconds * 0.9)
+            return name
+
+    def _create(self, system: str, api_key: str):
+        url = f"https://generativelanguage.googleapis.com/v1beta/cachedContents?key={api_key}"
+        payload = {
+            "model": f"models/{self.model}",
+            "systemInstruction": {"parts": [{"text": system}]},
+            "ttl": f"{self.ttl_seconds}s",
+        }
+        try:
+            response = requests.post(url, json=payload, timeout=10)
+            if response.status_code != 200:
+                print(f"⚠️ [PROMPT] Context cache indisponível ({response.status_code}): {response.text[:200]}")
+                metrics.inc("prompt.context_cache.errors")
+                return None
+            metrics.inc("prompt.context_cache.created")
+            return response.json().get("name")
+        except Exception as e:
+            print(f"⚠️ [PROMPT] Erro ao criar context cache: {e}")
+            metrics.inc("prompt.context_cache.errors")
+            return None
+
+
+# Instâncias globais
+prompt_builder = PromptBuilder(
+    token_budget=settings.PROMPT_TOKEN_BUDGET,
+    history_turns=settings.PROMPT_HISTORY_TURNS,
+    min_examples=settings.PROMPT_MIN_EXAMPLES,
+)
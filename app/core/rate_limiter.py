@@ -0,0 +1,184 @@
+"""
+Rate limiter distribuído (token bucket) para as chamadas ao Gemini.
+
+As réplicas da API e o worker compartilham o mesmo orçamento de requisições
+por minuto através de um script Lua atômico no Redis. Existem buckets
+separados para o modelo de chat e para o de embeddings, e o tráfego
+interativo (usuário esperando resposta) tem prioridade sobre o worker:
+requisições em background só consomem tokens acima de uma reserva.
+
+Se o Redis não estiver disponível (ou cair), cada processo volta a usar um
+bucket local com a mesma semântica.
+"""
+import asyncio
+import threading
+import time
+
+from app.config import settings
+from app.core.cache import cache
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# Tempo (segundos) antes de tentar o Redis novamente após uma falha
+REDIS_RETRY_SECONDS = 30
+
+# Estado do bucket guardado em um HASH: tokens disponíveis + timestamp do último refill.
+# Usa o relógio do próprio Redis para que todos os processos vejam o mesmo tempo.
+# Retorna o tempo de espera (em segundos, como string para não truncar) ou "0" se liberou.
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local floor = tonumber(ARGV[4])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil or ts == nil then
+    tokens = capacity
+    ts = now
+end
+
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local wait = 0
+if tokens - cost >= floor then
+    tokens = tokens - cost
+else
+    wait = (cost + floor - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class LocalTokenBucket:
+    """Token bucket em memória (fallback por processo)."""
+
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.ts = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, cost: float, floor: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens - cost >= floor:
+                self.tokens -= cost
+                return 0.0
+            return (cost + floor - self.tokens) / self.rate
+
+
+class TokenBucketLimiter:
+    """
+    Limiter de um modelo (chat ou embedding).
+    - rate_per_minute: orçamento do projeto inteiro (todas as réplicas somadas)
+    - burst: tamanho máximo do bucket
+    - reserve_fraction: fração do bucket reservada para tráfego interativo
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, burst: float, reserve_fraction: float, redis_client=None):
+        self.name = name
+        self.key = f"ratelimit:gemini:{name}"
+        self.rate = max(rate_per_minute, 1) / 60.0
+        self.capacity = max(burst, 1)
+        self.reserve = self.capacity * min(max(reserve_fraction, 0.0), 0.9)
+        self.local = LocalTokenBucket(self.rate, self.capacity)
+
+        self.redis_client = redis_client
+        self._script = None
+        self._redis_down_until = 0.0
+        if redis_client is not None:
+            try:
+                self._script = redis_client.register_script(_TOKEN_BUCKET_LUA)
+            except Exception as e:
+                print(f"⚠️ [RATE LIMIT] Falha ao registrar script no Redis ({e}). Usando limite local.")
+
+    def _floor(self, priority: str) -> float:
+        return self.reserve if priority == BACKGROUND else 0.0
+
+    def try_acquire(self, cost: float = 1, priority: str = INTERACTIVE) -> float:
+        """Tenta consumir `cost` tokens. Retorna 0 se liberou ou o tempo sugerido de espera."""
+        floor = self._floor(priority)
+
+        if self._script is not None and time.monotonic() >= self._redis_down_until:
+            try:
+                wait = self._script(keys=[self.key], args=[self.rate, self.capacity, cost, floor])
+                if isinstance(wait, bytes):
+                    wait = wait.decode()
+                return float(wait)
+            except Exception as e:
+                print(f"⚠️ [RATE LIMIT] Redis indisponível ({e}). Usando limite local por {REDIS_RETRY_SECONDS}s.")
+                self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+        return self.local.try_acquire(cost, floor)
+
+    async def try_acquire_async(self, cost: float = 1, priority: str = INTERACTIVE) -> float:
+        """
+        try_acquire sem bloquear o event loop: o script Lua roda no cliente Redis
+        síncrono, então vai para uma thread. O bucket local é só memória e roda direto.
+        """
+        if self._script is not None and time.monotonic() >= self._redis_down_until:
+            return await asyncio.to_thread(self.try_acquire, cost, priority)
+        return self.local.try_acquire(cost, self._floor(priority))
+
+    async def acquire_now(self, cost: float = 1, priority: str = INTERACTIVE) -> bool:
+        """Consome o token só se estiver livre agora (sem esperar na fila)."""
+        return await self.try_acquire_async(cost, priority) <= 0
+
+    def acquire(self, cost: float = 1, priority: str = INTERACTIVE, timeout: float = None) -> bool:
+        """Versão bloqueante (usada nas chamadas síncronas/threads). Retorna False se estourar o timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(cost, priority)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+    async def acquire_async(self, cost: float = 1, priority: str = INTERACTIVE, timeout: float = None) -> bool:
+        """Versão assíncrona: espera sem bloquear o event loop."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = await self.try_acquire_async(cost, priority)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            await asyncio.sleep(wait)
+
+
+_redis = cache.redis_client if cache.use_redis else None
+
+# Instâncias globais (um orçamento por modelo)
+chat_limiter = TokenBucketLimiter(
+    "chat",
+    rate_per_minute=settings.GEMINI_CHAT_RPM,
+    burst=settings.GEMINI_CHAT_BURST,
+    reserve_fraction=settings.GEMINI_INTERACTIVE_RESERVE,
+    redis_client=_redis,
+)
+embedding_limiter = TokenBucketLimiter(
+    "embedding",
+    rate_per_minute=settings.GEMINI_EMBED_RPM,
+    burst=settings.GEMINI_EMBED_BURST,
+    reserve_fraction=settings.GEMINI_INTERACTIVE_RESERVE,
+    redis_client=_redis,
+)
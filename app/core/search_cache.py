@@ -0,0 +1,144 @@
+"""
+Cache de páginas de resultado da busca (exata e vetorial).
+
+A chave é a tupla de filtros canonizada + a versão do catálogo. Quando a
+tabela `produtos` muda, a versão é incrementada (pelo worker ou por um hook
+de alteração) e todas as páginas antigas deixam de ser encontradas. A nova
+versão chega às outras réplicas pelo barramento de invalidação
+(app/core/invalidation.py); o TTL é só uma rede de segurança.
+
+As linhas são guardadas de forma compacta (lista de valores, sem nomes de
+colunas), só com os campos que a resposta e o cursor de paginação usam.
+"""
+import hashlib
+import json
+import struct
+import time
+
+from app.config import settings
+from app.core.cache import cache
+from app.core.invalidation import invalidation_bus
+from app.core.metrics import metrics, ratio
+from app.core.singleflight import normalize_key
+
+CATALOG_VERSION_KEY = "catalog_version"
+# Campos mantidos no cache (os mesmos do modelo Product + similaridade da busca vetorial,
+# usada pelo cursor de paginação)
+ROW_FIELDS = ("id", "nome", "descricao", "categoria", "tags", "preco", "similarity")
+
+# A versão é relida no máximo uma vez por segundo por processo; com o barramento
+# de invalidação conectado a nova versão chega por evento e a releitura é só backstop
+_VERSION_MEMO_SECONDS = 1.0
+_VERSION_MEMO_SUBSCRIBED_SECONDS = 30.0
+_version_memo = {"value": None, "read_at": 0.0}
+_last_db_version = {"value": None}
+
+metrics.register_gauge(
+    "search_cache.hit_ratio",
+    lambda: ratio(metrics.get("search_cache.hits"), metrics.get("search_cache.hits") + metrics.get("search_cache.misses")),
+)
+
+
+def _remember_version(version: int):
+    _version_memo["value"] = version
+    _version_memo["read_at"] = time.monotonic()
+
+
+def _on_catalog_event(event: dict):
+    """Versão publicada por outra réplica/worker: passa a valer na hora."""
+    version = event.get("version")
+    if version is not None and version > (_version_memo["value"] or 0):
+        _remember_version(version)
+
+
+invalidation_bus.on("catalog", _on_catalog_event)
+
+
+def get_catalog_version() -> int:
+    now = time.monotonic()
+    memo_seconds = _VERSION_MEMO_SUBSCRIBED_SECONDS if invalidation_bus.connected else _VERSION_MEMO_SECONDS
+    if _version_memo["value"] is None or now - _version_memo["read_at"] > memo_seconds:
+        _version_memo["value"] = cache.get_counter(CATALOG_VERSION_KEY)
+        _version_memo["read_at"] = now
+    return _version_memo["value"]
+
+
+def bump_catalog_version() -> int:
+    """Invalida todas as páginas em cache (chamar quando `produtos` mudar)."""
+    version = cache.incr(CATALOG_VERSION_KEY)
+    # Limpa categorias/páginas do L1 desta réplica e avisa as demais
+    invalidation_bus.publish("catalog", version=version)
+    metrics.inc("search_cache.invalidations")
+    print(f"♻️ [SEARCH CACHE] Versão do catálogo -> {version}")
+    return version
+
+
+def observe_db_version(db_version):
+    """
+    Recebe a versão do catálogo lida do banco (catalog_meta, atualizada por trigger).
+    Se mudou desde a última leitura deste processo, invalida o cache.
+    """
+    if db_version is None:
+        return
+    previous = _last_db_version["value"]
+    _last_db_version["value"] = db_version
+    if previous is not None and previous != db_version:
+        bump_catalog_version()
+
+
+def _canonical_number(value):
+    return None if value is None else round(float(value), 2)
+
+
+def canonical_filters(filters: dict) -> tuple:
+    """Tupla canônica dos filtros (com os nomes de search_products)."""
+    return (
+        normalize_key(filters.get("query_term")),
+        filters.get("category"),
+        filters.get("tag"),
+        _canonical_number(filters.get("min_price")),
+        _canonical_number(filters.get("max_price")),
+        _canonical_number(filters.get("exact_price")),
+        bool(filters.get("min_price_exclusive")),
+        bool(filters.get("max_price_exclusive")),
+        filters.get("order_by"),
+    )
+
+
+def filters_digest(filters: dict) -> str:
+    return hashlib.sha1(json.dumps(canonical_filters(filters), ensure_ascii=False).encode()).hexdigest()
+
+
+def exact_key(filters: dict, limit: int, offset: int, after=None) -> str:
+    """Chave da página da busca exata (offset ou cursor `after`)."""
+    position = json.dumps([int(offset or 0), int(limit), list(after) if after else None])
+    digest = hashlib.sha1((filters_digest(filters) + position).encode()).hexdigest()
+    return f"search:exact:{get_catalog_version()}:{digest}"
+
+
+def vector_key(embedding: list, limit: int, match_threshold: float, after=None) -> str:
+    """Chave da busca vetorial (embedding arredondado para absorver ruído numérico)."""
+    packed = struct.pack(f"{len(embedding)}f", *(round(x, 4) for x in embedding))
+    digest = hashlib.sha1(packed + json.dumps(list(after) if after else None).encode()).hexdigest()
+    return f"search:vector:{get_catalog_version()}:{digest}:{limit}:{match_threshold}"
+
+
+def get_page(key: str):
+    """Retorna as linhas (dicts) ou None se não estiver em cache."""
+    if not settings.SEARCH_CACHE_ENABLED:
+        return None
+    packed = cache.get_cache(key)
+    if packed is None:
+        metrics.inc("search_cache.misses")
+        return None
+    metrics.inc("search_cache.hits")
+    return [dict(zip(ROW_FIELDS, values)) for values in packed]
+
+
+def set_page(key: str, rows: list):
+    if not settings.SEARCH_CACHE_ENABLED or rows is None:
+        return
+    packed = [[row.get(f) for f in ROW_FIELDS] for row in rows]
+    # Sem o barramento, outra réplica pode não ver a nova versão por um tempo: TTL curto
+    ttl = settings.SEARCH_CACHE_TTL_SECONDS if invalidation_bus.connected else settings.SEARCH_CACHE_FALLBACK_TTL_SECONDS
+    cache.set_cache(key, packed, ttl_seconds=ttl)
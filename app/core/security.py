@@ -1,3 +1,4 @@
+import secrets
 from fastapi import Security, HTTPException, status
 from fastapi.security.api_key import APIKeyHeader
 from app.config import settings
@@ -20,3 +21,25 @@ async def get_api_key(api_key_header: str = Security(api_key_header)):
         status_code=status.HTTP_403_FORBIDDEN,
         detail="Could not validate API Key"
     )
+
+
+def is_debug_key(key: str) -> bool:
+    """True se `key` é a DEBUG_API_KEY (sem chave configurada, o debug fica desligado)."""
+    return bool(settings.DEBUG_API_KEY) and secrets.compare_digest(key or "", settings.DEBUG_API_KEY)
+
+
+debug_key_header = APIKeyHeader(name="X-Debug-Key", auto_error=False)
+
+async def get_debug_key(debug_key_header: str = Security(debug_key_header)):
+    """
+    Dependência dos endpoints /debug/*: exige X-Debug-Key. Sem DEBUG_API_KEY os
+    endpoints nem existem (404), para não anunciar o debug em produção.
+    """
+    if not settings.DEBUG_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if is_debug_key(debug_key_header):
+        return debug_key_header
+    raise HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Could not validate debug key"
+    )
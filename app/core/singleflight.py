@@ -0,0 +1,71 @@
+"""
+Single-flight: coalesce chamadas idênticas em andamento.
+
+Quando várias sessões mandam a mesma mensagem ao mesmo tempo (ex: disparo de
+campanha no WhatsApp), apenas a primeira chamada (líder) vai ao Gemini/Supabase;
+as demais aguardam o mesmo future e recebem o mesmo resultado ou a mesma exceção.
+
+Cancelamento: se um chamador é cancelado, a chamada compartilhada continua para
+os demais. Ela só é cancelada quando o último interessado desiste.
+"""
+import asyncio
+
+from app.core.metrics import metrics, ratio
+
+
+def normalize_key(text: str) -> str:
+    """Normaliza texto livre para uso em chave (caixa e espaços)."""
+    if not text:
+        return ""
+    return " ".join(str(text).lower().split())
+
+
+class _Call:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+
+        metrics.register_gauge(
+            f"singleflight.{name}.coalescing_ratio",
+            lambda: ratio(metrics.get(f"singleflight.{name}.shared"), metrics.get(f"singleflight.{name}.calls")),
+        )
+        metrics.register_gauge(f"singleflight.{name}.inflight", lambda: len(self._calls))
+
+    def _forget(self, key, call: _Call):
+        # Só remove se a chave ainda aponta para esta chamada
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    async def do(self, key, fn):
+        """
+        Executa `fn()` (corrotina) uma única vez por chave em andamento.
+        Chamadores concorrentes com a mesma chave compartilham o resultado.
+        """
+        metrics.inc(f"singleflight.{self.name}.calls")
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _t, k=key, c=call: self._forget(k, c))
+        else:
+            metrics.inc(f"singleflight.{self.name}.shared")
+
+        call.waiters += 1
+        try:
+            # shield: o cancelamento de um chamador não cancela a chamada dos outros
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # Ninguém mais espera: libera a chave e cancela o trabalho órfão
+                self._forget(key, call)
+                call.task.cancel()
@@ -0,0 +1,314 @@
+"""
+Snapshot binário dos embeddings, compartilhado entre o worker e as réplicas da API.
+
+O worker publica em um volume compartilhado um arquivo versionado com:
+- header JSON (versão, quantidade, dimensão, tipo, seções)
+- ids (int64)
+- vetores normalizados quantizados (float16, ou int8 com uma escala por linha)
+- (opcional) os mesmos vetores em float32, usados só para reordenar candidatos
+
+A escrita é atômica (arquivo temporário + os.replace) e o arquivo CURRENT aponta
+para a versão ativa. A API abre o arquivo com mmap (sem copiar para a memória do
+processo; réplicas no mesmo host dividem o page cache) e troca de versão sozinha
+quando CURRENT muda, sem reiniciar.
+
+Como os vetores são normalizados na escrita, similaridade de cosseno = produto
+interno. Candidatos com score quantizado perto do corte são recalculados em
+float32 (só as páginas desses vetores são lidas do disco).
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.core.metrics import metrics
+
+MAGIC = b"RAGVEC01"
+CURRENT_FILE = "CURRENT"
+# Alinhamento das seções (permite np.frombuffer direto sobre o mmap)
+_ALIGN = 64
+# Linhas por bloco no cálculo de scores (limita a memória temporária em float32)
+_CHUNK_ROWS = 4096
+# Versões antigas mantidas no volume (réplicas ainda podem estar lendo a anterior)
+_KEEP_VERSIONS = 2
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGN - 1) // _ALIGN * _ALIGN
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+# --- Escrita (worker) ---
+
+def read_current_version(directory: str) -> int:
+    """Versão do snapshot ativo no diretório (0 se não houver)."""
+    try:
+        with open(os.path.join(directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        return _read_header(os.path.join(directory, name))["version"]
+    except Exception:
+        return 0
+
+
+def write_snapshot(directory: str, ids: list, vectors: list, dtype: str = "float16", full_precision: bool = True) -> str:
+    """
+    Grava um novo snapshot (versão atual + 1) e aponta CURRENT para ele.
+    Retorna o caminho do arquivo publicado.
+    """
+    if dtype not in ("float16", "int8"):
+        raise ValueError(f"dtype de snapshot inválido: {dtype}")
+
+    os.makedirs(directory, exist_ok=True)
+    version = read_current_version(directory) + 1
+
+    id_array = np.asarray(ids, dtype=np.int64)
+    full = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+    count, dim = full.shape
+
+    sections = {}
+    if dtype == "int8":
+        scales = np.abs(full).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        quantized = np.round(full / scales[:, None]).astype(np.int8)
+        blobs = [("ids", id_array), ("vectors", quantized), ("scales", scales.astype(np.float32))]
+    else:
+        blobs = [("ids", id_array), ("vectors", full.astype(np.float16))]
+    if full_precision:
+        blobs.append(("full", full))
+
+    # Offsets são relativos ao início da área de dados (depois do header)
+    offset = 0
+    for name, array in blobs:
+        offset = _align(offset)
+        sections[name] = [offset, array.nbytes]
+        offset += array.nbytes
+
+    header = json.dumps({
+        "version": version,
+        "count": count,
+        "dim": dim,
+        "dtype": dtype,
+        "created_at": time.time(),
+        "sections": sections,
+    }).encode("utf-8")
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    name = f"embeddings-v{version:06d}.bin"
+    path = os.path.join(directory, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for section, array in blobs:
+            f.seek(data_start + sections[section][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    current_tmp = os.path.join(directory, CURRENT_FILE + ".tmp")
+    with open(current_tmp, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(current_tmp, os.path.join(directory, CURRENT_FILE))
+
+    _cleanup_old_versions(directory, keep=name)
+    print(f"💾 [SNAPSHOT] Publicado {name} ({count} vetores, {dim} dims, {dtype}).")
+    return path
+
+
+def _cleanup_old_versions(directory: str, keep: str):
+    # Quem ainda tem o arquivo aberto via mmap continua lendo normalmente após o unlink
+    files = sorted(f for f in os.listdir(directory) if f.startswith("embeddings-v") and f.endswith(".bin"))
+    for name in files[:-_KEEP_VERSIONS]:
+        if name != keep:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+# --- Leitura (API) ---
+
+def _read_header(path: str) -> dict:
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Arquivo não é um snapshot de embeddings: {path}")
+        (length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(length))
+    header["data_start"] = _align(len(MAGIC) + 4 + length)
+    return header
+
+
+class _Snapshot:
+    """Um arquivo de snapshot aberto via mmap (somente leitura)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        header = _read_header(path)
+        self.version = header["version"]
+        self.count = header["count"]
+        self.dim = header["dim"]
+        self.dtype = header["dtype"]
+
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        def section(name, dtype, shape):
+            if name not in header["sections"]:
+                return None
+            offset, _ = header["sections"][name]
+            array = np.frombuffer(self._mm, dtype=dtype, count=int(np.prod(shape)), offset=header["data_start"] + offset)
+            return array.reshape(shape)
+
+        self.ids = section("ids", np.int64, (self.count,))
+        self.vectors = section("vectors", np.int8 if self.dtype == "int8" else np.float16, (self.count, self.dim))
+        self.scales = section("scales", np.float32, (self.count,))
+        self.full = section("full", np.float32, (self.count, self.dim))
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Scores aproximados (quantizados) de todos os vetores contra a query normalizada."""
+        out = np.empty(self.count, dtype=np.float32)
+        for start in range(0, self.count, _CHUNK_ROWS):
+            block = self.vectors[start:start + _CHUNK_ROWS].astype(np.float32)
+            out[start:start + len(block)] = block @ query
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+
+class SnapshotIndex:
+    """
+    Busca vetorial local sobre o snapshot mais recente do diretório.
+    Verifica se há versão nova no máximo a cada `reload_seconds`.
+    """
+
+    def __init__(self, directory: str, reload_seconds: float = 30, rescore_margin: float = 0.02):
+        self.directory = directory
+        self.reload_seconds = reload_seconds
+        self.rescore_margin = rescore_margin
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+        metrics.register_gauge("vector_snapshot.version", lambda: self._snapshot.version if self._snapshot else 0)
+        metrics.register_gauge("vector_snapshot.count", lambda: self._snapshot.count if self._snapshot else 0)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def load(self) -> bool:
+        """Abre (ou troca para) a versão apontada por CURRENT. Retorna True se houver snapshot."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                with open(os.path.join(self.directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+                    name = f.read().strip()
+            except FileNotFoundError:
+                return self._snapshot is not None
+
+            if self._snapshot is None or self._snapshot.name != name:
+                try:
+                    snapshot = _Snapshot(os.path.join(self.directory, name))
+                except Exception as e:
+                    print(f"⚠️ [SNAPSHOT] Falha ao abrir {name}: {e}")
+                    return self._snapshot is not None
+                # Troca por referência: buscas em andamento terminam na versão antiga
+                self._snapshot = snapshot
+                metrics.inc("vector_snapshot.reloads")
+                print(f"✅ [SNAPSHOT] Versão {snapshot.version} carregada ({snapshot.count} vetores, {snapshot.dtype}).")
+            return True
+
+    def _current(self):
+        if time.monotonic() - self._checked_at > self.reload_seconds:
+            self.load()
+        return self._snapshot
+
+    def search(self, query_embedding: list, match_threshold: float, limit: int, after=None, depth: int = 0):
+        """
+        Retorna [(id, similaridade)] ordenado por similaridade desc, id asc,
+        ou None se não houver snapshot (usar o banco).
+        `after` = [similaridade, id] continua a partir do cursor; sem similaridade
+        no cursor, pula os `depth` primeiros resultados.
+        """
+        snapshot = self._current()
+        if snapshot is None:
+            return None
+        metrics.inc("vector_snapshot.searches")
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if query.shape != (snapshot.dim,):
+            print(f"⚠️ [SNAPSHOT] Dimensão da query ({query.shape[0]}) difere do snapshot ({snapshot.dim}).")
+            return None
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+
+        margin = self.rescore_margin if snapshot.full is not None else 0.0
+        scores = snapshot.scores(query)
+
+        use_keyset = bool(after) and after[0] is not None
+        wanted = limit if use_keyset else depth + limit
+
+        # Pré-filtro frouxo pelo score quantizado (a margem cobre o erro de quantização)
+        mask = scores > match_threshold - margin
+        if use_keyset:
+            mask &= scores <= after[0] + margin
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0:
+            return []
+        if use_keyset:
+            # Linhas na zona de dúvida do cursor podem ser de páginas já mostradas
+            wanted += int(np.count_nonzero(scores[candidates] >= after[0] - margin))
+
+        # Top `wanted` + todos que empatam com o corte dentro da margem
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        if len(order) > wanted:
+            cutoff = scores[order[wanted - 1]] - margin
+            order = order[scores[order] >= cutoff]
+
+        if snapshot.full is not None:
+            final = snapshot.full[order] @ query
+            metrics.inc("vector_snapshot.rescored", len(order))
+        else:
+            final = scores[order]
+
+        results = []
+        for idx, score in zip(order, final):
+            score = float(score)
+            pid = int(snapshot.ids[idx])
+            if score <= match_threshold:
+                continue
+            if use_keyset and not (score < after[0] or (score == after[0] and pid > after[1])):
+                continue
+            results.append((pid, score))
+        results.sort(key=lambda item: (-item[1], item[0]))
+
+        if use_keyset:
+            return results[:limit]
+        return results[depth:depth + limit]
+
+
+# Instância global (desabilitada se VECTOR_SNAPSHOT_DIR não estiver definido)
+vector_index = SnapshotIndex(
+    settings.VECTOR_SNAPSHOT_DIR,
+    reload_seconds=settings.VECTOR_SNAPSHOT_RELOAD_SECONDS,
+    rescore_margin=settings.VECTOR_SNAPSHOT_RESCORE_MARGIN,
+)
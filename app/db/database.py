@@ -1,23 +1,162 @@
 import os
-from supabase import create_client, Client
+import json
+import asyncio
+import inspect
+from datetime import datetime
+from decimal import Decimal
 from dotenv import load_dotenv
 
+from app.config import settings
+from app.db.filters import (
+    build_product_filters,
+    order_for,
+    to_postgrest_params,
+    to_postgrest_order,
+    to_sql_where,
+    to_sql_order,
+    keyset_postgrest_params,
+    keyset_sql,
+)
+from app.db.postgrest import AsyncPostgrest, PostgrestError
+from app.core.circuit_breaker import supabase_breaker, CircuitOpen
+from app.core.deadline import timeout_for, DeadlineExceeded
+from app.core.metrics import metrics
+
 load_dotenv()
 
 url: str = os.environ.get("SUPABASE_URL")
 key: str = os.environ.get("SUPABASE_KEY")
 
-supabase: Client = create_client(url, key)
+# --- Conexões ---
+# Cliente síncrono (supabase-py): usado pelo worker e scripts. Criado (e importado) sob demanda:
+# a API usa só o cliente assíncrono e não paga o import do supabase-py no startup.
+_supabase = None
+# Cliente assíncrono (PostgREST via httpx com pool) e pool asyncpg opcional: criados no lifespan da API.
+_rest: AsyncPostgrest = None
+_pg_pool = None
+
+
+def get_supabase():
+    """Retorna o cliente síncrono do Supabase (criado na primeira chamada)."""
+    global _supabase
+    if _supabase is None:
+        from supabase import create_client
+        _supabase = create_client(url, key)
+    return _supabase
+
+
+class _GuardedPool:
+    """
+    Pool asyncpg com o prazo da requisição (app/core/deadline.py) e o circuit
+    breaker do Supabase. Erros do Postgres (consulta inválida, tabela ausente)
+    não abrem o circuito; conexão caída e timeout abrem.
+    """
+
+    def __init__(self, pool):
+        import asyncpg
+        self._pool = pool
+        self._query_error = asyncpg.PostgresError
+
+    def _is_failure(self, e: Exception) -> bool:
+        return not isinstance(e, self._query_error)
+
+    async def _call(self, method: str, query: str, *args, timeout: float = None):
+        fn = getattr(self._pool, method)
+        return await supabase_breaker.call(
+            lambda: fn(query, *args, timeout=timeout_for(timeout or settings.SUPABASE_TIMEOUT_SECONDS)),
+            is_failure=self._is_failure,
+        )
+
+    async def fetch(self, query: str, *args, timeout: float = None):
+        return await self._call("fetch", query, *args, timeout=timeout)
+
+    async def fetchrow(self, query: str, *args, timeout: float = None):
+        return await self._call("fetchrow", query, *args, timeout=timeout)
+
+    async def execute(self, query: str, *args, timeout: float = None):
+        return await self._call("execute", query, *args, timeout=timeout)
+
+    async def close(self):
+        await self._pool.close()
+
+
+async def init_db():
+    """Abre os pools de conexão (chamado no startup da API)."""
+    global _rest, _pg_pool
+    if _rest is None:
+        _rest = AsyncPostgrest(
+            url,
+            key,
+            timeout=settings.SUPABASE_TIMEOUT_SECONDS,
+            max_connections=settings.SUPABASE_POOL_SIZE,
+            breaker=supabase_breaker,
+        )
+        print(f"✅ [DB] Pool PostgREST pronto ({settings.SUPABASE_POOL_SIZE} conexões).")
+
+    if settings.DATABASE_URL and _pg_pool is None:
+        try:
+            import asyncpg
+            _pg_pool = _GuardedPool(await asyncpg.create_pool(
+                settings.DATABASE_URL,
+                min_size=1,
+                max_size=settings.SUPABASE_POOL_SIZE,
+                command_timeout=settings.SUPABASE_TIMEOUT_SECONDS,
+                # Compatível com o pooler do Supabase (pgbouncer em modo transaction)
+                statement_cache_size=0,
+            ))
+            print("✅ [DB] Pool asyncpg conectado (DATABASE_URL).")
+        except Exception as e:
+            print(f"⚠️ [DB] Falha ao conectar via asyncpg ({e}). Usando PostgREST.")
+            _pg_pool = None
+
+
+async def close_db():
+    """Fecha os pools (chamado no shutdown da API)."""
+    global _rest, _pg_pool
+    if _rest is not None:
+        await _rest.aclose()
+        _rest = None
+    if _pg_pool is not None:
+        await _pg_pool.close()
+        _pg_pool = None
+
+
+async def _get_rest() -> AsyncPostgrest:
+    # Fora da API (scripts) o lifespan não roda: inicializa na primeira chamada
+    if _rest is None:
+        await init_db()
+    return _rest
+
+
+def _row_to_dict(record) -> dict:
+    """Converte linha do asyncpg para dict no mesmo formato do PostgREST."""
+    row = dict(record)
+    for k, v in row.items():
+        if isinstance(v, Decimal):
+            row[k] = float(v)
+    return row
+
+
+# Colunas que a resposta usa (ProductRow/Product): as buscas não trazem o resto da tabela
+PRODUCT_COLUMNS = "id, nome, descricao, categoria, tags, preco"
+_PRODUCT_COLUMNS_REST = PRODUCT_COLUMNS.replace(" ", "")
+
+def _vector_literal(embedding: list) -> str:
+    return "[" + ",".join(str(float(x)) for x in embedding) + "]"
 
-import asyncio
 
 def get_all_products():
-    """Busca todos os produtos da tabela 'produtos'."""
-    response = supabase.table("produtos").select("*").execute()
+    """Busca todos os produtos da tabela 'produtos' (colunas da resposta)."""
+    response = get_supabase().table("produtos").select(_PRODUCT_COLUMNS_REST).execute()
     return response.data
 
-async def get_all_products_async():
-    return await asyncio.to_thread(get_all_products)
+async def get_all_products_async(timeout: float = None):
+    if _pg_pool is not None:
+        rows = await _pg_pool.fetch(f"SELECT {PRODUCT_COLUMNS} FROM produtos", timeout=timeout)
+        return [_row_to_dict(r) for r in rows]
+
+    rest = await _get_rest()
+    return await rest.select("produtos", columns=_PRODUCT_COLUMNS_REST, timeout=timeout)
 
 
 def search_products(query_term: str = None, category: str = None, limit: int = 5, offset: int = 0, tag: str = None, min_price: float = None, max_price: float = None, exact_price: float = None, order_by: str = None, min_price_exclusive: bool = False, max_price_exclusive: bool = False):
@@ -25,34 +164,34 @@ def search_products(query_term: str = None, category: str = None, limit: int = 5
     Busca produtos com filtros opcionais de nome, categoria, tag e preço.
     Suporta paginação via limit/offset.
     """
-    query = supabase.table("produtos").select("*")
-    
+    query = get_supabase().table("produtos").select(_PRODUCT_COLUMNS_REST)
+
     if category:
         query = query.eq("categoria", category)
 
     if tag:
         # Filtra se o array 'tags' contem a tag especificada
         query = query.contains("tags", [tag])
-    
+
     if min_price is not None:
         if min_price_exclusive:
             query = query.gt("preco", min_price)
         else:
             query = query.gte("preco", min_price)
-        
+
     if max_price is not None:
         if max_price_exclusive:
             query = query.lt("preco", max_price)
         else:
             query = query.lte("preco", max_price)
-        
+
     if exact_price is not None:
         query = query.eq("preco", exact_price)
-        
+
     if query_term:
         # Busca no nome OU na descrição (case insensitive)
         query = query.or_(f"nome.ilike.%{query_term}%,descricao.ilike.%{query_term}%")
-        
+
     # Ordenação
     if order_by == "price_asc":
         query = query.order("preco", desc=False)
@@ -60,7 +199,7 @@ def search_products(query_term: str = None, category: str = None, limit: int = 5
         query = query.order("preco", desc=True)
         # Se não tiver ordenação explicita, o Supabase já ordena por ID por padrão geralmente,
         # ou podemos forçar uma ordem se quisermos.
-        
+
     # Limita a quantidade de resultados e aplica offset
     # Limita a quantidade de resultados e aplica offset
     # range no supabase é (start, end) inclusive.
@@ -69,6 +208,46 @@ def search_products(query_term: str = None, category: str = None, limit: int = 5
     response = query.range(offset, offset + limit - 1).execute()
     return response.data
 
+async def _search_products_native(query_term: str = None, category: str = None, limit: int = 5, offset: int = 0, tag: str = None, min_price: float = None, max_price: float = None, exact_price: float = None, order_by: str = None, min_price_exclusive: bool = False, max_price_exclusive: bool = False, after: list = None, timeout: float = None):
+    """
+    Mesma busca do search_products, direto no pool assíncrono.
+    `after` = [valor de ordenação, id] da última linha vista: paginação por cursor
+    (keyset), com custo constante por página. Nesse caso `offset` é ignorado.
+    """
+    filters = build_product_filters(
+        query_term=query_term,
+        category=category,
+        tag=tag,
+        min_price=min_price,
+        max_price=max_price,
+        exact_price=exact_price,
+        min_price_exclusive=min_price_exclusive,
+        max_price_exclusive=max_price_exclusive,
+    )
+    order = order_for(order_by)
+    if after:
+        offset = 0
+
+    if _pg_pool is not None:
+        where, args = to_sql_where(filters)
+        keyset, args = keyset_sql(order, after, args)
+        sql = f"SELECT {PRODUCT_COLUMNS} FROM produtos WHERE {where} AND {keyset} ORDER BY {to_sql_order(order)}"
+        args.extend([limit, offset])
+        sql += f" LIMIT ${len(args) - 1} OFFSET ${len(args)}"
+        rows = await _pg_pool.fetch(sql, *args, timeout=timeout)
+        return [_row_to_dict(r) for r in rows]
+
+    rest = await _get_rest()
+    return await rest.select(
+        "produtos",
+        columns=_PRODUCT_COLUMNS_REST,
+        params=to_postgrest_params(filters) + keyset_postgrest_params(order, after),
+        order=to_postgrest_order(order),
+        limit=limit,
+        offset=offset,
+        timeout=timeout,
+    )
+
 def search_products_by_vector(query_embedding: list, match_threshold: float = 0.3, limit: int = 5):
     """
     Busca produtos usando similaridade de cosseno (RPC match_products).
@@ -79,28 +258,192 @@ def search_products_by_vector(query_embedding: list, match_threshold: float = 0.
             "match_threshold": match_threshold,
             "match_count": limit
         }
-        response = supabase.rpc("match_products", params).execute()
+        response = get_supabase().rpc("match_products", params).execute()
         return response.data
     except Exception as e:
         print(f"❌ [DB] Erro na busca vetorial: {e}")
         return []
 
-async def search_products_async(*args, **kwargs):
+# Vira False se a função match_products_page (sql/match_products_page.sql) não existir
+_vector_page_rpc_available = True
+
+async def _search_products_by_vector_page(query_embedding: list, match_threshold: float, limit: int, after, depth: int = 0, timeout: float = None):
+    """
+    Próxima página da busca vetorial depois de `after` = [similaridade, id].
+    Sem a função match_products_page no banco (ou sem similaridade nas linhas),
+    busca `depth + limit` resultados e descarta os `depth` já vistos.
+    """
+    global _vector_page_rpc_available
+    if _vector_page_rpc_available and after[0] is not None:
+        try:
+            if _pg_pool is not None:
+                rows = await _pg_pool.fetch(
+                    "SELECT * FROM match_products_page($1::vector, $2, $3, $4, $5)",
+                    _vector_literal(query_embedding), match_threshold, limit, after[0], after[1],
+                    timeout=timeout,
+                )
+                return [_row_to_dict(r) for r in rows]
+
+            rest = await _get_rest()
+            params = {
+                "query_embedding": query_embedding,
+                "match_threshold": match_threshold,
+                "match_count": limit,
+                "after_similarity": after[0],
+                "after_id": after[1],
+            }
+            return await rest.rpc("match_products_page", params, timeout=timeout) or []
+        except Exception as e:
+            print(f"⚠️ [DB] match_products_page indisponível ({e}). Paginando match_products em memória.")
+            _vector_page_rpc_available = False
+
+    rows = await _search_products_by_vector_native(query_embedding, match_threshold, depth + limit, timeout=timeout)
+    return rows[depth:depth + limit]
+
+async def _search_products_by_vector_native(query_embedding: list, match_threshold: float = 0.3, limit: int = 5, timeout: float = None):
+    try:
+        if _pg_pool is not None:
+            rows = await _pg_pool.fetch(
+                "SELECT * FROM match_products($1::vector, $2, $3)",
+                _vector_literal(query_embedding), match_threshold, limit,
+                timeout=timeout,
+            )
+            return [_row_to_dict(r) for r in rows]
+
+        rest = await _get_rest()
+        params = {
+            "query_embedding": query_embedding,
+            "match_threshold": match_threshold,
+            "match_count": limit
+        }
+        return await rest.rpc("match_products", params, timeout=timeout) or []
+    except Exception as e:
+        print(f"❌ [DB] Erro na busca vetorial: {e}")
+        return []
+
+from app.core.vector_snapshot import vector_index
+
+async def _search_products_by_vector_local(query_embedding: list, match_threshold: float, limit: int, after=None, depth: int = 0, timeout: float = None):
+    """
+    Busca vetorial no snapshot local (ver app/core/vector_snapshot.py) e
+    completa os dados dos produtos com uma consulta por id.
+    Retorna None se não houver snapshot (o chamador usa o banco).
+    """
+    if not vector_index.enabled or not query_embedding:
+        return None
+    hits = await asyncio.to_thread(vector_index.search, query_embedding, match_threshold, limit, after, depth)
+    if hits is None:
+        return None
+    if not hits:
+        return []
+
+    ids = [pid for pid, _ in hits]
+    try:
+        if _pg_pool is not None:
+            records = await _pg_pool.fetch(
+                f"SELECT {PRODUCT_COLUMNS} FROM produtos WHERE id = ANY($1::bigint[])",
+                ids,
+                timeout=timeout,
+            )
+            rows = [_row_to_dict(r) for r in records]
+        else:
+            rest = await _get_rest()
+            rows = await rest.select(
+                "produtos",
+                columns=_PRODUCT_COLUMNS_REST,
+                params=[("id", f"in.({','.join(str(i) for i in ids)})")],
+                timeout=timeout,
+            )
+    except Exception as e:
+        print(f"❌ [DB] Erro ao carregar produtos da busca vetorial local: {e}")
+        return None
+
+    # Produtos removidos depois do snapshot simplesmente somem do resultado
+    by_id = {row["id"]: row for row in rows}
+    return [dict(by_id[pid], similarity=score) for pid, score in hits if pid in by_id]
+
+from app.core.singleflight import SingleFlight
+from app.core import search_cache
+
+_search_flight = SingleFlight("search_products")
+_SEARCH_SIGNATURE = inspect.signature(_search_products_native)
+
+def _search_key(args, kwargs):
+    """Chave hashable com os filtros da busca (embedding vira tupla, timeout fica de fora)."""
+    items = []
+    for k, v in sorted(kwargs.items()):
+        if k == "timeout":
+            continue
+        if isinstance(v, list):
+            v = tuple(v)
+        items.append((k, v))
+    return (tuple(args), tuple(items))
+
+async def _search_products_uncoalesced(*args, **kwargs):
     if kwargs.get("is_vector"):
         # Remove argumento que não é da função original se necessário ou trata diferente
         embedding = kwargs.get("embedding")
         limit = kwargs.get("limit", 5)
+        # Snapshot local (mmap) quando disponível; senão, busca vetorial no banco
+        local = await _search_products_by_vector_local(
+            embedding, 0.3, limit, kwargs.get("after"), kwargs.get("depth", 0), timeout=kwargs.get("timeout")
+        )
+        if local is not None:
+            return local
         # thresholds podem ser ajustes finos futuros
-        return await asyncio.to_thread(search_products_by_vector, embedding, 0.3, limit)
-        
-    return await asyncio.to_thread(search_products, *args, **kwargs)
+        if kwargs.get("after"):
+            return await _search_products_by_vector_page(
+                embedding, 0.3, limit, kwargs["after"], kwargs.get("depth", 0), timeout=kwargs.get("timeout")
+            )
+        return await _search_products_by_vector_native(embedding, 0.3, limit, timeout=kwargs.get("timeout"))
+
+    return await _search_products_native(*args, **kwargs)
+
+def _page_key(args, kwargs):
+    """Chave do cache de páginas para esta busca (None se não for cacheável)."""
+    if kwargs.get("is_vector"):
+        if not kwargs.get("embedding"):
+            return None
+        return search_cache.vector_key(kwargs["embedding"], kwargs.get("limit", 5), 0.3, kwargs.get("after"))
+
+    bound = _SEARCH_SIGNATURE.bind(*args, **kwargs)
+    bound.apply_defaults()
+    params = bound.arguments
+    return search_cache.exact_key(params, params["limit"], params["offset"], params["after"])
+
+async def search_products_async(*args, **kwargs):
+    """
+    Busca com cache de páginas (invalidado pela versão do catálogo).
+    Buscas idênticas em andamento compartilham a mesma consulta ao Supabase.
+    """
+    page_key = _page_key(args, kwargs)
+    if page_key:
+        cached = search_cache.get_page(page_key)
+        if cached is not None:
+            return cached
+
+    data = await _search_flight.do(
+        _search_key(args, kwargs),
+        lambda: _search_products_uncoalesced(*args, **kwargs)
+    )
+    if page_key:
+        search_cache.set_page(page_key, data)
+    # Lista nova para cada chamador (as linhas são só lidas)
+    return list(data)
 
 
 from app.core.cache import cache
 
+def _collect_categories(rows) -> list:
+    categories = set()
+    for item in rows:
+        if item.get("categoria"):
+            categories.add(item.get("categoria"))
+    return list(categories)
+
 def get_all_categories():
     """Retorna lista de categorias únicas existentes."""
-    
+
     # 1. Tentar pegar do Cache
     cached_categories = cache.get_cache("categories_list")
     if cached_categories:
@@ -109,21 +452,40 @@ def get_all_categories():
 
     # 2. Se não, pegar do Banco
     print("🐢 [DB] Consultando categorias no Supabase...")
-    response = supabase.table("produtos").select("categoria").execute()
-    categories = set()
-    for item in response.data:
-        if item.get("categoria"):
-            categories.add(item.get("categoria"))
-    
-    final_list = list(categories)
-    
+    response = get_supabase().table("produtos").select("categoria").execute()
+    final_list = _collect_categories(response.data)
+
     # 3. Salvar no Cache (TTL 1 hora)
     cache.set_cache("categories_list", final_list, ttl_seconds=3600)
-    
+
     return final_list
 
-async def get_all_categories_async():
-    return await asyncio.to_thread(get_all_categories)
+async def get_all_categories_async(timeout: float = None, version: int = None):
+    """
+    Versão assíncrona. Se `version` (versão do catálogo) for informada,
+    o cache só é aceito se tiver sido gerado para essa mesma versão.
+    """
+    cached_categories = cache.get_cache("categories_list")
+    if cached_categories and (version is None or cache.get_cache("categories_version") == version):
+        print("⚡ [DB] Recuperado categorias do Cache.")
+        return cached_categories
+
+    print("🐢 [DB] Consultando categorias no Supabase...")
+    if _pg_pool is not None:
+        rows = await _pg_pool.fetch(
+            "SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL",
+            timeout=timeout,
+        )
+        final_list = [r["categoria"] for r in rows]
+    else:
+        rest = await _get_rest()
+        rows = await rest.select("produtos", columns="categoria", timeout=timeout)
+        final_list = _collect_categories(rows)
+
+    cache.set_cache("categories_list", final_list, ttl_seconds=3600)
+    if version is not None:
+        cache.set_cache("categories_version", version, ttl_seconds=3600)
+    return final_list
 
 
 def save_memory(session_id: str, role: str, content: str):
@@ -134,18 +496,38 @@ def save_memory(session_id: str, role: str, content: str):
            "role": role, # 'user' ou 'assistant'
            "content": content
         }
-        supabase.table("memoria_chat").insert(data).execute()
+        get_supabase().table("memoria_chat").insert(data).execute()
     except Exception as e:
         print(f"Erro ao salvar memoria: {e}")
 
-async def save_memory_async(session_id: str, role: str, content: str):
-    return await asyncio.to_thread(save_memory, session_id, role, content)
+async def save_memory_async(session_id: str, role: str, content: str, timeout: float = None):
+    try:
+        if _pg_pool is not None:
+            await _pg_pool.execute(
+                "INSERT INTO memoria_chat (session_id, role, content) VALUES ($1, $2, $3)",
+                session_id, role, content,
+                timeout=timeout,
+            )
+            return
+
+        rest = await _get_rest()
+        data = {
+            "session_id": session_id,
+            "role": role, # 'user' ou 'assistant'
+            "content": content
+        }
+        await rest.insert("memoria_chat", data, timeout=timeout)
+    except (CircuitOpen, DeadlineExceeded) as e:
+        metrics.inc("degraded.memory_not_saved")
+        print(f"⚠️ [DB] Memória não salva: {e}")
+    except Exception as e:
+        print(f"Erro ao salvar memoria: {e}")
 
 
 def get_memory(session_id: str, limit: int = 10):
     """Recupera as últimas mensagens do usuário."""
     try:
-        response = supabase.table("memoria_chat")\
+        response = get_supabase().table("memoria_chat")\
             .select("*")\
             .eq("session_id", session_id)\
             .order("created_at", desc=True)\
@@ -157,6 +539,143 @@ def get_memory(session_id: str, limit: int = 10):
         print(f"Erro ao ler memoria: {e}")
         return []
 
-async def get_memory_async(session_id: str, limit: int = 10):
-    return await asyncio.to_thread(get_memory, session_id, limit)
+async def get_memory_async(session_id: str, limit: int = 10, timeout: float = None):
+    try:
+        if _pg_pool is not None:
+            rows = await _pg_pool.fetch(
+                "SELECT * FROM memoria_chat WHERE session_id = $1 ORDER BY created_at DESC LIMIT $2",
+                session_id, limit,
+                timeout=timeout,
+            )
+            data = [_row_to_dict(r) for r in rows]
+        else:
+            rest = await _get_rest()
+            data = await rest.select(
+                "memoria_chat",
+                params=[("session_id", f"eq.{session_id}")],
+                order="created_at.desc",
+                limit=limit,
+                timeout=timeout,
+            )
+        # Inverter para ordem cronológica (msg antiga -> msg nova)
+        return data[::-1]
+    except Exception as e:
+        print(f"Erro ao ler memoria: {e}")
+        return []
+
 
+# --- Resumo contínuo da sessão (sql/memoria_resumo.sql) ---
+# Vira False se a tabela não existir: o /query segue só com as mensagens recentes
+_summary_table_available = True
+_MISSING_TABLE_CODES = {"42P01", "PGRST205"}
+
+def _as_datetime(value):
+    # asyncpg exige datetime para timestamptz (o PostgREST devolve ISO 8601)
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return value
+
+def _summary_table_missing(e: Exception) -> bool:
+    global _summary_table_available
+    missing = isinstance(e, PostgrestError) and (e.code in _MISSING_TABLE_CODES or e.status_code == 404)
+    missing = missing or type(e).__name__ == "UndefinedTableError"
+    if missing:
+        print("⚠️ [DB] Tabela memoria_resumo não encontrada. Resumo de conversa desabilitado.")
+        _summary_table_available = False
+    return missing
+
+async def get_session_summary_async(session_id: str, timeout: float = None):
+    """Linha de memoria_resumo da sessão (summary, summarized_at, last_filters) ou None."""
+    if not _summary_table_available:
+        return None
+    try:
+        if _pg_pool is not None:
+            row = await _pg_pool.fetchrow(
+                "SELECT * FROM memoria_resumo WHERE session_id = $1",
+                session_id,
+                timeout=timeout,
+            )
+            if row is None:
+                return None
+            data = _row_to_dict(row)
+            if data.get("summarized_at") is not None:
+                data["summarized_at"] = data["summarized_at"].isoformat()
+            # asyncpg devolve jsonb como texto (o PostgREST já devolve o objeto)
+            if isinstance(data.get("last_filters"), str):
+                data["last_filters"] = json.loads(data["last_filters"])
+            return data
+
+        rest = await _get_rest()
+        rows = await rest.select(
+            "memoria_resumo",
+            params=[("session_id", f"eq.{session_id}")],
+            limit=1,
+            timeout=timeout,
+        )
+        return rows[0] if rows else None
+    except Exception as e:
+        if not _summary_table_missing(e):
+            print(f"Erro ao ler resumo da sessão: {e}")
+        return None
+
+async def save_session_summary_async(session_id: str, fields: dict, timeout: float = None):
+    """Upsert só das colunas informadas (summary/summarized_at ou last_filters)."""
+    if not _summary_table_available:
+        return
+    try:
+        if _pg_pool is not None:
+            columns = list(fields)
+            values = [
+                json.dumps(v) if k == "last_filters" else (_as_datetime(v) if k == "summarized_at" else v)
+                for k, v in fields.items()
+            ]
+            placeholders = ", ".join(
+                f"${i + 2}::jsonb" if c == "last_filters" else (f"${i + 2}::timestamptz" if c == "summarized_at" else f"${i + 2}")
+                for i, c in enumerate(columns)
+            )
+            updates = ", ".join(f"{c} = excluded.{c}" for c in columns)
+            await _pg_pool.execute(
+                f"INSERT INTO memoria_resumo (session_id, {', '.join(columns)}, updated_at) "
+                f"VALUES ($1, {placeholders}, now()) "
+                f"ON CONFLICT (session_id) DO UPDATE SET {updates}, updated_at = now()",
+                session_id, *values,
+                timeout=timeout,
+            )
+            return
+
+        rest = await _get_rest()
+        row = {"session_id": session_id, **fields, "updated_at": "now"}
+        await rest.insert("memoria_resumo", row, timeout=timeout, upsert=True, on_conflict="session_id")
+    except Exception as e:
+        if not _summary_table_missing(e):
+            print(f"Erro ao salvar resumo da sessão: {e}")
+
+async def get_memory_since_async(session_id: str, since: str = None, limit: int = 50, timeout: float = None):
+    """Mensagens da sessão depois de `since` (created_at), em ordem cronológica."""
+    try:
+        if _pg_pool is not None:
+            rows = await _pg_pool.fetch(
+                "SELECT * FROM memoria_chat WHERE session_id = $1 AND ($2::timestamptz IS NULL OR created_at > $2::timestamptz) "
+                "ORDER BY created_at LIMIT $3",
+                session_id, _as_datetime(since), limit,
+                timeout=timeout,
+            )
+            data = [_row_to_dict(r) for r in rows]
+            for row in data:
+                row["created_at"] = row["created_at"].isoformat()
+            return data
+
+        rest = await _get_rest()
+        params = [("session_id", f"eq.{session_id}")]
+        if since:
+            params.append(("created_at", f"gt.{since}"))
+        return await rest.select(
+            "memoria_chat",
+            params=params,
+            order="created_at.asc",
+            limit=limit,
+            timeout=timeout,
+        )
+    except Exception as e:
+        print(f"Erro ao ler memoria: {e}")
+        return []
@@ -0,0 +1,197 @@
+"""
+Filtros da busca de produtos em formato neutro, com tradução para
+PostgREST (query string) e para SQL (asyncpg).
+
+Cada filtro é uma tupla (coluna, operador, valor):
+- eq / gt / gte / lt / lte: comparação simples
+- cs: array contém (tags)
+- text: ILIKE no nome OU na descrição
+"""
+
+TEXT_SEARCH_COLUMNS = ("nome", "descricao")
+
+_SQL_OPERATORS = {"eq": "=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+
+
+def build_product_filters(query_term: str = None, category: str = None, tag: str = None, min_price: float = None, max_price: float = None, exact_price: float = None, min_price_exclusive: bool = False, max_price_exclusive: bool = False) -> list:
+    """Monta a lista de filtros da busca exata (mesma semântica do search_products)."""
+    filters = []
+
+    if category:
+        filters.append(("categoria", "eq", category))
+
+    if tag:
+        filters.append(("tags", "cs", [tag]))
+
+    if min_price is not None:
+        filters.append(("preco", "gt" if min_price_exclusive else "gte", min_price))
+
+    if max_price is not None:
+        filters.append(("preco", "lt" if max_price_exclusive else "lte", max_price))
+
+    if exact_price is not None:
+        filters.append(("preco", "eq", exact_price))
+
+    if query_term:
+        filters.append(("*", "text", query_term))
+
+    return filters
+
+
+def order_for(order_by: str = None) -> list:
+    """
+    Ordenação como lista de (coluna, desc).
+    Sempre termina em `id` para a ordem ser total (necessário para paginação por cursor).
+    Produtos sem preço ficam no fim nos dois sentidos.
+    """
+    if order_by == "price_asc":
+        return [("preco", False), ("id", False)]
+    if order_by == "price_desc":
+        return [("preco", True), ("id", False)]
+    return [("id", False)]
+
+
+def sort_key(row: dict, order: list) -> list:
+    """Posição de uma linha na ordenação: [valor da coluna de ordenação, id]."""
+    sort_column = order[0][0] if len(order) > 1 else None
+    return [row.get(sort_column) if sort_column else None, row.get("id")]
+
+
+def row_matches(filters: list, row: dict) -> bool:
+    """Avalia os filtros em memória (mesma semântica do banco) para uma linha já carregada."""
+    for column, op, value in filters:
+        if op == "text":
+            needle = str(value).lower()
+            if not any(needle in str(row.get(col) or "").lower() for col in TEXT_SEARCH_COLUMNS):
+                return False
+            continue
+
+        current = row.get(column)
+        if current is None:
+            return False
+        if op == "cs":
+            if not set(value).issubset(set(current)):
+                return False
+        elif op == "eq":
+            if current != value:
+                return False
+        elif op == "gt":
+            if not current > value:
+                return False
+        elif op == "gte":
+            if not current >= value:
+                return False
+        elif op == "lt":
+            if not current < value:
+                return False
+        elif op == "lte":
+            if not current <= value:
+                return False
+    return True
+
+
+# --- PostgREST ---
+
+def _quote(value) -> str:
+    """Aspas no padrão PostgREST para valores dentro de listas/or()."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def to_postgrest_params(filters: list) -> list:
+    """Converte filtros em parâmetros de query string do PostgREST."""
+    params = []
+    for column, op, value in filters:
+        if op == "cs":
+            params.append((column, "cs.{" + ",".join(_quote(v) for v in value) + "}"))
+        elif op == "text":
+            pattern = _quote(f"*{value}*")
+            conditions = ",".join(f"{col}.ilike.{pattern}" for col in TEXT_SEARCH_COLUMNS)
+            params.append(("or", f"({conditions})"))
+        else:
+            params.append((column, f"{op}.{value}"))
+    return params
+
+
+def to_postgrest_order(order: list) -> str:
+    return ",".join(
+        f"{col}.{'desc' if desc else 'asc'}" + ("" if col == "id" else ".nullslast")
+        for col, desc in order
+    )
+
+
+def keyset_postgrest_params(order: list, after) -> list:
+    """
+    Filtro de cursor (keyset): linhas estritamente depois de `after` = [valor, id]
+    na ordenação `order` (ver order_for).
+    """
+    if not after:
+        return []
+    value, last_id = after
+    if len(order) == 1:
+        return [("id", f"gt.{last_id}")]
+
+    column, desc = order[0]
+    if value is None:
+        # Já estamos no bloco dos nulos (fim da lista)
+        return [(column, "is.null"), ("id", f"gt.{last_id}")]
+
+    op = "lt" if desc else "gt"
+    return [("and", f"(or({column}.{op}.{value},and({column}.eq.{value},id.gt.{last_id}),{column}.is.null))")]
+
+
+# --- SQL (asyncpg) ---
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def to_sql_where(filters: list, args: list = None):
+    """
+    Converte filtros em cláusula WHERE com placeholders ($1, $2...).
+    Retorna (sql, args). `args` pode trazer parâmetros já usados pela query.
+    """
+    args = list(args or [])
+    clauses = []
+    for column, op, value in filters:
+        if op == "cs":
+            args.append(list(value))
+            clauses.append(f"{column} @> ${len(args)}::text[]")
+        elif op == "text":
+            args.append(f"%{_escape_like(value)}%")
+            idx = len(args)
+            clauses.append("(" + " OR ".join(f"{col} ILIKE ${idx}" for col in TEXT_SEARCH_COLUMNS) + ")")
+        else:
+            args.append(value)
+            clauses.append(f"{column} {_SQL_OPERATORS[op]} ${len(args)}")
+
+    sql = " AND ".join(clauses) if clauses else "TRUE"
+    return sql, args
+
+
+def to_sql_order(order: list) -> str:
+    return ", ".join(
+        f"{col} {'DESC' if desc else 'ASC'}" + ("" if col == "id" else " NULLS LAST")
+        for col, desc in order
+    )
+
+
+def keyset_sql(order: list, after, args: list):
+    """Mesmo filtro de keyset_postgrest_params em SQL. Retorna (cláusula, args)."""
+    args = list(args)
+    if not after:
+        return "TRUE", args
+    value, last_id = after
+    args.append(last_id)
+    id_idx = len(args)
+    if len(order) == 1:
+        return f"id > ${id_idx}", args
+
+    column, desc = order[0]
+    if value is None:
+        return f"({column} IS NULL AND id > ${id_idx})", args
+
+    args.append(value)
+    val_idx = len(args)
+    op = "<" if desc else ">"
+    return f"({column} {op} ${val_idx} OR ({column} = ${val_idx} AND id > ${id_idx}) OR {column} IS NULL)", args
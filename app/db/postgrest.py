@@ -0,0 +1,97 @@
+"""
+Cliente PostgREST assíncrono (Supabase REST) sobre um pool de conexões httpx.
+Substitui o supabase-py + asyncio.to_thread nas rotas da API.
+"""
+import json
+
+import httpx
+
+from app.core.deadline import timeout_for
+
+
+class PostgrestError(Exception):
+    """Erro retornado pelo PostgREST (status HTTP >= 400)."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"PostgREST {status_code}: {body}")
+        self.status_code = status_code
+        self.body = body
+        self.code = None
+        try:
+            self.code = json.loads(body).get("code")
+        except Exception:
+            pass
+
+
+def is_dependency_failure(e: Exception) -> bool:
+    """Erros 4xx (exceto 429) são da consulta, não do Supabase: não abrem o circuito."""
+    return not (isinstance(e, PostgrestError) and e.status_code < 500 and e.status_code != 429)
+
+
+class AsyncPostgrest:
+    def __init__(self, url: str, key: str, timeout: float = 10.0, max_connections: int = 20, breaker=None):
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.default_timeout = timeout
+        self.breaker = breaker # CircuitBreaker opcional (app/core/circuit_breaker.py)
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "apikey": key,
+                "Authorization": f"Bearer {key}",
+                "Content-Type": "application/json",
+            },
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+        )
+
+    async def _request(self, method: str, path: str, timeout: float = None, **kwargs):
+        if self.breaker is not None:
+            return await self.breaker.call(
+                lambda: self._send(method, path, timeout, **kwargs),
+                is_failure=is_dependency_failure,
+            )
+        return await self._send(method, path, timeout, **kwargs)
+
+    async def _send(self, method: str, path: str, timeout: float = None, **kwargs):
+        # Nunca além do prazo da requisição em andamento (app/core/deadline.py)
+        response = await self._client.request(
+            method,
+            path,
+            timeout=timeout_for(timeout if timeout is not None else self.default_timeout),
+            **kwargs
+        )
+        if response.status_code >= 400:
+            raise PostgrestError(response.status_code, response.text)
+        if not response.content:
+            return None
+        return response.json()
+
+    async def select(self, table: str, columns: str = "*", params: list = None, order: str = None, limit: int = None, offset: int = None, timeout: float = None) -> list:
+        """SELECT com filtros já no formato PostgREST (lista de (chave, valor))."""
+        query = [("select", columns)]
+        query.extend(params or [])
+        if order:
+            query.append(("order", order))
+        if limit is not None:
+            query.append(("limit", str(limit)))
+        if offset:
+            query.append(("offset", str(offset)))
+        return await self._request("GET", f"/{table}", timeout=timeout, params=query) or []
+
+    async def insert(self, table: str, rows, timeout: float = None, upsert: bool = False, on_conflict: str = None):
+        """INSERT (ou UPSERT) sem retornar as linhas."""
+        prefer = "return=minimal"
+        if upsert:
+            prefer += ",resolution=merge-duplicates"
+        params = [("on_conflict", on_conflict)] if on_conflict else None
+        return await self._request("POST", f"/{table}", timeout=timeout, json=rows, params=params, headers={"Prefer": prefer})
+
+    async def rpc(self, function: str, payload: dict, timeout: float = None):
+        """Chama uma função Postgres exposta pelo PostgREST."""
+        return await self._request("POST", f"/rpc/{function}", timeout=timeout, json=payload)
+
+    async def aclose(self):
+        await self._client.aclose()
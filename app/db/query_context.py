@@ -0,0 +1,182 @@
+"""
+Wrapper tipado da RPC `query_context` (ver sql/query_context.sql).
+
+Uma única chamada ao banco devolve memória da sessão, versão do catálogo e
+os resultados das buscas exata e vetorial. Se a função não existir no banco
+(ou estiver desabilitada via USE_QUERY_CONTEXT_RPC), cai no caminho antigo
+com várias chamadas em paralelo.
+"""
+import asyncio
+import json
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from app.config import settings
+from app.core import search_cache
+from app.core.singleflight import SingleFlight
+from app.db import database
+from app.db.database import (
+    get_memory_async,
+    get_session_summary_async,
+    get_all_categories_async,
+    search_products_async,
+)
+from app.db.postgrest import PostgrestError
+from app.core.circuit_breaker import CircuitOpen
+from app.core.deadline import DeadlineExceeded
+
+# Códigos do PostgREST para "função não encontrada"
+_MISSING_FUNCTION_CODES = {"PGRST202", "42883"}
+
+# Vira False na primeira vez que o banco responde que a função não existe
+_rpc_available = True
+
+_context_flight = SingleFlight("query_context")
+
+
+@dataclass
+class QueryContext:
+    memory: List[dict] = field(default_factory=list)
+    summary: Optional[dict] = None # Linha de memoria_resumo (resumo + última busca ativa)
+    categories: Optional[List[str]] = None
+    catalog_version: Optional[int] = None
+    exact: Optional[List[dict]] = None
+    vector: Optional[List[dict]] = None
+    round_trips: int = 0
+
+
+def _rpc_enabled() -> bool:
+    return settings.USE_QUERY_CONTEXT_RPC and _rpc_available
+
+
+async def _call_rpc(payload: dict, timeout: float = None) -> Optional[dict]:
+    """Chama a RPC. Retorna None se ela não estiver disponível (para usar o fallback)."""
+    global _rpc_available
+    try:
+        rest = await database._get_rest()
+        return await rest.rpc("query_context", payload, timeout=timeout)
+    except PostgrestError as e:
+        if e.code in _MISSING_FUNCTION_CODES or e.status_code == 404:
+            print("⚠️ [DB] RPC query_context não encontrada. Usando múltiplas chamadas.")
+            _rpc_available = False
+        else:
+            print(f"❌ [DB] Erro na RPC query_context: {e}")
+        return None
+    except (CircuitOpen, DeadlineExceeded):
+        # Sem banco ou sem tempo: o fallback com várias chamadas não ajudaria
+        raise
+    except Exception as e:
+        print(f"❌ [DB] Erro na RPC query_context: {e}")
+        return None
+
+
+async def fetch_session_context(session_id: str, memory_limit: int = 10, timeout: float = None) -> QueryContext:
+    """
+    Contexto antes do LLM: memória recente + resumo da sessão + categorias.
+    Com a RPC, categorias só são buscadas de novo quando a versão do catálogo muda.
+    """
+    if _rpc_enabled():
+        data = await _call_rpc(
+            {"p_session_id": session_id, "p_memory_limit": memory_limit},
+            timeout=timeout,
+        )
+        if data is not None:
+            version = data.get("catalog_version")
+            search_cache.observe_db_version(version)
+            if "summary" in data:
+                categories = await get_all_categories_async(timeout=timeout, version=version)
+                summary = data["summary"] if settings.SUMMARY_ENABLED else None
+            else:
+                # Função antiga (sem memoria_resumo): resumo em paralelo
+                categories, summary = await asyncio.gather(
+                    get_all_categories_async(timeout=timeout, version=version),
+                    _get_summary(session_id, timeout),
+                )
+            return QueryContext(
+                memory=data.get("memory") or [],
+                summary=summary,
+                categories=categories,
+                catalog_version=version,
+                round_trips=1,
+            )
+
+    memory, categories, summary = await asyncio.gather(
+        get_memory_async(session_id, memory_limit, timeout=timeout),
+        get_all_categories_async(timeout=timeout),
+        _get_summary(session_id, timeout),
+    )
+    return QueryContext(memory=memory, summary=summary, categories=categories, round_trips=3 if settings.SUMMARY_ENABLED else 2)
+
+
+async def _get_summary(session_id: str, timeout: float = None):
+    if not settings.SUMMARY_ENABLED:
+        return None
+    return await get_session_summary_async(session_id, timeout=timeout)
+
+
+async def fetch_search_context(filters: dict, limit: int, offset: int = 0, embedding: list = None, match_threshold: float = 0.3, match_count: int = None, timeout: float = None, after: list = None, vector_after: list = None, vector_depth: int = 0, include_exact: bool = True) -> QueryContext:
+    """
+    Busca exata (com os mesmos filtros de search_products) + busca vetorial opcional.
+    Paginação por offset ou por cursor: `after` = [valor de ordenação, id] na exata,
+    `vector_after` = [similaridade, id] na vetorial. `include_exact=False` pula a
+    busca exata (perna já esgotada). Chamadas idênticas em andamento são coalescidas.
+    """
+    match_count = match_count or limit
+    # Sem similaridade no cursor a RPC não sabe continuar a perna vetorial
+    rpc_vector_ok = not vector_after or vector_after[0] is not None
+
+    if _rpc_enabled() and rpc_vector_ok:
+        # Páginas já em cache dispensam a ida ao banco
+        exact_key = search_cache.exact_key(filters, limit, offset, after) if include_exact else None
+        vector_key = search_cache.vector_key(embedding, match_count, match_threshold, vector_after) if embedding else None
+        exact = search_cache.get_page(exact_key) if exact_key else []
+        vector = search_cache.get_page(vector_key) if vector_key else None
+        if exact is not None and (not embedding or vector is not None):
+            return QueryContext(exact=exact, vector=vector, round_trips=0)
+
+        payload = {
+            "p_memory_limit": 0,
+            "p_filters": {k: v for k, v in filters.items() if v is not None} if include_exact else None,
+            "p_limit": limit,
+            "p_offset": offset,
+            "p_embedding": embedding,
+            "p_match_threshold": match_threshold,
+            "p_match_count": match_count,
+            "p_after": {"sort": after[0], "id": after[1]} if after else None,
+            "p_vector_after": {"similarity": vector_after[0], "id": vector_after[1]} if vector_after else None,
+        }
+        key = json.dumps(payload, sort_keys=True, default=str)
+        data = await _context_flight.do(key, lambda: _call_rpc(payload, timeout=timeout))
+        if data is not None:
+            search_cache.observe_db_version(data.get("catalog_version"))
+            exact = list(data.get("exact") or [])
+            vector = list(data.get("vector") or []) if embedding else None
+            # Chaves recalculadas: a versão pode ter mudado com esta resposta
+            if include_exact:
+                search_cache.set_page(search_cache.exact_key(filters, limit, offset, after), exact)
+            if embedding:
+                search_cache.set_page(search_cache.vector_key(embedding, match_count, match_threshold, vector_after), vector)
+            return QueryContext(
+                catalog_version=data.get("catalog_version"),
+                exact=exact,
+                vector=vector,
+                round_trips=1,
+            )
+
+    tasks = []
+    if include_exact:
+        tasks.append(search_products_async(limit=limit, offset=offset, after=after, timeout=timeout, **filters))
+    if embedding:
+        tasks.append(search_products_async(
+            is_vector=True,
+            embedding=embedding,
+            limit=match_count,
+            after=vector_after,
+            depth=vector_depth,
+            timeout=timeout
+        ))
+    results = await asyncio.gather(*tasks)
+
+    exact = results.pop(0) if include_exact else []
+    vector = results.pop(0) if embedding else None
+    return QueryContext(exact=exact, vector=vector, round_trips=len(tasks))
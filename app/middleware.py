@@ -4,6 +4,8 @@ from starlette.types import ASGIApp
 import time
 import uuid
 from app.logger import logger
+from app.core.profiling import profiler
+from app.core.security import is_debug_key
 import json
 
 class LoggingMiddleware(BaseHTTPMiddleware):
@@ -101,3 +103,41 @@ class LoggingMiddleware(BaseHTTPMiddleware):
             
             # Re-lançar exceção
             raise
+
+
+class ProfilingMiddleware:
+    """
+    Perfila requisições sob demanda (ver app.core.profiling): as próximas N armadas em
+    /debug/profile ou as que trazem X-Profile com uma X-Debug-Key válida.
+    ASGI puro (sem BaseHTTPMiddleware): fora de um perfil, custa só a checagem do arm e dos headers.
+    Só é instalado quando DEBUG_API_KEY está configurada.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        wanted = profiler.take_armed(path)
+        if not wanted:
+            headers = dict(scope["headers"])
+            wanted = b"x-profile" in headers and is_debug_key(headers.get(b"x-debug-key", b"").decode())
+        if not wanted:
+            return await self.app(scope, receive, send)
+
+        profile_id = profiler.start(f"{scope['method']} {path}")
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", str(profile_id).encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profiler.stop(profile_id, status)
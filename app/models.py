@@ -1,9 +1,73 @@
-from pydantic import BaseModel
-from typing import List, Optional, Any
+from dataclasses import dataclass
+from pydantic import BaseModel, field_validator
+from typing import List, Optional, Any, Literal
 
 class UserMessageRequest(BaseModel):
     session_id: str
     message: str
+    cursor: Optional[str] = None # Cursor da página anterior (next_cursor), para continuar a busca
+
+class ProductsChangedRequest(BaseModel):
+    """
+    Aviso de produtos alterados: lista de ids ou payload do Database Webhook
+    do Supabase ({"type", "table", "record", "old_record"}).
+    """
+    ids: Optional[List[int]] = None
+    type: Optional[str] = None # INSERT / UPDATE / DELETE
+    table: Optional[str] = None
+    record: Optional[dict] = None
+    old_record: Optional[dict] = None
+
+    def product_ids(self) -> List[int]:
+        ids = list(self.ids or [])
+        for row in (self.record, self.old_record):
+            if row and row.get("id") is not None:
+                ids.append(row["id"])
+        return ids
+
+class Intent(BaseModel):
+    """
+    Intenção extraída da mensagem pelo LLM (ver INTENT_RESPONSE_SCHEMA em app/core/ai.py).
+    Campos ausentes ficam com o padrão; valores fora do esperado são normalizados.
+    """
+    type: Literal["search_product", "search_category", "conversation"] = "conversation"
+    term: Optional[str] = None
+    tag: Optional[str] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    price_exact: Optional[float] = None
+    price_min_exclusive: bool = False
+    price_max_exclusive: bool = False
+    page: int = 1
+    sort: Optional[Literal["price_asc", "price_desc"]] = None
+    ai_reply: str = ""
+    is_category_list: bool = False
+    server_busy: bool = False # Fila do LLM cheia (não vem do modelo)
+
+    @field_validator("term", "tag", mode="before")
+    @classmethod
+    def _blank_to_none(cls, value):
+        if isinstance(value, str) and value.strip().lower() in ("", "null", "none"):
+            return None
+        return value
+
+    @field_validator("page", mode="before")
+    @classmethod
+    def _valid_page(cls, value):
+        try:
+            return max(int(value), 1)
+        except (TypeError, ValueError):
+            return 1
+
+    @field_validator("price_min_exclusive", "price_max_exclusive", "is_category_list", mode="before")
+    @classmethod
+    def _null_to_false(cls, value):
+        return False if value is None else value
+
+    @field_validator("ai_reply", mode="before")
+    @classmethod
+    def _null_to_empty(cls, value):
+        return "" if value is None else value
 
 class Product(BaseModel):
     id: int
@@ -13,10 +77,41 @@ class Product(BaseModel):
     tags: Optional[List[str]] = None
     preco: Optional[float] = None 
 
+@dataclass(slots=True)
+class ProductRow:
+    """
+    Produto da resposta do /query (mesmos campos de Product), montado direto da
+    linha do banco sem validação do Pydantic. Serializado nativamente pelo orjson.
+    """
+    id: int
+    nome: str
+    descricao: Optional[str] = None
+    categoria: Optional[str] = None
+    tags: Optional[List[str]] = None
+    preco: Optional[float] = None
+
+    @classmethod
+    def from_row(cls, row: dict) -> Optional["ProductRow"]:
+        """Converte a linha (PostgREST, asyncpg ou cache). None se faltar id ou nome."""
+        product_id = row.get("id")
+        nome = row.get("nome", "Sem nome")
+        if product_id is None or nome is None:
+            return None
+        preco = row.get("preco")
+        return cls(
+            int(product_id),
+            str(nome),
+            row.get("descricao"),
+            row.get("categoria"),
+            row.get("tags"),
+            None if preco is None else float(preco),
+        )
+
 class ProductResponse(BaseModel):
     interpreted_query: str 
     ai_message: str # Mensagem da IA
     is_category_list: bool = False # Indica se a IA listou as categorias disponíveis
     has_more: bool = False # Indica se existem mais produtos nessa categoria/busca
     server_busy: bool = False # Indica se o servidor estava ocupado (fila cheia)
+    next_cursor: Optional[str] = None # Cursor opaco da próxima página (quando has_more)
     products: List[Product]
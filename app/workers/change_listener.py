@@ -0,0 +1,102 @@
+"""
+Tarefas de background da API ligadas à fila de alterações de produtos.
+
+- listen_product_changes: LISTEN no Postgres (sql/products_changed_notify.sql)
+  e enfileira cada id notificado. Precisa de conexão direta (DATABASE_URL).
+  Só a réplica que detém o lease escuta: com todas escutando, cada alteração
+  entraria na fila uma vez por réplica.
+- consume_in_process: sem Redis não há fila compartilhada com o worker, então a
+  própria API processa os ids enfileirados (geração dos embeddings em thread).
+"""
+import asyncio
+
+from app.config import settings
+from app.core.cache import cache
+from app.core.change_queue import change_queue
+from app.core.leader import LeaseLock
+
+# Intervalo para checar/reabrir a conexão do LISTEN (e renovar o lease)
+_RECONNECT_SECONDS = 5
+# Lease do listener: se a réplica cair, outra assume depois disso
+_LEASE_TTL_SECONDS = 15
+
+
+def _on_notify(connection, pid, channel, payload):
+    try:
+        change_queue.publish([int(payload)])
+    except ValueError:
+        print(f"⚠️ [LISTEN] Payload inválido no canal {channel}: {payload!r}")
+
+
+async def _check_trigger_channel(connection, channel: str):
+    """Avisa se o trigger do banco notifica outro canal (o LISTEN nunca receberia nada)."""
+    definition = await connection.fetchval(
+        "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgname = 'produtos_notify_change' AND NOT tgisinternal"
+    )
+    if definition is None:
+        print("⚠️ [LISTEN] Trigger produtos_notify_change não encontrado (sql/products_changed_notify.sql).")
+    elif f"'{channel}'" not in definition:
+        print(f"⚠️ [LISTEN] O trigger notifica outro canal, não '{channel}': {definition}")
+
+
+async def listen_product_changes():
+    """Mantém um LISTEN aberto no canal PRODUCTS_NOTIFY_CHANNEL (reconecta se cair)."""
+    import asyncpg
+
+    channel = settings.PRODUCTS_NOTIFY_CHANNEL
+    # Sem Redis não há coordenação: cada réplica escuta (e enfileira na própria fila local)
+    lease = LeaseLock(f"notify-listener:{channel}", _LEASE_TTL_SECONDS, cache.redis_client if cache.use_redis else None)
+    while True:
+        if not await asyncio.to_thread(lease.try_acquire):
+            # Outra réplica está escutando
+            await asyncio.sleep(_LEASE_TTL_SECONDS / 3)
+            continue
+        connection = None
+        try:
+            connection = await asyncpg.connect(settings.DATABASE_URL, statement_cache_size=0)
+            await _check_trigger_channel(connection, channel)
+            await connection.add_listener(channel, _on_notify)
+            print(f"👂 [LISTEN] Escutando alterações de produtos no canal '{channel}'.")
+            while not connection.is_closed():
+                await asyncio.sleep(_RECONNECT_SECONDS)
+                if not await asyncio.to_thread(lease.renew):
+                    print("⚠️ [LISTEN] Lease do listener perdido. Outra réplica assume o LISTEN.")
+                    break
+            else:
+                print("⚠️ [LISTEN] Conexão encerrada. Reconectando...")
+        except asyncio.CancelledError:
+            lease.release()
+            raise
+        except Exception as e:
+            print(f"⚠️ [LISTEN] Falha no LISTEN ({e}). Tentando de novo em {_RECONNECT_SECONDS}s.")
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(_RECONNECT_SECONDS)
+
+
+async def consume_in_process():
+    """Consome a fila local (sem Redis) dentro da API, em lotes deduplicados."""
+    # Import tardio: o módulo do worker puxa o cliente síncrono do Supabase
+    from app.workers.embeddings_worker import sync_changed_products
+
+    print("⚙️ [QUEUE] Sem Redis: alterações de produtos processadas dentro da API.")
+    while True:
+        batch = await asyncio.to_thread(change_queue.consume, None, 1000)
+        if not len(batch):
+            continue
+        try:
+            await asyncio.to_thread(sync_changed_products, batch.product_ids)
+            change_queue.ack(batch)
+        except Exception as e:
+            print(f"❌ [QUEUE] Erro ao processar alterações {batch.product_ids}: {e}")
+
+
+def start_background_tasks() -> list:
+    """Inicia as tarefas habilitadas (chamado no lifespan). Retorna as tasks para cancelar no shutdown."""
+    tasks = []
+    if settings.PRODUCTS_NOTIFY_CHANNEL and settings.DATABASE_URL:
+        tasks.append(asyncio.create_task(listen_product_changes()))
+    if not change_queue.durable and settings.CHANGE_QUEUE_IN_PROCESS:
+        tasks.append(asyncio.create_task(consume_in_process()))
+    return tasks
@@ -0,0 +1,498 @@
+"""
+Pipeline do worker de embeddings em estágios ligados por filas asyncio limitadas:
+
+    scan -> texto -> embed (lotes) -> escrita (lotes)
+
+- scan: lê `produtos` em páginas (keyset por id) ou só os ids avisados pela fila
+- texto: monta o texto do embedding, calcula o hash e decide o que fazer
+- embed: chama batchEmbedContents com até EMBED_BATCH_SIZE textos por vez
+- escrita: upsert em lote em `product_embeddings`
+
+Cada estágio tem sua própria concorrência; as filas limitadas fazem o
+backpressure (o scan para de ler quando o embed não dá conta). O progresso
+(maior id com tudo até ele já gravado) vai para um checkpoint em arquivo, e
+um reindex interrompido continua de onde parou.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from app.config import settings
+from app.core.embeddings import generate_embeddings_batch
+from app.core.metrics import metrics
+from app.core.leader import shard_of
+
+# Linhas por página nas varreduras das tabelas (produtos, product_embeddings)
+SCAN_PAGE_SIZE = 1000
+PRODUCT_COLUMNS = "id, nome, descricao, categoria, tags, updated_at"
+
+# Fim do fluxo em uma fila (um por consumidor do estágio seguinte)
+_DONE = object()
+# Espera máxima para completar um lote antes de enviá-lo incompleto
+_BATCH_FILL_SECONDS = 0.2
+
+
+# --- Leitura das tabelas ---
+
+def scan_table(supabase, table: str, columns: str, order_column: str) -> list:
+    """Lê a tabela inteira em páginas de SCAN_PAGE_SIZE linhas (o PostgREST limita cada resposta)."""
+    rows = []
+    start = 0
+    while True:
+        resp = supabase.table(table).select(columns).order(order_column).range(start, start + SCAN_PAGE_SIZE - 1).execute()
+        rows.extend(resp.data)
+        if len(resp.data) < SCAN_PAGE_SIZE:
+            return rows
+        start += SCAN_PAGE_SIZE
+
+
+def load_existing_embeddings(supabase, product_ids: list = None) -> tuple:
+    """
+    ({product_id: {"created_at", "content_hash"}}, tem_coluna_hash) em uma única
+    varredura paginada (ou só dos `product_ids` informados).
+    Sem a coluna content_hash (sql/product_embeddings_content_hash.sql não aplicado),
+    tem_coluna_hash é False: o worker volta a comparar só as datas e não grava o hash.
+    """
+    def load(columns):
+        if product_ids is not None:
+            return supabase.table("product_embeddings").select(columns).in_("product_id", product_ids).execute().data
+        return scan_table(supabase, "product_embeddings", columns, "product_id")
+
+    has_hash = True
+    try:
+        rows = load("product_id, created_at, content_hash")
+    except Exception as e:
+        print(f"⚠️ [WORKER] Coluna content_hash indisponível ({e}). Comparando apenas datas.")
+        rows = load("product_id, created_at")
+        has_hash = False
+    existing = {
+        item['product_id']: {"created_at": item.get('created_at'), "content_hash": item.get('content_hash')}
+        for item in rows
+    }
+    return existing, has_hash
+
+
+# --- Texto e decisão ---
+
+def build_embedding_text(prod: dict) -> str:
+    """Texto rico que encapsula o significado do produto (entrada do embedding)."""
+    tags_str = ", ".join(prod.get('tags') or [])
+    return f"Categoria: {prod.get('categoria')}. Produto: {prod.get('nome')}. Descrição: {prod.get('descricao')}. Tags: {tags_str}"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _modified_since_embedding(product_updated_at, embedding_created_at) -> bool:
+    """Comparação antiga por datas (formato ISO: 2024-01-01T12:00:00+00:00)."""
+    if not product_updated_at or not embedding_created_at:
+        return False
+    prod_date = datetime.fromisoformat(product_updated_at.replace('Z', '+00:00'))
+    emb_date = datetime.fromisoformat(embedding_created_at.replace('Z', '+00:00'))
+    return prod_date > emb_date
+
+
+@dataclass
+class WorkItem:
+    product_id: int
+    name: str
+    text: str
+    text_hash: str
+    # NOVO / MODIFICADO / REINDEX (gera embedding) ou HASH (só grava o hash)
+    reason: str
+    vector: Optional[list] = None
+
+
+# --- Progresso e checkpoint ---
+
+class Checkpoint:
+    """Último id processado de uma varredura, em arquivo JSON (escrita atômica)."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self, mode: str):
+        if not self.path:
+            return None
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return data.get("last_id") if data.get("mode") == mode else None
+
+    def save(self, mode: str, last_id):
+        if not self.path or last_id is None:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"mode": mode, "last_id": last_id, "saved_at": time.time()}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Progress:
+    """
+    Marca d'água do checkpoint: os itens terminam fora de ordem, então só é
+    seguro retomar depois do maior id em que tudo antes dele já terminou.
+    """
+
+    def __init__(self, start_after):
+        self.pending = set()
+        self.scanned_max = start_after
+
+    def add(self, ids):
+        self.pending.update(ids)
+        if ids:
+            self.scanned_max = max(ids) if self.scanned_max is None else max(self.scanned_max, max(ids))
+
+    def done(self, ids):
+        self.pending.difference_update(ids)
+
+    @property
+    def watermark(self):
+        if self.pending:
+            return min(self.pending) - 1
+        return self.scanned_max
+
+
+class StageStats:
+    """Itens e tempo ocupado por estágio (vazão = itens / segundo ocupado)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+
+    def record(self, items: int, started: float):
+        self.items += items
+        self.busy_seconds += time.perf_counter() - started
+        metrics.inc(f"pipeline.{self.name}.items", items)
+
+    def summary(self) -> str:
+        rate = self.items / self.busy_seconds if self.busy_seconds else 0.0
+        return f"{self.name}: {self.items} ({rate:.0f}/s)"
+
+
+@dataclass
+class PipelineResult:
+    scanned: int = 0
+    new: int = 0
+    regenerated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    # Impressão digital do catálogo (só em varredura completa desde o início)
+    catalog_count: Optional[int] = None
+    catalog_last_update: str = ""
+    resumed: bool = False
+    stages: list = field(default_factory=list)
+
+
+# --- Pipeline ---
+
+class EmbeddingPipeline:
+    def __init__(self, supabase, full_reindex: bool = False, dry_run: bool = False, checkpoint: Checkpoint = None, shard: int = 0, shards: int = 1, elector=None):
+        self.supabase = supabase
+        self.full_reindex = full_reindex
+        self.dry_run = dry_run
+        self.checkpoint = checkpoint
+        # Varredura completa só da partição `shard` (de `shards`), enquanto o lease do elector valer
+        self.shard = shard
+        self.shards = shards
+        self.elector = elector
+        self.mode = "full_reindex" if full_reindex else "sync"
+
+        self.embed_batch_size = settings.EMBED_BATCH_SIZE
+        self.write_batch_size = settings.WRITE_BATCH_SIZE
+        self.concurrency = {
+            "text": max(settings.TEXT_CONCURRENCY, 1),
+            "embed": settings.EMBED_CONCURRENCY,
+            "write": settings.WRITE_CONCURRENCY,
+        }
+        self.stats = {name: StageStats(name) for name in ("scan", "text", "embed", "write")}
+        self.result = PipelineResult()
+        # Ids encontrados em `produtos` (execução por ids: os que faltam foram removidos)
+        self.scanned_ids = set()
+        self._upsert_available = True
+        # Falso sem a coluna content_hash: decide só pelas datas e nunca grava o hash
+        self._hash_column = True
+
+    async def run(self, product_ids: list = None) -> PipelineResult:
+        """Varredura completa (com checkpoint) ou só dos `product_ids` informados."""
+        start_after = None
+        if product_ids is None and self.checkpoint is not None and not self.dry_run:
+            start_after = self.checkpoint.load(self.mode)
+            if start_after is not None:
+                self.result.resumed = True
+                print(f"⏩ [PIPELINE] Retomando {self.mode} a partir do id {start_after}.")
+        self._progress = _Progress(start_after)
+        self._by_ids = product_ids is not None
+
+        queue_size = settings.PIPELINE_QUEUE_SIZE
+        pages = asyncio.Queue(maxsize=2)
+        to_embed = asyncio.Queue(maxsize=queue_size)
+        to_write = asyncio.Queue(maxsize=queue_size)
+
+        tasks = [asyncio.create_task(self._scan(pages, product_ids, start_after))]
+        text_tasks = [asyncio.create_task(self._texts(pages, to_embed, to_write)) for _ in range(self.concurrency["text"])]
+        embed_tasks = [asyncio.create_task(self._embed(to_embed, to_write)) for _ in range(self.concurrency["embed"])]
+        write_tasks = [asyncio.create_task(self._write(to_write)) for _ in range(self.concurrency["write"])]
+        tasks += text_tasks + embed_tasks + write_tasks
+
+        async def drain():
+            # Encerramento em cascata: cada estágio avisa os consumidores do seguinte
+            await tasks[0]
+            await asyncio.gather(*text_tasks)
+            for _ in embed_tasks:
+                await to_embed.put(_DONE)
+            await asyncio.gather(*embed_tasks)
+            for _ in write_tasks:
+                await to_write.put(_DONE)
+            await asyncio.gather(*write_tasks)
+
+        # Qualquer estágio que falhar derruba os outros (senão o scan trava na fila cheia)
+        drainer = asyncio.create_task(drain())
+        try:
+            done, _ = await asyncio.wait(tasks + [drainer], return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            await drainer
+        finally:
+            for task in tasks + [drainer]:
+                task.cancel()
+
+        if product_ids is None and self.checkpoint is not None and not self.dry_run:
+            self.checkpoint.clear()
+        self.result.stages = [stats.summary() for stats in self.stats.values()]
+        return self.result
+
+    def _save_checkpoint(self):
+        if self.checkpoint is not None and not self.dry_run and not self._by_ids:
+            self.checkpoint.save(self.mode, self._progress.watermark)
+
+    # Estágio 1: scan
+    async def _scan(self, pages: asyncio.Queue, product_ids, start_after):
+        if product_ids is not None:
+            for start in range(0, len(product_ids), SCAN_PAGE_SIZE):
+                chunk = product_ids[start:start + SCAN_PAGE_SIZE]
+                started = time.perf_counter()
+                products = await asyncio.to_thread(
+                    lambda: self.supabase.table("produtos").select(PRODUCT_COLUMNS).in_("id", chunk).execute().data
+                )
+                existing, has_hash = await asyncio.to_thread(load_existing_embeddings, self.supabase, chunk)
+                self._hash_column = self._hash_column and has_hash
+                self.stats["scan"].record(len(products), started)
+                await self._emit_page(pages, products, existing)
+        else:
+            started = time.perf_counter()
+            existing, self._hash_column = await asyncio.to_thread(load_existing_embeddings, self.supabase)
+            self.stats["scan"].record(0, started)
+            track_catalog = start_after is None
+            count, last_update = 0, ""
+            last_id = start_after
+            while True:
+                started = time.perf_counter()
+                products = await asyncio.to_thread(self._fetch_page, last_id)
+                self.stats["scan"].record(len(products), started)
+                if not products:
+                    break
+                page_size = len(products)
+                count += page_size
+                last_update = max([last_update] + [p.get('updated_at') or '' for p in products])
+                last_id = products[-1]['id']
+                if self.elector is not None:
+                    self.elector.check(self.shard)
+                if self.shards > 1:
+                    products = [p for p in products if shard_of(p['id'], self.shards) == self.shard]
+                await self._emit_page(pages, products, existing)
+                if page_size < SCAN_PAGE_SIZE:
+                    break
+            if track_catalog:
+                self.result.catalog_count = count
+                self.result.catalog_last_update = last_update
+
+        for _ in range(self.concurrency["text"]):
+            await pages.put(_DONE)
+
+    def _fetch_page(self, last_id):
+        query = self.supabase.table("produtos").select(PRODUCT_COLUMNS)
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        return query.order("id").limit(SCAN_PAGE_SIZE).execute().data
+
+    async def _emit_page(self, pages: asyncio.Queue, products: list, existing: dict):
+        self.result.scanned += len(products)
+        if self._by_ids:
+            self.scanned_ids.update(p['id'] for p in products)
+        self._progress.add([p['id'] for p in products])
+        await pages.put((products, existing))
+
+    # Estágio 2: texto + decisão
+    async def _texts(self, pages: asyncio.Queue, to_embed: asyncio.Queue, to_write: asyncio.Queue):
+        while True:
+            page = await pages.get()
+            if page is _DONE:
+                return
+            products, existing_embeddings = page
+            for prod in products:
+                started = time.perf_counter()
+                item = self._decide(prod, existing_embeddings.get(prod['id']))
+                self.stats["text"].record(1, started)
+                if item is None:
+                    self.result.skipped += 1
+                    self._progress.done([prod['id']])
+                elif self.dry_run:
+                    self._count_written(item)
+                    self._progress.done([prod['id']])
+                elif item.reason == "HASH":
+                    await to_write.put(item)
+                else:
+                    await to_embed.put(item)
+            self._save_checkpoint()
+
+    def _decide(self, prod: dict, existing: Optional[dict]) -> Optional[WorkItem]:
+        """None = nada a fazer; senão o item com o motivo."""
+        text_to_embed = build_embedding_text(prod)
+        text_hash = content_hash(text_to_embed)
+        item = WorkItem(prod['id'], prod.get('nome'), text_to_embed, text_hash, "NOVO")
+
+        if existing is None:
+            # Produto novo sem embedding
+            return item
+        if self.full_reindex:
+            item.reason = "REINDEX"
+            return item
+        if existing["content_hash"] == text_hash:
+            # Texto idêntico ao do embedding salvo: nada a fazer
+            return None
+        if existing["content_hash"] is None:
+            # Linha antiga sem hash: decide pelas datas e grava o hash se o vetor ainda vale
+            try:
+                modified = _modified_since_embedding(prod.get('updated_at'), existing["created_at"])
+            except Exception as e:
+                print(f"⚠️ [WORKER] Erro ao comparar datas para ID {prod['id']}: {e}")
+                modified = False
+            if modified:
+                item.reason = "MODIFICADO"
+                return item
+            if not self._hash_column:
+                # Sem a coluna não há onde gravar o hash: o vetor atual vale, nada a fazer
+                return None
+            item.reason = "HASH"
+            return item
+        item.reason = "MODIFICADO"
+        return item
+
+    async def _take_batch(self, inbox: asyncio.Queue, size: int):
+        """Até `size` itens; retorna (lote, acabou)."""
+        first = await inbox.get()
+        if first is _DONE:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + _BATCH_FILL_SECONDS
+        while len(batch) < size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(inbox.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if item is _DONE:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    # Estágio 3: embed em lote
+    async def _embed(self, to_embed: asyncio.Queue, to_write: asyncio.Queue):
+        while True:
+            batch, finished = await self._take_batch(to_embed, self.embed_batch_size)
+            if batch:
+                started = time.perf_counter()
+                vectors = await asyncio.to_thread(generate_embeddings_batch, [item.text for item in batch])
+                self.stats["embed"].record(len(batch), started)
+                for item, vector in zip(batch, vectors):
+                    if vector:
+                        print(f"⭐ [WORKER] [{item.reason}] Embedding gerado para ID {item.product_id}: {item.name}")
+                        item.vector = vector
+                        await to_write.put(item)
+                    else:
+                        print(f"⚠️ [WORKER] Falha ao gerar vetor para ID {item.product_id}")
+                        self.result.failed += 1
+                        self._progress.done([item.product_id])
+            if finished:
+                return
+
+    # Estágio 4: escrita em lote
+    async def _write(self, to_write: asyncio.Queue):
+        while True:
+            batch, finished = await self._take_batch(to_write, self.write_batch_size)
+            if batch:
+                started = time.perf_counter()
+                try:
+                    await asyncio.to_thread(self._write_batch, batch)
+                    for item in batch:
+                        self._count_written(item)
+                except Exception as e:
+                    print(f"❌ [WORKER] Erro ao salvar lote ({len(batch)} itens): {e}")
+                    self.result.failed += len(batch)
+                self.stats["write"].record(len(batch), started)
+                # Itens com falha ficam com o hash antigo: a próxima varredura tenta de novo
+                self._progress.done([item.product_id for item in batch])
+                self._save_checkpoint()
+            if finished:
+                return
+
+    def _count_written(self, item: WorkItem):
+        if item.reason == "NOVO":
+            self.result.new += 1
+        elif item.reason == "HASH":
+            self.result.skipped += 1
+        else:
+            self.result.regenerated += 1
+
+    def _write_batch(self, batch: list):
+        vectors = [
+            {"product_id": item.product_id, "embedding": item.vector, "content_hash": item.text_hash}
+            if self._hash_column else {"product_id": item.product_id, "embedding": item.vector}
+            for item in batch if item.vector
+        ]
+        if vectors:
+            self._write_vectors(vectors, batch)
+        # Só o hash: UPDATE na linha existente. Um upsert tentaria inserir sem o embedding (NOT NULL)
+        for item in batch:
+            if item.reason == "HASH":
+                self.supabase.table("product_embeddings").update(
+                    {"content_hash": item.text_hash}
+                ).eq("product_id", item.product_id).execute()
+
+    def _write_vectors(self, rows: list, batch: list):
+        if self._upsert_available:
+            try:
+                self.supabase.table("product_embeddings").upsert(rows, on_conflict="product_id").execute()
+                return
+            except Exception as e:
+                # 42P10: sem índice único em product_id (sql/product_embeddings_unique.sql)
+                if "42P10" not in str(e):
+                    raise
+                print("⚠️ [WORKER] Sem índice único em product_embeddings.product_id. Gravando linha a linha.")
+                self._upsert_available = False
+        self._write_rows(rows, batch)
+
+    def _write_rows(self, rows: list, batch: list):
+        new_ids = {item.product_id for item in batch if item.reason == "NOVO"}
+        for row in rows:
+            if row["product_id"] in new_ids:
+                self.supabase.table("product_embeddings").insert(row).execute()
+            else:
+                self.supabase.table("product_embeddings").update(row).eq("product_id", row["product_id"]).execute()
@@ -1,114 +1,248 @@
 
+import argparse
 import asyncio
+import json
 import os
+import signal
 import sys
 import time
 
 # Adicionar raiz do projeto ao path para imports funcionarem
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from app.db.database import supabase, get_all_products_async
-from app.core.embeddings import generate_embedding
+from app.db.database import get_supabase
+from app.core.cache import cache
+from app.core.search_cache import bump_catalog_version
+from app.core.vector_snapshot import write_snapshot, read_current_version
+from app.core.change_queue import change_queue
+from app.workers.embedding_pipeline import EmbeddingPipeline, Checkpoint, scan_table
+from app.core.leader import LeaderElector, LeaseLock, LeaseLost
+from app.config import settings
 
-async def sync_embeddings():
+# O worker é um processo à parte (sem lifespan): testa o Redis antes de montar o elector
+cache.connect()
+
+# Só quem detém o lease (ou a partição) faz a varredura completa
+elector = LeaderElector(
+    "embeddings-worker",
+    shards=settings.WORKER_SHARDS,
+    ttl_seconds=settings.WORKER_LEASE_TTL_SECONDS,
+    redis_client=cache.redis_client if cache.use_redis else None,
+)
+
+def _check_catalog_changed(count: int, last_update: str):
+    """
+    Invalida o cache de buscas da API se o catálogo mudou desde o último ciclo.
+    Impressão digital: quantidade de produtos + maior updated_at (pega inserções,
+    remoções e edições que não alteram o embedding, como preço/estoque).
+    """
+    fingerprint = f"{count}:{last_update}"
+    if cache.get_cache("catalog_fingerprint") != fingerprint:
+        bump_catalog_version()
+        cache.set_cache("catalog_fingerprint", fingerprint, ttl_seconds=30 * 24 * 3600)
+        return True
+    return False
+
+def _publish_snapshot(supabase):
+    """
+    Publica um novo snapshot binário dos embeddings no volume compartilhado
+    (VECTOR_SNAPSHOT_DIR), lido pela API via mmap.
+    """
+    ids, vectors = [], []
+    for row in scan_table(supabase, "product_embeddings", "product_id, embedding", "product_id"):
+        vector = row.get("embedding")
+        # PostgREST devolve o tipo vector como texto "[0.1,0.2,...]"
+        if isinstance(vector, str):
+            vector = json.loads(vector)
+        if vector:
+            ids.append(row["product_id"])
+            vectors.append(vector)
+
+    if not ids:
+        print("ℹ️ [WORKER] Nenhum embedding para publicar no snapshot.")
+        return
+    write_snapshot(
+        settings.VECTOR_SNAPSHOT_DIR,
+        ids,
+        vectors,
+        dtype=settings.VECTOR_SNAPSHOT_DTYPE,
+        full_precision=settings.VECTOR_SNAPSHOT_FULL_PRECISION,
+    )
+
+def _maybe_publish_snapshot(supabase, changed: bool):
+    """Snapshot só é republicado quando algo mudou (ou ainda não existe)."""
+    if not settings.VECTOR_SNAPSHOT_DIR:
+        return
+    if changed or read_current_version(settings.VECTOR_SNAPSHOT_DIR) == 0:
+        # Várias cópias do worker compartilham o volume: uma publicação por vez
+        lock = LeaseLock("vector-snapshot", ttl_seconds=300, redis_client=elector.redis_client)
+        if not lock.acquire(timeout=60):
+            print("⚠️ [WORKER] Outro worker está publicando o snapshot. Pulando esta publicação.")
+            return
+        try:
+            _publish_snapshot(supabase)
+        except Exception as e:
+            print(f"❌ [WORKER] Erro ao publicar snapshot de embeddings: {e}")
+        finally:
+            lock.release()
+
+async def sync_embeddings(full_reindex: bool = False, dry_run: bool = False, shard: int = 0, shards: int = 1, elector: LeaderElector = None):
     """
-    Sincroniza embeddings dos produtos.
-    1. Busca todos os produtos.
-    2. Verifica se já existe embedding atualizado na tabela `product_embeddings`.
-    3. Se não existir OU produto foi modificado, gera e salva.
+    Sincroniza embeddings dos produtos (varredura completa, ver embedding_pipeline).
+    Só chama a API se o produto for novo ou se o texto do embedding mudou
+    (edições de preço/estoque não mudam o texto e são ignoradas).
+    - full_reindex: regenera todos os embeddings
+    - dry_run: só relata o que seria feito (sem API e sem escrita)
+    - shard/shards: processa só a partição `shard` (faixa do hash do id)
+    - elector: interrompe a varredura (LeaseLost) se o lease for perdido
+    Uma execução interrompida continua do checkpoint na próxima chamada.
     """
-    print("🔄 [WORKER] Iniciando sincronização de embeddings...")
+    mode = "reindex completo" if full_reindex else "sincronização"
+    part = f" [partição {shard + 1}/{shards}]" if shards > 1 else ""
+    print(f"🔄 [WORKER] Iniciando {mode} de embeddings{part}{' (dry-run)' if dry_run else ''}...")
+    supabase = get_supabase()
     
-    # 1. Buscar todos os produtos com data de atualização
-    resp_prod = supabase.table("produtos").select("id, nome, descricao, categoria, tags, updated_at").execute()
-    products = resp_prod.data
+    checkpoint_file = settings.EMBEDDING_CHECKPOINT_FILE
+    if checkpoint_file and shards > 1:
+        checkpoint_file = f"{checkpoint_file}.{shard}-of-{shards}"
+    pipeline = EmbeddingPipeline(
+        supabase,
+        full_reindex=full_reindex,
+        dry_run=dry_run,
+        checkpoint=Checkpoint(checkpoint_file),
+        shard=shard,
+        shards=shards,
+        elector=elector,
+    )
+    result = await pipeline.run()
     
-    # 2. Busca embeddings existentes com data de criação
-    resp_emb = supabase.table("product_embeddings").select("product_id, created_at").execute()
-    existing_embeddings = {item['product_id']: item.get('created_at') for item in resp_emb.data}
+    prefix = "[DRY-RUN] Seriam" if dry_run else "Sincronização finalizada."
+    print(f"✅ [WORKER] {prefix} {result.new} novos | {result.regenerated} regenerados | {result.skipped} inalterados (sem chamada à API) | {result.failed} falhas.")
+    print(f"📈 [PIPELINE] {' | '.join(result.stages)}")
+    if dry_run:
+        return result
     
-    print(f"📦 [WORKER] Total Produtos: {len(products)} | Total Embeddings: {len(existing_embeddings)}")
+    # Retomada de checkpoint não vê o catálogo inteiro: invalida por segurança
+    if result.catalog_count is None:
+        bump_catalog_version()
+        catalog_changed = True
+    else:
+        catalog_changed = _check_catalog_changed(result.catalog_count, result.catalog_last_update)
+    _maybe_publish_snapshot(supabase, catalog_changed or result.new or result.regenerated)
+    return result
+
+def sync_changed_products(product_ids: list):
+    """
+    Processa só os produtos avisados pela fila de alterações (webhook / NOTIFY).
+    Produtos que não existem mais têm o embedding removido.
+    """
+    if not product_ids:
+        return
+    supabase = get_supabase()
     
-    count_new = 0
-    count_updated = 0
+    pipeline = EmbeddingPipeline(supabase)
+    result = asyncio.run(pipeline.run(product_ids))
     
-    for prod in products:
-        pid = prod['id']
-        product_updated_at = prod.get('updated_at')
-        
-        should_regenerate = False
-        reason = ""
-        
-        if pid not in existing_embeddings:
-            # Produto novo sem embedding
-            should_regenerate = True
-            reason = "NOVO"
-        elif product_updated_at and existing_embeddings[pid]:
-            # Produto existe, verificar se foi modificado
-            # Comparar datas (formato ISO: 2024-01-01T12:00:00+00:00)
-            from datetime import datetime
-            try:
-                prod_date = datetime.fromisoformat(product_updated_at.replace('Z', '+00:00'))
-                emb_date = datetime.fromisoformat(existing_embeddings[pid].replace('Z', '+00:00'))
-                
-                if prod_date > emb_date:
-                    should_regenerate = True
-                    reason = "MODIFICADO"
-                    count_updated += 1
-            except Exception as e:
-                print(f"⚠️ [WORKER] Erro ao comparar datas para ID {pid}: {e}")
+    # Ids avisados que não voltaram do scan foram removidos de `produtos`
+    missing = [pid for pid in product_ids if pid not in pipeline.scanned_ids]
+    removed = []
+    if missing:
+        removed = supabase.table("product_embeddings").delete().in_("product_id", missing).execute().data or []
+    print(f"⚡ [WORKER] Alterações: {len(product_ids)} ids | {result.new} novos | {result.regenerated} regenerados | {result.skipped} inalterados | {len(removed)} removidos.")
+    
+    changed = bool(result.new or result.regenerated or removed)
+    if changed:
+        # Resultados da busca vetorial mudaram: invalida o cache de páginas
+        bump_catalog_version()
+    _maybe_publish_snapshot(supabase, changed)
+
+def _scan_shard(shard: int):
+    try:
+        asyncio.run(sync_embeddings(shard=shard, shards=elector.shards, elector=elector))
+    except LeaseLost as e:
+        print(f"⚠️ [WORKER] Varredura interrompida: {e} O novo dono continua do checkpoint.")
+    except Exception as e:
+        print(f"❌ [WORKER] Erro crítico no loop: {e}")
+
+def _scan_orphan_shards():
+    """
+    Partições sem dono (réplica que caiu ou WORKER_SHARDS maior que o número de
+    réplicas): cada uma é adotada, varrida uma vez e devolvida.
+    """
+    scanned = set()
+    while True:
+        shard = elector.adopt(exclude=scanned)
+        if shard is None:
+            return
+        scanned.add(shard)
+        try:
+            _scan_shard(shard)
+        finally:
+            elector.release_shard(shard)
+
+def run_worker():
+    """
+    Loop do worker: consome a fila de alterações (push) e faz uma varredura
+    completa a cada EMBEDDING_UPDATE_INTERVAL_MINUTES como rede de segurança.
+    A varredura só roda com o lease (eleição de líder / partição); as demais
+    cópias ficam de reserva e continuam consumindo a fila (o consumer group
+    entrega cada mensagem a um único worker).
+    """
+    interval_seconds = settings.EMBEDDING_UPDATE_INTERVAL_MINUTES * 60
+    next_full_sync = 0.0
+    while True:
+        if time.monotonic() >= next_full_sync:
+            shard = elector.ensure()
+            if shard is None:
+                # Reserva: tenta assumir de novo quando um lease puder ter expirado
+                next_full_sync = time.monotonic() + settings.WORKER_LEASE_TTL_SECONDS
+            else:
+                _scan_shard(shard)
+                _scan_orphan_shards()
+                next_full_sync = time.monotonic() + interval_seconds
+                print(f"💤 [WORKER] Próxima varredura completa em {settings.EMBEDDING_UPDATE_INTERVAL_MINUTES} minutos. Aguardando alterações...")
         
-        if not should_regenerate:
+        remaining = max(next_full_sync - time.monotonic(), 0)
+        if not change_queue.durable:
+            # Sem Redis a fila de alterações é consumida dentro da API: aqui só a varredura
+            time.sleep(remaining)
             continue
-            
-        print(f"⭐ [WORKER] [{reason}] Gerando embedding para ID {pid}: {prod['nome']}")
-        
-        # Montar o texto rico para encapsular o significado do produto
-        tags_str = ", ".join(prod.get('tags') or [])
-        text_to_embed = f"Categoria: {prod.get('categoria')}. Produto: {prod.get('nome')}. Descrição: {prod.get('descricao')}. Tags: {tags_str}"
-        
-        vector = generate_embedding(text_to_embed)
         
-        if vector:
-            # Salvar ou atualizar no banco
-            try:
-                data = {
-                    "product_id": pid,
-                    "embedding": vector
-                }
-                
-                if pid in existing_embeddings:
-                    # Atualizar embedding existente
-                    supabase.table("product_embeddings").update(data).eq("product_id", pid).execute()
-                else:
-                    # Inserir novo embedding
-                    supabase.table("product_embeddings").insert(data).execute()
-                    count_new += 1
-                
-                # Pequena pausa para respeitar Rate Limit da API do Gemini
-                time.sleep(1) 
-            except Exception as e:
-                print(f"❌ [WORKER] Erro ao salvar ID {pid}: {e}")
-        else:
-            print(f"⚠️ [WORKER] Falha ao gerar vetor para ID {pid}")
-            
-    print(f"✅ [WORKER] Sincronização finalizada. {count_new} novos | {count_updated} atualizados.")
+        try:
+            batch = change_queue.consume(block_ms=int(min(remaining, 5) * 1000))
+            if batch.message_ids:
+                sync_changed_products(batch.product_ids)
+                change_queue.ack(batch)
+        except Exception as e:
+            # Lote não confirmado: volta a ser lido na próxima iteração
+            print(f"❌ [WORKER] Erro ao processar fila de alterações: {e}")
+            change_queue.retry_pending()
+            time.sleep(5)
 
-if __name__ == "__main__":
-    # Loop infinito (simples)
-    # Em produção, seria um cronjob ou serviço systemd ou container separado
+def _stop_on_sigterm(signum, frame):
+    # docker stop / deploy: sai pelo mesmo caminho do Ctrl+C (libera o lease na hora)
+    raise KeyboardInterrupt
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de embeddings dos produtos.")
+    parser.add_argument("--full-reindex", action="store_true", help="Regenera todos os embeddings (uma vez) e sai.")
+    parser.add_argument("--dry-run", action="store_true", help="Mostra o que seria feito, sem chamar a API nem gravar, e sai.")
+    args = parser.parse_args()
+    
+    if args.full_reindex or args.dry_run:
+        asyncio.run(sync_embeddings(full_reindex=args.full_reindex, dry_run=args.dry_run))
+        return
+    
+    # Em produção roda como container separado (ver docker-compose.yml)
     print("🚀 [WORKER] Worker de Embeddings Rodando... (Ctrl+C para parar)")
+    signal.signal(signal.SIGTERM, _stop_on_sigterm)
+    try:
+        run_worker()
+    finally:
+        elector.release()
+
+if __name__ == "__main__":
     try:
-        while True:
-            try:
-                asyncio.run(sync_embeddings())
-            except Exception as e:
-                print(f"❌ [WORKER] Erro crítico no loop: {e}")
-            
-            # Espera X minutos antes de rodar de novo
-            interval_minutes = int(os.environ.get("EMBEDDING_UPDATE_INTERVAL_MINUTES", 10))
-            print(f"💤 [WORKER] Dormindo por {interval_minutes} minutos...")
-            time.sleep(interval_minutes * 60)
-            
+        main()
     except KeyboardInterrupt:
         print("🛑 [WORKER] Parando worker...")
@@ -0,0 +1,383 @@
+"""
+Benchmark offline de qualidade x latência da busca: exata, vetorial e híbrida.
+
+Roda o código real (search_products_async, busca vetorial, fetch_hybrid_page e o
+merge/paginação por cursor) contra:
+- catálogo sintético com embeddings falsos determinísticos (retrieval_catalog.py);
+- consultas rotuladas: termo, sabor, sinônimo, tag, preço, categoria e paginação
+  (retrieval_queries.py).
+
+Backends:
+- stand-in: PostgREST em memória no lugar do Supabase (httpx.MockTransport atrás do
+  AsyncPostgrest), com filtros, ordenação, keyset e as RPCs match_products /
+  match_products_page (cosseno exato);
+- local: perna vetorial no snapshot local (app/core/vector_snapshot.py); as linhas
+  continuam vindo do stand-in. A busca exata é a mesma nos dois, então só roda no stand-in.
+
+Por modo e backend: recall@k (limitado a min(k, relevantes)), nDCG@k, fração de
+resultados que violam os filtros pedidos, ids repetidos entre páginas e latência
+p50/p99 por página. `client_p50_ms` desconta o tempo gasto dentro do stand-in (o que
+sobra é o custo do nosso código). Sem rede, sem Redis e sem cache de páginas.
+
+Resultado em JSON (chaves ordenadas, bom para diff entre commits) no stdout ou em --out.
+
+Uso:
+    python benchmarks/retrieval_benchmark.py --size 10000 --per-kind 10
+    python benchmarks/retrieval_benchmark.py --size 200000 --out /tmp/busca.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+STAND_IN_URL = "http://supabase.stand-in"
+
+# Offline: sem Redis, sem asyncpg, sem cache de páginas (mede a busca, não o cache)
+os.environ.update(
+    REDIS_URL="",
+    REDIS_HOST="",
+    DATABASE_URL="",
+    SEARCH_CACHE_ENABLED="false",
+    USE_QUERY_CONTEXT_RPC="false",
+    VECTOR_SNAPSHOT_DIR="",
+    SUPABASE_URL=STAND_IN_URL,
+    SUPABASE_KEY="offline",
+)
+
+import httpx
+import numpy as np
+
+from retrieval_catalog import catalog_embeddings, generate_catalog, fake_embedding
+from retrieval_queries import KINDS, generate_queries
+
+# Os módulos da API imprimem logs no import/uso: o stdout fica só para o JSON
+with contextlib.redirect_stdout(sys.stderr):
+    from app.core import hybrid_search
+    from app.core.pagination import PageCursor
+    from app.core.vector_snapshot import vector_index, write_snapshot
+    from app.db import database as db
+    from app.db.filters import order_for, sort_key
+    from app.db.postgrest import AsyncPostgrest
+
+MODES = ("exact", "vector", "hybrid")
+BACKENDS = ("stand-in", "local")
+
+_KEYSET = re.compile(
+    r"^\(or\((\w+)\.(gt|lt)\.([^,]+),and\(\w+\.eq\.[^,]+,id\.gt\.(\d+)\),\w+\.is\.null\)\)$"
+)
+_ILIKE = re.compile(r'nome\.ilike\."\*(.*?)\*",')
+
+
+def _unquote(text: str) -> str:
+    return text.replace('\\"', '"').replace("\\\\", "\\")
+
+
+class PostgrestStandIn:
+    """PostgREST em memória (só o que a busca de produtos usa), com colunas em numpy."""
+
+    def __init__(self, catalog: list, embeddings: np.ndarray):
+        self.rows = [p.row() for p in catalog]
+        self.ids = np.array([p.id for p in catalog], dtype=np.int64)
+        self.price = np.array([np.nan if p.preco is None else p.preco for p in catalog], dtype=np.float64)
+        self.category = np.array([p.categoria for p in catalog], dtype=object)
+        self.text = [f"{p.nome}\n{p.descricao}".lower() for p in catalog]
+        self.tag_masks = {}
+        for i, p in enumerate(catalog):
+            for tag in p.tags:
+                self.tag_masks.setdefault(tag, np.zeros(len(catalog), dtype=bool))[i] = True
+        self.index_of = {int(pid): i for i, pid in enumerate(self.ids)}
+        self.embeddings = embeddings
+        self.busy_seconds = 0.0
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        started = time.perf_counter()
+        try:
+            path = request.url.path
+            if path.endswith("/rpc/match_products") or path.endswith("/rpc/match_products_page"):
+                return httpx.Response(200, json=self._match(json.loads(request.content)))
+            if path.endswith("/produtos"):
+                return httpx.Response(200, json=self._select(request.url.params.multi_items()))
+            return httpx.Response(404, json={"code": "PGRST202", "message": f"{path} não existe no stand-in"})
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+
+    def _compare(self, column: np.ndarray, op: str, value: float) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            return {"eq": column == value, "gt": column > value, "gte": column >= value,
+                    "lt": column < value, "lte": column <= value}[op]
+
+    def _select(self, params: list) -> list:
+        mask = np.ones(len(self.rows), dtype=bool)
+        order, limit, offset = "id.asc", None, 0
+        for name, value in params:
+            if name == "select":
+                continue
+            if name == "order":
+                order = value
+            elif name == "limit":
+                limit = int(value)
+            elif name == "offset":
+                offset = int(value)
+            elif name == "or":
+                needle = _unquote(_ILIKE.search(value).group(1)).lower()
+                mask &= np.fromiter((needle in t for t in self.text), dtype=bool, count=len(self.text))
+            elif name == "and":
+                column, op, bound, last_id = _KEYSET.match(value).groups()
+                col = self.price if column == "preco" else self.ids
+                bound = float(bound)
+                mask &= self._compare(col, op, bound) | ((col == bound) & (self.ids > int(last_id))) | np.isnan(col)
+            elif name == "id":
+                op, _, arg = value.partition(".")
+                if op == "in":
+                    wanted = [self.index_of[int(i)] for i in arg.strip("()").split(",") if int(i) in self.index_of]
+                    subset = np.zeros(len(self.rows), dtype=bool)
+                    subset[wanted] = True
+                    mask &= subset
+                else:
+                    mask &= self._compare(self.ids, op, int(arg))
+            elif name == "categoria":
+                mask &= self.category == _unquote(value.partition(".")[2])
+            elif name == "tags":
+                for tag in re.findall(r'"((?:[^"\\]|\\.)*)"', value):
+                    mask &= self.tag_masks.get(_unquote(tag), np.zeros(len(self.rows), dtype=bool))
+            elif name == "preco":
+                op, _, arg = value.partition(".")
+                mask &= np.isnan(self.price) if op == "is" else self._compare(self.price, op, float(arg))
+            else:
+                raise ValueError(f"Filtro não suportado pelo stand-in: {name}={value}")
+
+        idx = np.flatnonzero(mask)
+        first = order.split(",")[0].split(".")
+        if first[0] == "preco":
+            # nullslast nos dois sentidos; desempate por id
+            price = self.price[idx]
+            primary = np.where(np.isnan(price), np.inf, -price if first[1] == "desc" else price)
+            idx = idx[np.lexsort((self.ids[idx], primary))]
+        end = None if limit is None else offset + limit
+        return [self.rows[i] for i in idx[offset:end]]
+
+    def _match(self, body: dict) -> list:
+        query = np.asarray(body["query_embedding"], dtype=np.float32)
+        scores = self.embeddings @ (query / np.linalg.norm(query))
+        mask = scores > body["match_threshold"]
+        after = body.get("after_similarity")
+        if after is not None:
+            mask &= (scores < after) | ((scores == after) & (self.ids > body["after_id"]))
+        idx = np.flatnonzero(mask)
+        idx = idx[np.lexsort((self.ids[idx], -scores[idx]))][:body["match_count"]]
+        return [dict(self.rows[i], similarity=float(scores[i])) for i in idx]
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+def ndcg(retrieved: list, relevant: dict, k: int) -> float:
+    dcg = sum((2 ** relevant.get(pid, 0) - 1) / math.log2(i + 2) for i, pid in enumerate(retrieved[:k]))
+    ideal = sorted(relevant.values(), reverse=True)[:k]
+    idcg = sum((2 ** g - 1) / math.log2(i + 2) for i, g in enumerate(ideal))
+    return dcg / idcg if idcg else 0.0
+
+
+class Runner:
+    def __init__(self, stand_in: PostgrestStandIn, query_vectors: dict, k: int):
+        self.stand_in = stand_in
+        self.query_vectors = query_vectors
+        self.k = k
+
+    async def _timed(self, call, latencies: list):
+        busy = self.stand_in.busy_seconds
+        started = time.perf_counter()
+        result = await call()
+        total = time.perf_counter() - started
+        latencies.append((total, self.stand_in.busy_seconds - busy))
+        return result
+
+    async def exact(self, query, latencies: list) -> list:
+        pages, after = [], None
+        order = order_for(query.filters.get("order_by"))
+        for _ in range(query.pages):
+            rows = await self._timed(lambda: db.search_products_async(limit=self.k, after=after, **query.filters), latencies)
+            pages.append([r["id"] for r in rows])
+            if len(rows) < self.k:
+                break
+            after = sort_key(rows[-1], order)
+        return pages
+
+    async def vector(self, query, latencies: list) -> list:
+        pages, after, depth = [], None, 0
+        embedding = self.query_vectors[query.text]
+        for _ in range(query.pages):
+            rows = await self._timed(lambda: db.search_products_async(
+                is_vector=True, embedding=embedding, limit=self.k, after=after, depth=depth
+            ), latencies)
+            pages.append([r["id"] for r in rows])
+            if len(rows) < self.k:
+                break
+            after, depth = [rows[-1].get("similarity"), rows[-1]["id"]], depth + len(rows)
+        return pages
+
+    async def hybrid(self, query, latencies: list) -> list:
+        pages = []
+        cursor = PageCursor(sig=query.id, page=1, query=query.text)
+        for _ in range(query.pages):
+            merged, _ = await self._timed(lambda: hybrid_search.fetch_hybrid_page(query.filters, cursor, self.k), latencies)
+            pages.append([r["id"] for r in merged.rows])
+            if not merged.has_more:
+                break
+            cursor = merged.next_cursor
+        return pages
+
+    async def evaluate(self, mode: str, queries: list, catalog_by_id: dict) -> dict:
+        run = getattr(self, mode)
+        for query in queries[:3]:
+            await run(query, []) # aquecimento
+        latencies = []
+        per_query = []
+        for query in queries:
+            pages = await run(query, latencies)
+            retrieved, seen, duplicates = [], set(), 0
+            for pid in (pid for page in pages for pid in page):
+                if pid in seen:
+                    duplicates += 1
+                    continue
+                seen.add(pid)
+                retrieved.append(pid)
+            depth = self.k * query.pages
+            hits = sum(1 for pid in retrieved[:depth] if pid in query.relevant)
+            violations = sum(1 for pid in retrieved if not query.passes_filters(catalog_by_id[pid]))
+            per_query.append({
+                "kind": query.kind,
+                "paginated": query.pages > 1,
+                "recall": hits / min(depth, len(query.relevant)),
+                "ndcg": ndcg(retrieved, query.relevant, depth),
+                "violations": violations / len(retrieved) if retrieved else 0.0,
+                "duplicates": duplicates,
+                "empty": not retrieved,
+            })
+        return _summary(per_query, latencies)
+
+
+def _mean(values) -> float:
+    values = list(values)
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def _summary(per_query: list, latencies: list) -> dict:
+    totals = [t * 1000 for t, _ in latencies]
+    client = [(t - busy) * 1000 for t, busy in latencies]
+    by_kind = {}
+    for kind in KINDS + ("paginated",):
+        rows = [q for q in per_query if (q["paginated"] if kind == "paginated" else q["kind"] == kind)]
+        if rows:
+            by_kind[kind] = {
+                "queries": len(rows),
+                "recall_at_k": _mean(q["recall"] for q in rows),
+                "ndcg_at_k": _mean(q["ndcg"] for q in rows),
+            }
+    return {
+        "queries": len(per_query),
+        "recall_at_k": _mean(q["recall"] for q in per_query),
+        "ndcg_at_k": _mean(q["ndcg"] for q in per_query),
+        "filter_violation_rate": _mean(q["violations"] for q in per_query),
+        "duplicates_across_pages": sum(q["duplicates"] for q in per_query),
+        "empty_results": sum(q["empty"] for q in per_query),
+        "requests": len(latencies),
+        "p50_ms": round(percentile(totals, 50), 3),
+        "p99_ms": round(percentile(totals, 99), 3),
+        "client_p50_ms": round(percentile(client, 50), 3),
+        "by_kind": by_kind,
+    }
+
+
+async def run_benchmark(args) -> dict:
+    started = time.perf_counter()
+    catalog = generate_catalog(args.size, args.seed)
+    embeddings = catalog_embeddings(catalog, args.dim, args.seed)
+    queries = generate_queries(catalog, per_kind=args.per_kind, pages=args.pages, seed=args.seed + 1)
+    query_vectors = {q.text: fake_embedding(q.text, args.dim) for q in queries}
+    setup_s = time.perf_counter() - started
+
+    stand_in = PostgrestStandIn(catalog, embeddings)
+    db._rest = AsyncPostgrest(STAND_IN_URL, "offline")
+    db._rest._client = httpx.AsyncClient(base_url=db._rest.base_url, transport=httpx.MockTransport(stand_in.handler))
+
+    async def embed_query(text):
+        return query_vectors[text]
+    hybrid_search.generate_query_embedding_async = embed_query
+
+    runner = Runner(stand_in, query_vectors, args.k)
+    catalog_by_id = {p.id: p for p in catalog}
+    results = {}
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        for backend in args.backends:
+            if backend == "local":
+                write_snapshot(snapshot_dir, [p.id for p in catalog], embeddings, dtype=args.snapshot_dtype)
+                vector_index.directory = snapshot_dir
+                vector_index.load()
+            else:
+                vector_index.directory = ""
+            for mode in args.modes:
+                if backend == "local" and mode == "exact":
+                    continue # Mesma busca exata do stand-in
+                results[f"{backend}/{mode}"] = await runner.evaluate(mode, queries, catalog_by_id)
+        vector_index.directory = ""
+    await db.close_db()
+
+    return {
+        "config": {
+            "size": args.size,
+            "dim": args.dim,
+            "k": args.k,
+            "pages": args.pages,
+            "per_kind": args.per_kind,
+            "seed": args.seed,
+            "snapshot_dtype": args.snapshot_dtype,
+        },
+        "queries": {
+            "total": len(queries),
+            "paginated": sum(q.pages > 1 for q in queries),
+            "mean_relevant": _mean(len(q.relevant) for q in queries),
+        },
+        "setup_seconds": round(setup_s, 2),
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Qualidade x latência da busca exata, vetorial e híbrida (offline)")
+    parser.add_argument("--size", type=int, default=10000, help="Produtos no catálogo sintético (1k a 200k)")
+    parser.add_argument("--dim", type=int, default=128, help="Dimensão dos embeddings falsos")
+    parser.add_argument("--k", type=int, default=5, help="Produtos por página (PRODUCTS_LIMIT)")
+    parser.add_argument("--pages", type=int, default=3, help="Páginas avaliadas nas consultas com paginação")
+    parser.add_argument("--per-kind", type=int, default=10, help="Consultas por tipo")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--snapshot-dtype", choices=("float16", "int8"), default="float16")
+    parser.add_argument("--out", help="Grava o JSON neste arquivo (além do stdout)")
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2, sort_keys=True, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Catálogo sintético em português para o benchmark de busca (retrieval_benchmark.py).
+
+Gera de 1k a 200k produtos determinísticos (mesma seed = mesmo catálogo): categorias,
+tipos de produto, sabores, marcas, tags e preços (alguns sem preço). Cada produto
+guarda os atributos "verdadeiros" (tipo, sabor) usados para rotular as consultas.
+
+Embeddings falsos e determinísticos (fake_embedding): soma de vetores aleatórios fixos
+por palavra (seed = hash da palavra), com sinônimos apontando para o mesmo conceito.
+Assim a busca vetorial tem sinal semântico de verdade ("refri" fica perto de
+"Refrigerante") sem chamar o Gemini.
+
+Uso (gera um JSONL para inspeção):
+    python benchmarks/retrieval_catalog.py --size 1000 --out /tmp/catalogo.jsonl
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional
+
+import numpy as np
+
+# categoria -> (tipos, sabores/variações, faixa de preço)
+CATALOG = {
+    "Doces": (["Bolo", "Torta", "Brigadeiro", "Brownie", "Cookie", "Pudim"],
+              ["Chocolate", "Morango", "Limão", "Coco", "Doce de Leite", "Maracujá"], (5, 90)),
+    "Salgados": (["Coxinha", "Empada", "Pastel", "Esfiha", "Quiche", "Enroladinho"],
+                 ["Frango", "Carne", "Queijo", "Palmito", "Calabresa", "Espinafre"], (4, 40)),
+    "Bebidas": (["Refrigerante", "Suco", "Chá", "Água", "Café", "Energético"],
+                ["Laranja", "Uva", "Limão", "Guaraná", "Cola", "Hortelã"], (3, 25)),
+    "Padaria": (["Pão Francês", "Pão Integral", "Baguete", "Croissant", "Broa", "Rosca"],
+                ["Tradicional", "Multigrãos", "Fermentação Natural", "Gergelim", "Milho", "Erva-Doce"], (2, 30)),
+    "Laticínios": (["Iogurte", "Queijo", "Manteiga", "Requeijão", "Leite", "Creme de Leite"],
+                   ["Natural", "Light", "Desnatado", "Minas", "Coalho", "Sem Sal"], (3, 60)),
+    "Congelados": (["Pizza", "Lasanha", "Sorvete", "Hambúrguer", "Açaí", "Nuggets"],
+                   ["Margherita", "Bolonhesa", "Baunilha", "Picanha", "Banana", "Tradicional"], (10, 80)),
+    "Hortifruti": (["Maçã", "Banana", "Tomate", "Alface", "Cenoura", "Batata"],
+                   ["Orgânica", "Gala", "Prata", "Italiano", "Americana", "Baby"], (2, 20)),
+    "Mercearia": (["Arroz", "Feijão", "Macarrão", "Azeite", "Granola", "Aveia"],
+                  ["Integral", "Carioca", "Espaguete", "Extra Virgem", "Tradicional", "Em Flocos"], (4, 70)),
+}
+
+TAGS = ["Vegano", "Sem Glúten", "Sem Lactose", "Orgânico", "Zero Açúcar", "Integral"]
+
+BRANDS = ["Bom Sabor", "Da Vila", "Casa Nova", "Delícia", "Mesa Farta", "Sítio Verde", "Boa Terra", "Real"]
+
+# Como o cliente fala -> tipo do catálogo (mesmo conceito no embedding falso)
+SYNONYMS = {
+    "refri": "Refrigerante",
+    "gelato": "Sorvete",
+    "biscoito": "Cookie",
+    "bolacha": "Cookie",
+    "massa": "Macarrão",
+    "lanche": "Hambúrguer",
+    "salgadinho": "Coxinha",
+}
+
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "com", "sem", "para", "um", "uma",
+    "quero", "tem", "que", "me", "mostra", "mostre", "ver", "produtos", "opcoes", "algum", "alguma",
+}
+
+# Peso do vetor próprio da palavra em relação ao conceito (sinônimos não são idênticos)
+_OWN_WEIGHT = 0.3
+
+
+@dataclass
+class Product:
+    id: int
+    nome: str
+    descricao: str
+    categoria: str
+    tags: List[str]
+    preco: Optional[float]
+    # Atributos verdadeiros (rótulos), não vão para o "banco"
+    tipo: str = field(repr=False, default="")
+    sabor: str = field(repr=False, default="")
+
+    def row(self) -> dict:
+        return {
+            "id": self.id,
+            "nome": self.nome,
+            "descricao": self.descricao,
+            "categoria": self.categoria,
+            "tags": self.tags,
+            "preco": self.preco,
+        }
+
+    def embedding_text(self) -> str:
+        return f"{self.nome} {self.categoria}"
+
+
+def strip_accents(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def tokens(text: str) -> list:
+    words = re.findall(r"[a-z0-9]+", strip_accents(text.lower()))
+    return [w for w in words if w not in STOPWORDS]
+
+
+_CONCEPTS = {strip_accents(k): tokens(v) for k, v in SYNONYMS.items()}
+
+
+@lru_cache(maxsize=None)
+def _word_vector(word: str, dim: int) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha1(word.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """Embedding determinístico de `text` (bag of words com sinônimos)."""
+    total = np.zeros(dim, dtype=np.float32)
+    for word in tokens(text):
+        concept = _CONCEPTS.get(word)
+        if concept:
+            for part in concept:
+                total += _word_vector(part, dim)
+            total += _OWN_WEIGHT * _word_vector(word, dim)
+        else:
+            total += _word_vector(word, dim)
+    norm = np.linalg.norm(total)
+    return (total / norm if norm else total).tolist()
+
+
+def catalog_embeddings(catalog: List[Product], dim: int, seed: int = 42, noise: float = 0.15) -> np.ndarray:
+    """
+    Matriz (produtos x dim) normalizada. Textos repetidos são calculados uma vez; um ruído
+    pequeno por produto evita milhares de vetores idênticos (empates que não existem de verdade).
+    """
+    memo = {}
+    matrix = np.empty((len(catalog), dim), dtype=np.float32)
+    for i, product in enumerate(catalog):
+        text = product.embedding_text()
+        if text not in memo:
+            memo[text] = np.asarray(fake_embedding(text, dim), dtype=np.float32)
+        matrix[i] = memo[text]
+    matrix += np.random.default_rng(seed).standard_normal(matrix.shape, dtype=np.float32) * (noise / np.sqrt(dim))
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def generate_catalog(size: int, seed: int = 42) -> List[Product]:
+    rng = random.Random(seed)
+    categories = list(CATALOG)
+    synonyms_by_type = {}
+    for word, product_type in SYNONYMS.items():
+        synonyms_by_type.setdefault(product_type, []).append(word)
+
+    products = []
+    for pid in range(1, size + 1):
+        categoria = rng.choice(categories)
+        types, flavors, (low, high) = CATALOG[categoria]
+        tipo = rng.choice(types)
+        sabor = rng.choice(flavors)
+        marca = rng.choice(BRANDS)
+        tags = sorted(rng.sample(TAGS, k=rng.choice((0, 0, 1, 1, 2))))
+        # ~3% sem preço (ficam no fim das ordenações por preço)
+        preco = None if rng.random() < 0.03 else round(rng.uniform(low, high), 2)
+
+        descricao = f"{tipo} sabor {sabor.lower()} da {marca}, ideal para o dia a dia."
+        if tipo in synonyms_by_type and rng.random() < 0.2:
+            # Parte das descrições usa o jeito que o cliente fala
+            descricao += f" O melhor {rng.choice(synonyms_by_type[tipo])} da região."
+        products.append(Product(
+            id=pid,
+            nome=f"{tipo} de {sabor} {marca}",
+            descricao=descricao,
+            categoria=categoria,
+            tags=tags,
+            preco=preco,
+            tipo=tipo,
+            sabor=sabor,
+        ))
+    return products
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o catálogo sintético em JSONL")
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        for product in generate_catalog(args.size, args.seed):
+            f.write(json.dumps(dict(product.row(), tipo=product.tipo, sabor=product.sabor), ensure_ascii=False) + "\n")
+    print(f"{args.size} produtos em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
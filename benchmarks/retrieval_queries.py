@@ -0,0 +1,139 @@
+"""
+Conjunto rotulado de consultas para o benchmark de busca (retrieval_benchmark.py).
+
+Cada consulta tem o texto que o cliente digitaria, os filtros que a intenção
+produziria (mesmos nomes do search_products) e os rótulos de relevância tirados dos
+atributos verdadeiros do catálogo sintético (não da busca):
+- 2: tipo certo e o sabor pedido;
+- 1: tipo certo (ou categoria certa, nas buscas por categoria);
+- filtros duros (tag, preço, categoria) não satisfeitos = irrelevante.
+
+Tipos de consulta: term, flavor, synonym, tag, price, category. Uma parte delas é
+avaliada em várias páginas seguidas (paginação por cursor).
+"""
+import math
+import random
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from retrieval_catalog import SYNONYMS, Product
+
+KINDS = ("term", "flavor", "synonym", "tag", "price", "category")
+
+
+@dataclass
+class LabeledQuery:
+    id: str
+    kind: str
+    text: str
+    filters: dict
+    pages: int = 1
+    # Rótulos: tipo/sabor/categoria esperados
+    tipo: Optional[str] = None
+    sabor: Optional[str] = None
+    categoria: Optional[str] = None
+    relevant: Dict[int, int] = field(default_factory=dict, repr=False)
+
+    def passes_filters(self, product: Product) -> bool:
+        """Filtros duros da consulta (tag, preço, categoria), como o cliente pediu."""
+        f = self.filters
+        if f.get("category") and product.categoria != f["category"]:
+            return False
+        if f.get("tag") and f["tag"] not in product.tags:
+            return False
+        if f.get("min_price") is not None or f.get("max_price") is not None:
+            if product.preco is None:
+                return False
+            if f.get("min_price") is not None and product.preco < f["min_price"]:
+                return False
+            if f.get("max_price") is not None and product.preco > f["max_price"]:
+                return False
+        return True
+
+    def grade(self, product: Product) -> int:
+        if not self.passes_filters(product):
+            return 0
+        if self.tipo:
+            if product.tipo != self.tipo:
+                return 0
+            return 2 if self.sabor and product.sabor == self.sabor else 1
+        return 1 if product.categoria == self.categoria else 0
+
+
+def _filters(query_term: str = None, category: str = None, tag: str = None, min_price: float = None,
+             max_price: float = None, order_by: str = None) -> dict:
+    """Mesmo formato dos search_filters montados no /query."""
+    filters = {"query_term": query_term} if query_term else {"category": category}
+    filters.update(
+        tag=tag,
+        min_price=min_price,
+        max_price=max_price,
+        exact_price=None,
+        order_by=order_by,
+        min_price_exclusive=False,
+        max_price_exclusive=False,
+    )
+    return filters
+
+
+def _build(kind: str, seed_product: Product, rng: random.Random, prices: List[float]) -> LabeledQuery:
+    tipo, sabor, categoria = seed_product.tipo, seed_product.sabor, seed_product.categoria
+    term = tipo.lower()
+    if kind == "term":
+        return LabeledQuery("", kind, f"quero {term}", _filters(term), tipo=tipo)
+    if kind == "flavor":
+        term = f"{tipo} de {sabor}".lower()
+        return LabeledQuery("", kind, f"tem {term}?", _filters(term), tipo=tipo, sabor=sabor)
+    if kind == "synonym":
+        word = rng.choice([w for w, t in SYNONYMS.items() if t == tipo])
+        return LabeledQuery("", kind, f"quero {word}", _filters(word), tipo=tipo)
+    if kind == "tag":
+        tag = rng.choice(seed_product.tags)
+        return LabeledQuery("", kind, f"{term} {tag.lower()}", _filters(term, tag=tag), tipo=tipo)
+    if kind == "price":
+        # Teto entre o preço do produto semente e o máximo do tipo: sempre há pelo menos um relevante
+        ceiling = float(math.ceil(rng.uniform(seed_product.preco, max(prices))))
+        return LabeledQuery(
+            "", kind, f"{term} até {ceiling:.0f} reais, do mais barato",
+            _filters(term, max_price=ceiling, order_by="price_asc"), tipo=tipo,
+        )
+    return LabeledQuery("", kind, f"o que tem de {categoria.lower()}?", _filters(category=categoria), categoria=categoria)
+
+
+def generate_queries(catalog: List[Product], per_kind: int = 10, pages: int = 3, paginated_ratio: float = 0.25,
+                     seed: int = 7) -> List[LabeledQuery]:
+    """
+    `per_kind` consultas de cada tipo, cada uma partindo de um produto real do catálogo
+    (garante pelo menos um relevante). `paginated_ratio` delas são avaliadas em `pages` páginas.
+    """
+    rng = random.Random(seed)
+    prices_by_type = {}
+    for product in catalog:
+        if product.preco is not None:
+            prices_by_type.setdefault(product.tipo, []).append(product.preco)
+
+    eligible = {
+        "term": catalog,
+        "flavor": catalog,
+        "synonym": [p for p in catalog if p.tipo in SYNONYMS.values()],
+        "tag": [p for p in catalog if p.tags],
+        "price": [p for p in catalog if p.preco is not None],
+        "category": catalog,
+    }
+    queries = []
+    for kind in KINDS:
+        pool = eligible[kind]
+        if not pool:
+            continue
+        for i in range(per_kind):
+            seed_product = rng.choice(pool)
+            query = _build(kind, seed_product, rng, prices_by_type.get(seed_product.tipo, [0.0]))
+            query.id = f"{kind}-{i:02d}"
+            if rng.random() < paginated_ratio:
+                query.pages = pages
+            queries.append(query)
+
+    for query in queries:
+        query.relevant = {p.id: g for p in catalog if (g := query.grade(p)) > 0}
+    return queries
+
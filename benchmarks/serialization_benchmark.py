@@ -0,0 +1,117 @@
+"""
+Micro-benchmark da montagem da resposta do /query.
+
+Compara, para 5, 50 e 500 produtos:
+- pydantic: um Product por linha + ProductResponse, revalidado e serializado
+  pelo response_model do FastAPI (caminho antigo);
+- orjson: ProductRow (dataclass com __slots__) + orjson.dumps (caminho atual).
+
+Mede tempo de CPU por resposta (time.process_time). Resultado em JSON no stdout.
+
+Uso:
+    python benchmarks/serialization_benchmark.py --repeat 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+from pydantic import TypeAdapter
+
+from app.models import Product, ProductResponse, ProductRow
+
+SIZES = (5, 50, 500)
+
+_response_adapter = TypeAdapter(ProductResponse)
+
+
+def make_rows(n: int) -> list:
+    """Linhas no formato do PostgREST (só as colunas da resposta)."""
+    return [
+        {
+            "id": i,
+            "nome": f"Produto {i}",
+            "descricao": "Descrição de exemplo com algumas palavras sobre o produto " * 2,
+            "categoria": f"Categoria {i % 20}",
+            "tags": ["Vegano", "Sem Glúten"] if i % 3 else [],
+            "preco": round(9.9 + i * 1.37, 2),
+        }
+        for i in range(1, n + 1)
+    ]
+
+
+def pydantic_path(rows: list) -> bytes:
+    products = []
+    for item in rows:
+        try:
+            products.append(Product(
+                id=item.get("id"),
+                nome=item.get("nome", "Sem nome"),
+                descricao=item.get("descricao"),
+                categoria=item.get("categoria"),
+                tags=item.get("tags"),
+                preco=item.get("preco"),
+            ))
+        except Exception:
+            continue
+    response = ProductResponse(
+        interpreted_query="search_product: produto (p1)",
+        ai_message="Aqui estão as opções.",
+        has_more=True,
+        products=products,
+    )
+    # response_model: o FastAPI transforma em dict, valida de novo e serializa
+    validated = _response_adapter.validate_python(response.model_dump())
+    return _response_adapter.dump_json(validated)
+
+
+def orjson_path(rows: list) -> bytes:
+    products = [p for p in (ProductRow.from_row(item) for item in rows) if p is not None]
+    return orjson.dumps({
+        "interpreted_query": "search_product: produto (p1)",
+        "ai_message": "Aqui estão as opções.",
+        "is_category_list": False,
+        "has_more": True,
+        "server_busy": False,
+        "next_cursor": None,
+        "products": products,
+    })
+
+
+def cpu_us_per_call(fn, rows: list, repeat: int) -> float:
+    fn(rows) # aquecimento
+    started = time.process_time()
+    for _ in range(repeat):
+        fn(rows)
+    return (time.process_time() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPU por resposta do /query: Pydantic x orjson")
+    parser.add_argument("--repeat", type=int, default=2000, help="Respostas por medição (dividido pelo tamanho acima de 5)")
+    args = parser.parse_args()
+
+    results = []
+    for n in SIZES:
+        rows = make_rows(n)
+        # Mesmo conteúdo nos dois caminhos
+        assert json.loads(pydantic_path(rows)) == json.loads(orjson_path(rows))
+        repeat = max(args.repeat * 5 // n, 20)
+        before = cpu_us_per_call(pydantic_path, rows, repeat)
+        after = cpu_us_per_call(orjson_path, rows, repeat)
+        results.append({
+            "products": n,
+            "pydantic_us": round(before, 1),
+            "orjson_us": round(after, 1),
+            "saved_us": round(before - after, 1),
+            "speedup": round(before / after, 1) if after else None,
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
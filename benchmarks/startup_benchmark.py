@@ -0,0 +1,84 @@
+"""
+Benchmark de startup da API.
+
+Mede, em processos novos:
+- import_ms: tempo de `import main` (mediana de --runs execuções);
+- ready_ms: tempo do lançamento do uvicorn até o /ready responder 200.
+
+Uso (com as variáveis de ambiente da API configuradas):
+    python benchmarks/startup_benchmark.py --runs 5
+Resultado em JSON no stdout.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_IMPORT_SNIPPET = "import time; t = time.perf_counter(); import main; print((time.perf_counter() - t) * 1000)"
+
+
+def measure_import() -> float:
+    out = subprocess.run(
+        [sys.executable, "-c", _IMPORT_SNIPPET],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    ).stdout
+    # O import imprime logs; o tempo é a última linha
+    return float(out.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_ready(timeout: float) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn saiu com código {proc.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2):
+                    return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError, TimeoutError):
+                time.sleep(0.05)
+        raise TimeoutError(f"/ready não respondeu 200 em {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo de import e de readiness da API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=60)
+    parser.add_argument("--skip-ready", action="store_true", help="Mede só o import")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "import_ms": {"median": round(statistics.median(imports), 1), "min": round(min(imports), 1), "max": round(max(imports), 1)},
+    }
+    if not args.skip_ready:
+        readies = [measure_ready(args.ready_timeout) for _ in range(args.runs)]
+        result["ready_ms"] = {"median": round(statistics.median(readies), 1), "min": round(min(readies), 1), "max": round(max(readies), 1)}
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
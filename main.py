@@ -1,23 +1,103 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import JSONResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.models import UserMessageRequest, ProductResponse, Product
+from app.models import UserMessageRequest, ProductResponse, ProductRow, ProductsChangedRequest
 from app.db.database import (
-    get_all_products_async, 
-    search_products_async, 
-    get_memory_async, 
-    save_memory_async, 
+    init_db,
+    close_db,
+    save_memory_async,
     get_all_categories_async
 )
+from app.db.query_context import fetch_session_context
+from app.core.search_cache import filters_digest, bump_catalog_version
+from app.core.pagination import (
+    PageCursor,
+    decode_cursor,
+    encode_cursor,
+    clear_session_cursor,
+    load_session_cursor,
+    save_session_cursor
+)
+from app.core.hybrid_search import fetch_hybrid_page
+from app.core.prefetch import prefetcher, is_pagination_message
+from app.config import settings
 from app.core.ai import process_user_message
+from app.core.category_index import format_category_list, category_index
+from app.core.prompt_builder import prompt_builder, EXAMPLES
+from app.core.gemini_service import get_api_key as get_gemini_key, close_http_client
+from app.core.cache import cache
+from app.core.invalidation import invalidation_bus
+from app.core.conversation_summary import summarizer, last_filters_from
 from app.utils import ensure_uuid
-from app.core.embeddings import generate_query_embedding
-from app.middleware import LoggingMiddleware
+from app.core.metrics import metrics
+from app.core.deadline import request_deadline, DeadlineExceeded
+from app.core.circuit_breaker import CircuitOpen
+from app.core.vector_snapshot import vector_index
+from app.core.change_queue import change_queue
+from app.workers.change_listener import start_background_tasks
+from app.middleware import LoggingMiddleware, ProfilingMiddleware
+from app.core.profiling import profiler, memory_tracker, loop_monitor, executor_stats
 from app.logger import logger
 import os
+import time
 import asyncio
+import orjson
+from typing import Optional
+from contextlib import asynccontextmanager
+
+# Estado de prontidão (/ready): só vira True depois do warm-up
+_startup = {"ready": False, "startup_ms": None, "error": None}
+_warm_up_lock = asyncio.Lock()
+
 
+async def _warm_up():
+    """
+    Aquece o que a primeira requisição usaria: conexão do pool, categorias (cache),
+    chave do Gemini, prefixo do prompt e índice de categorias. Marca a réplica como pronta.
+    """
+    async with _warm_up_lock:
+        if _startup["ready"]:
+            return
+        try:
+            async with asyncio.timeout(settings.STARTUP_WARMUP_TIMEOUT):
+                categories = await get_all_categories_async()
+            get_gemini_key()
+            prompt_builder.system_prefix(len(EXAMPLES))
+            category_index.warm(categories)
+            _startup["ready"], _startup["error"] = True, None
+        except Exception as e:
+            _startup["error"] = f"{type(e).__name__}: {e}"
+            print(f"⚠️ [STARTUP] Warm-up incompleto ({_startup['error']}). /ready tenta de novo.")
 
-app = FastAPI(title="API RAG Produtos")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    # Redis: conexão testada aqui (não no import)
+    await asyncio.to_thread(cache.connect)
+    # Invalidação do L1 entre réplicas (Redis pub/sub, thread de background)
+    invalidation_bus.start()
+    # Pools de conexão com o banco vivem durante toda a vida da aplicação
+    await init_db()
+    # Snapshot dos embeddings (se configurado): busca vetorial local via mmap
+    vector_index.load()
+    # LISTEN/NOTIFY de produtos e consumo local da fila de alterações (se habilitados)
+    background_tasks = start_background_tasks()
+    if settings.DEBUG_API_KEY:
+        loop_monitor.start()
+    await _warm_up()
+    _startup["startup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    print(f"✅ [STARTUP] Lifespan concluído em {_startup['startup_ms']}ms (pronto: {_startup['ready']}).")
+    yield
+    for task in background_tasks:
+        task.cancel()
+    loop_monitor.stop()
+    await asyncio.to_thread(invalidation_bus.stop)
+    await close_http_client()
+    await close_db()
+
+
+app = FastAPI(title="API RAG Produtos", lifespan=lifespan)
 
 # Configuração de CORS
 app.add_middleware(
@@ -30,37 +110,13 @@ app.add_middleware(
 
 # Adicionar middleware de logging
 app.add_middleware(LoggingMiddleware)
+# Profiling sob demanda (/debug/*): só com DEBUG_API_KEY configurada
+if settings.DEBUG_API_KEY:
+    app.add_middleware(ProfilingMiddleware)
 
 logger.info("🚀 API RAG Produtos iniciada")
 
-@app.get("/debug-env")
-async def debug_env():
-    import os
-    from app.gemini_service import CHAT_MODEL_NAME
-    key = os.environ.get("GEMINI_API_KEY", "NOT_FOUND")
-    file_key = "NOT_CHECKED"
-    try:
-         with open(".env", "r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip().startswith("GEMINI_API_KEY="):
-                    file_key = line.strip().split("=", 1)[1].strip().strip('"').strip("'")
-    except:
-        file_key = "ERROR_READING_FILE"
-
-    masked = f"{key[:5]}...{key[-5:]}" if len(key) > 10 else key
-    masked_file = f"{file_key[:5]}...{file_key[-5:]}" if len(file_key) > 10 else file_key
-    
-    return {
-        "env_var_status": "FOUND" if len(key) > 10 else "MISSING/INVALID",
-        "env_var_masked": masked,
-        "file_key_masked": masked_file,
-        "model_name": CHAT_MODEL_NAME,
-        "cwd": os.getcwd(),
-        "env_file_exists": os.path.exists(".env")
-    }
-
-
-from app.core.security import get_api_key
+from app.core.security import get_api_key, get_debug_key
 from fastapi import Depends
 
 @app.get("/")
@@ -69,18 +125,124 @@ async def read_root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint for Docker/Portainer"""
+    """Liveness: o processo está de pé (não garante dependências aquecidas; ver /ready)"""
     return {
         "status": "healthy",
         "service": "rag-produtos-api",
         "version": "1.0.0"
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 200 só depois do warm-up (pools, categorias, caches).
+    Usado pelo healthcheck do container para o deploy start-first trocar de réplica.
+    """
+    if not _startup["ready"]:
+        await _warm_up()
+    body = {
+        "status": "ready" if _startup["ready"] else "warming_up",
+        "startup_ms": _startup["startup_ms"],
+        # Redis fora do ar não bloqueia: o cache cai para a memória local
+        "redis": ("ok" if await asyncio.to_thread(cache.ping) else "down") if cache.redis_client is not None else "disabled",
+        "vector_snapshot_version": metrics.snapshot().get("vector_snapshot.version"),
+    }
+    if not _startup["ready"]:
+        body["error"] = _startup["error"]
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+@app.get("/metrics", dependencies=[Depends(get_api_key)])
+async def get_metrics():
+    """Métricas internas desta réplica (coalescing, cache, filas...)."""
+    return metrics.snapshot()
+
+@app.post("/internal/products-changed", dependencies=[Depends(get_api_key)])
+async def products_changed(payload: ProductsChangedRequest):
+    """
+    Aviso de produtos alterados (Database Webhook do Supabase ou {"ids": [...]}).
+    Os ids vão para a fila do worker de embeddings; o cache de buscas é invalidado na hora.
+    """
+    queued = change_queue.publish(payload.product_ids())
+    if queued:
+        bump_catalog_version()
+    return {"queued": queued, "durable": change_queue.durable}
+
+@app.post("/debug/profile", dependencies=[Depends(get_debug_key)])
+async def debug_profile_arm(requests: int = 1, path: Optional[str] = None):
+    """
+    Perfila as próximas `requests` requisições (opcionalmente só as de `path`, ex: /query).
+    Também dá para perfilar uma requisição avulsa com os headers X-Profile e X-Debug-Key.
+    """
+    requests = max(0, min(requests, settings.PROFILE_MAX_REQUESTS))
+    profiler.arm(requests, path)
+    return {"armed": requests, "path": path}
+
+@app.get("/debug/profiles", dependencies=[Depends(get_debug_key)])
+async def debug_profiles():
+    """Perfis recentes (id, requisição, status, duração, amostras)."""
+    return {"armed": profiler.armed, "profiles": profiler.summaries()}
+
+@app.get("/debug/profiles/{profile_id}", dependencies=[Depends(get_debug_key)])
+async def debug_profile(profile_id: int):
+    """Pilhas no formato folded (flamegraph.pl, speedscope, inferno)."""
+    result = profiler.get(profile_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado")
+    return PlainTextResponse(profiler.folded(result))
+
+@app.post("/debug/memory/start", dependencies=[Depends(get_debug_key)])
+async def debug_memory_start(frames: int = 10):
+    """Liga o tracemalloc (tem custo: desligue com /debug/memory/stop ao terminar)."""
+    memory_tracker.start(max(1, min(frames, 50)))
+    return {"tracing": memory_tracker.tracing}
+
+@app.post("/debug/memory/snapshot", dependencies=[Depends(get_debug_key)])
+async def debug_memory_snapshot(limit: int = 20, group_by: str = "lineno"):
+    """Maiores alocações vivas e o diff contra o snapshot anterior."""
+    if not memory_tracker.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc desligado: chame /debug/memory/start")
+    if group_by not in ("lineno", "filename", "traceback"):
+        raise HTTPException(status_code=400, detail="group_by deve ser lineno, filename ou traceback")
+    report = await asyncio.to_thread(memory_tracker.snapshot, limit, group_by)
+    report["structures"] = {"cache.local": len(cache.local_cache), "cache.l1": cache.l1_size()}
+    return report
+
+@app.post("/debug/memory/stop", dependencies=[Depends(get_debug_key)])
+async def debug_memory_stop():
+    memory_tracker.stop()
+    return {"tracing": memory_tracker.tracing}
+
+@app.get("/debug/runtime", dependencies=[Depends(get_debug_key)])
+async def debug_runtime():
+    """Atraso do event loop e estado do executor do asyncio.to_thread."""
+    return {"loop_lag": loop_monitor.stats(), **executor_stats()}
+
 @app.post("/query", response_model=ProductResponse, dependencies=[Depends(get_api_key)])
-async def query_products(request: UserMessageRequest):
+async def query_products(request: UserMessageRequest, x_request_timeout: Optional[float] = Header(None)):
     """
     Endpoint principal que gerencia o fluxo de conversação e busca.
+    Roda sob um prazo (REQUEST_DEADLINE_SECONDS ou o header X-Request-Timeout, o menor):
+    estourado o prazo ou com um circuito aberto, responde server_busy em vez de 500.
     """
+    budget = settings.REQUEST_DEADLINE_SECONDS
+    if x_request_timeout and x_request_timeout > 0:
+        budget = min(budget, x_request_timeout)
+    with request_deadline(budget):
+        try:
+            async with asyncio.timeout(budget):
+                return await _run_query(request)
+        except (CircuitOpen, DeadlineExceeded, TimeoutError) as e:
+            metrics.inc("degraded.query_busy")
+            print(f"⚠️ [DEADLINE] /query degradado: {str(e) or 'prazo esgotado'}")
+            return _query_response(
+                interpreted_query="Servidor Ocupado",
+                ai_message="Estamos com muitas requisições no momento. Por favor, tente novamente em alguns segundos.",
+                server_busy=True,
+            )
+
+async def _run_query(request: UserMessageRequest):
+    """Fluxo do /query: contexto, intenção, busca e resposta."""
     try:
         # Coluna agora é text, aceita qualquer ID
         session_id = request.session_id
@@ -89,71 +251,70 @@ async def query_products(request: UserMessageRequest):
         # 0. Configurações
         limit = int(os.environ.get("PRODUCTS_LIMIT", 5))
         
-        # 1. Recuperar contexto (Memoria + Categorias)
-        memory_task = get_memory_async(session_id)
-        categories_task = get_all_categories_async()
+        # 0.1 Atalho: "ver mais" com a próxima página já pré-carregada dispensa LLM e buscas
+        if settings.PREFETCH_FAST_PATH and not request.cursor and is_pagination_message(user_msg):
+            session_cursor = load_session_cursor(session_id)
+            merged, slot = prefetcher.take(session_id, session_cursor)
+            if merged is not None:
+                meta = slot.get("meta") or {}
+                print(f"⚡ [PREFETCH] Página {session_cursor.page} servida do prefetch.")
+                return await _finish_query(
+                    session_id, user_msg, "Aqui estão mais opções.",
+                    meta.get("type"), meta.get("term"), session_cursor.page, False,
+                    merged, slot.get("filters"), limit
+                )
         
-        # Executar em paralelo para ganhar tempo
-        memory, categories = await asyncio.gather(memory_task, categories_task)
+        # 1. Recuperar contexto (Memoria + Categorias)
+        # Com a RPC query_context é uma única chamada; senão, memória e categorias em paralelo
+        # Memória: só as mensagens recentes; o restante chega pelo resumo da sessão
+        session_ctx = await fetch_session_context(session_id, memory_limit=settings.PROMPT_HISTORY_TURNS)
+        memory, categories = session_ctx.memory, session_ctx.categories
         
         # 2. Processar intenção com IA
-        ai_response = await process_user_message(user_msg, memory, categories)
-        
-        intent_type = ai_response.get("type")
+        intent = await process_user_message(user_msg, memory, categories, session_ctx.summary)
         
         # Checar se o servidor está ocupado
-        if ai_response.get("server_busy"):
-            return ProductResponse(
+        if intent.server_busy:
+            return _query_response(
                 interpreted_query="Servidor Ocupado",
                 ai_message="Estamos com muitas requisições no momento. Por favor, tente novamente em alguns segundos.",
-                is_category_list=False,
-                has_more=False,
                 server_busy=True,
-                products=[]
             )
-            
-        term = ai_response.get("term")
-        tag = ai_response.get("tag")
-        
-        # Filtros de Preço
-        price_min = ai_response.get("price_min")
-        price_max = ai_response.get("price_max")
-        price_exact = ai_response.get("price_exact")
-        min_exclusive = ai_response.get("price_min_exclusive", False)
-        max_exclusive = ai_response.get("price_max_exclusive", False)
-        sort_order = ai_response.get("sort")
         
-        ai_reply = ai_response.get("ai_reply", "")
-        # sort_order is already extracted above
-        is_cat_list = ai_response.get("is_category_list", False)
+        # Intent já validado (tipos, página >= 1, nulos normalizados)
+        intent_type = intent.type
+        term = intent.term
+        tag = intent.tag
         
-        page = ai_response.get("page", 1)
-        if isinstance(page, str) or page is None: page = 1 # Garantia
+        # Filtros de Preço
+        price_min = intent.price_min
+        price_max = intent.price_max
+        price_exact = intent.price_exact
+        min_exclusive = intent.price_min_exclusive
+        max_exclusive = intent.price_max_exclusive
+        sort_order = intent.sort
         
-        # Calcular offset
-        offset = (int(page) - 1) * limit
+        ai_reply = intent.ai_reply
+        is_cat_list = intent.is_category_list
+        if is_cat_list:
+            # Lista completa vem do cache de categorias (o LLM só vê uma shortlist)
+            ai_reply = f"{ai_reply} {format_category_list(categories)}".strip()
+        page = intent.page
         
         print(f"Intenção: {intent_type} | Termo: {term} | Tag: {tag} | Preço: {price_min}-{price_max} (={price_exact}) | Excl: {min_exclusive}/{max_exclusive} | Pagina: {page}")
 
         # 3. Executar ações baseadas na intenção
-        products_list = []
-        has_more = False
-        
-        # Truque: buscar limit + 1 para saber se tem proxima pagina
-        fetch_limit = limit + 1
-        
-        data = []
+        merged = None
+        search_filters = None
         if intent_type == "search_product":
-            # --- BUSCA HÍBRIDA (EXATA + VETORIAL EM PARALELO) ---
-            exact_data = []
-            vector_data = []
+            search_filters = {"query_term": term}
+        elif intent_type == "search_category" and term:
+            search_filters = {"category": term}
             
-            # 1. Sempre executar busca exata quando há filtros
-            exact_task = search_products_async(
-                query_term=term, 
-                tag=tag, 
-                limit=fetch_limit, 
-                offset=offset,
+        if search_filters is not None:
+            # --- BUSCA HÍBRIDA (EXATA + VETORIAL EM PARALELO) ---
+            search_filters.update(
+                tag=tag,
                 min_price=price_min,
                 max_price=price_max,
                 exact_price=price_exact,
@@ -161,116 +322,125 @@ async def query_products(request: UserMessageRequest):
                 min_price_exclusive=min_exclusive,
                 max_price_exclusive=max_exclusive
             )
+            sig = filters_digest(search_filters)
             
-            # 2. Executar busca vetorial em paralelo (se não for busca muito específica)
-            vector_task = None
-            if not price_exact and user_msg:  # user_msg definido no início
-                vector = generate_query_embedding(user_msg)
-                if vector:
-                    print(f"🔎 [RAG] Executando busca vetorial em paralelo...")
-                    vector_task = search_products_async(
-                        is_vector=True,
-                        embedding=vector,
-                        limit=fetch_limit
-                    )
-            
-            # 3. Executar ambas em paralelo
-            if vector_task:
-                exact_data, vector_data = await asyncio.gather(exact_task, vector_task)
-                print(f"📊 [RAG] Exata: {len(exact_data)} | Vetorial: {len(vector_data)}")
-                # Combinar resultados
-                data = merge_and_deduplicate(exact_data, vector_data, fetch_limit)
-                print(f"✅ [RAG] Combinados: {len(data)} (após merge/dedup)")
+            # Paginação por cursor: enviado pelo cliente ou guardado na sessão ("ver mais")
+            cursor = decode_cursor(request.cursor)
+            if cursor is None and page > 1:
+                cursor = load_session_cursor(session_id)
+            if cursor is not None and cursor.sig != sig:
+                cursor = None # Filtros mudaram: é outra busca
+                
+            offset = 0
+            if cursor is not None:
+                page = cursor.page
+                # Página já calculada em background?
+                merged, _slot = prefetcher.take(session_id, cursor)
             else:
-                exact_data = await exact_task
-                data = exact_data
-            # -----------------------------------------------
-        elif intent_type == "search_category" and term:
-            # Mesma lógica híbrida para categorias
-            exact_task = search_products_async(
-                category=term, 
-                tag=tag, 
-                limit=fetch_limit, 
-                offset=offset,
-                min_price=price_min,
-                max_price=price_max,
-                exact_price=price_exact,
-                order_by=sort_order,
-                min_price_exclusive=min_exclusive,
-                max_price_exclusive=max_exclusive
-            )
+                # Primeira página (ou página N sem cursor salvo: cai no offset antigo)
+                cursor = PageCursor(sig=sig, page=page, query=user_msg)
+                offset = (page - 1) * limit
             
-            vector_task = None
-            if not price_exact and user_msg:
-                vector = generate_query_embedding(user_msg)
-                if vector:
-                    print(f"🔎 [RAG] Busca vetorial para categoria '{term}'...")
-                    vector_task = search_products_async(
-                        is_vector=True,
-                        embedding=vector,
-                        limit=fetch_limit
-                    )
-            
-            if vector_task:
-                exact_data, vector_data = await asyncio.gather(exact_task, vector_task)
-                print(f"📊 [RAG] Categoria '{term}': Exata: {len(exact_data)} | Vetorial: {len(vector_data)}")
-                data = merge_and_deduplicate(exact_data, vector_data, fetch_limit)
+            if merged is None:
+                merged, search_ctx = await fetch_hybrid_page(search_filters, cursor, limit, offset)
+                print(f"📊 [RAG] Exata: {len(search_ctx.exact)} | Vetorial: {len(search_ctx.vector or [])} | Página: {len(merged.rows)} | Idas ao banco: {search_ctx.round_trips}")
             else:
-                data = await exact_task
-            
-        # Logica de Has More
-        if len(data) > limit:
-            has_more = True
-            data = data[:limit] # Remove o excedente que usamos so pra checar
-            
-        products_list = _parse_products(data)
-        
-        # Ajuste Fino da Mensagem (Feedback de Fim de Lista)
-        if intent_type in ["search_product", "search_category"]:
-            if len(products_list) == 0 and page > 1:
-                # Caso onde o usuário pediu "ver mais" mas não tem mais nada
-                ai_reply = "Já mostrei todas as opções disponíveis nesta categoria."
-            elif not has_more and len(products_list) > 0:
-                 # Caso onde mostrou os últimos itens
-                 ai_reply += " (Estas são todas as opções)."
+                print(f"⚡ [PREFETCH] Página {page} servida do prefetch.")
+            # -----------------------------------------------
             
-        # (Se for 'conversation', products_list continua vazio)
-
-        # 4. Salvar Memória (Msg Usuario + Resposta IA) - Em background para nao travar user
-        # Poderiamos usar BackgroundTasks do FastAPI, mas await aqui é rapido o suficiente se for async
-        await save_memory_async(session_id, "user", user_msg)
-        await save_memory_async(session_id, "assistant", ai_reply)
-        
-        return ProductResponse(
-            interpreted_query=f"{intent_type}: {term} (p{page})",
-            ai_message=ai_reply,
-            is_category_list=is_cat_list,
-            has_more=has_more,
-            products=products_list
+        return await _finish_query(
+            session_id, user_msg, ai_reply, intent_type, term, page, is_cat_list,
+            merged, search_filters, limit
         )
         
+    except (CircuitOpen, DeadlineExceeded, TimeoutError):
+        raise # Degradação tratada em query_products
     except Exception as e:
         print(f"Erro CRÍTICO: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _finish_query(session_id, user_msg, ai_reply, intent_type, term, page, is_cat_list, merged=None, search_filters=None, limit=5):
+    """
+    Parte final do /query: salva o cursor, agenda o prefetch da próxima página,
+    ajusta a mensagem de fim de lista, grava a memória e monta a resposta.
+    """
+    data = []
+    has_more = False
+    next_cursor = None
+    if merged is not None:
+        data = merged.rows
+        has_more = merged.has_more
+        save_session_cursor(session_id, merged.next_cursor)
+        if has_more:
+            next_cursor = encode_cursor(merged.next_cursor)
+            prefetcher.schedule(
+                session_id, search_filters, merged.next_cursor, limit,
+                meta={"type": intent_type, "term": term}
+            )
+    else:
+        # Turno sem busca: o "ver mais" seguinte não pode servir a página de uma busca antiga
+        clear_session_cursor(session_id)
+        prefetcher.discard(session_id)
+        
+    products_list = _parse_products(data)
+    
+    # Ajuste Fino da Mensagem (Feedback de Fim de Lista)
+    if intent_type in ["search_product", "search_category"]:
+        if len(products_list) == 0 and page > 1:
+            # Caso onde o usuário pediu "ver mais" mas não tem mais nada
+            ai_reply = "Já mostrei todas as opções disponíveis nesta categoria."
+        elif not has_more and len(products_list) > 0:
+             # Caso onde mostrou os últimos itens
+             ai_reply += " (Estas são todas as opções)."
+        
+    # (Se for 'conversation', products_list continua vazio)
+
+    # 4. Salvar Memória (Msg Usuario + Resposta IA) - Em background para nao travar user
+    # Poderiamos usar BackgroundTasks do FastAPI, mas await aqui é rapido o suficiente se for async
+    # Sem banco (circuito aberto) ou sem prazo, a resposta sai mesmo assim: só a memória fica sem o turno
+    await save_memory_async(session_id, "user", user_msg)
+    await save_memory_async(session_id, "assistant", ai_reply)
+    
+    # Resumo da sessão e última busca ativa: atualizados em background
+    if search_filters is not None:
+        summarizer.save_filters(session_id, last_filters_from(intent_type, term, page, search_filters))
+    summarizer.schedule(session_id)
+    
+    return _query_response(
+        interpreted_query=f"{intent_type}: {term} (p{page})",
+        ai_message=ai_reply,
+        is_category_list=is_cat_list,
+        has_more=has_more,
+        next_cursor=next_cursor,
+        products=products_list
+    )
+
 def _parse_products(data):
-    """Auxiliar para converter dict do supabase em modelo Pydantic"""
+    """Linhas do banco/cache -> ProductRow (linhas sem id ou nome são descartadas)"""
     parsed = []
     for item in data:
-        try:
-            prod = Product(
-                id=item.get('id'),
-                nome=item.get('nome', 'Sem nome'),
-                descricao=item.get('descricao'),
-                categoria=item.get('categoria'),
-                tags=item.get('tags'),
-                preco=item.get('preco')
-            )
+        prod = ProductRow.from_row(item)
+        if prod is not None:
             parsed.append(prod)
-        except:
-            continue
     return parsed
 
+def _query_response(interpreted_query: str, ai_message: str, products: list = (), is_category_list: bool = False,
+                    has_more: bool = False, server_busy: bool = False, next_cursor: str = None) -> Response:
+    """
+    Corpo do /query no formato de ProductResponse (o response_model fica só para a
+    documentação), serializado direto pelo orjson sem validar tudo de novo.
+    """
+    body = {
+        "interpreted_query": interpreted_query,
+        "ai_message": ai_message,
+        "is_category_list": is_category_list,
+        "has_more": has_more,
+        "server_busy": server_busy,
+        "next_cursor": next_cursor,
+        "products": list(products),
+    }
+    return Response(content=orjson.dumps(body), media_type="application/json")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
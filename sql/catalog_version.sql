@@ -0,0 +1,32 @@
+-- Versão do catálogo: contador que muda sempre que a tabela `produtos` é alterada.
+-- Usado pela API para invalidar caches (categorias, páginas de busca) sem depender de TTL.
+
+create table if not exists catalog_meta (
+    id int primary key default 1 check (id = 1),
+    version bigint not null default 1,
+    updated_at timestamptz not null default now()
+);
+
+insert into catalog_meta (id) values (1) on conflict (id) do nothing;
+
+create or replace function bump_catalog_version() returns bigint
+language sql
+as $$
+    update catalog_meta set version = version + 1, updated_at = now() where id = 1
+    returning version;
+$$;
+
+create or replace function _produtos_changed() returns trigger
+language plpgsql
+as $$
+begin
+    perform bump_catalog_version();
+    return null;
+end;
+$$;
+
+-- Trigger por comando (não por linha): um UPDATE em massa gera um único bump
+drop trigger if exists produtos_catalog_version on produtos;
+create trigger produtos_catalog_version
+    after insert or update or delete or truncate on produtos
+    for each statement execute function _produtos_changed();
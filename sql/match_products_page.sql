@@ -0,0 +1,35 @@
+-- Busca vetorial paginada por cursor (keyset em similaridade desc, id asc).
+-- Mesmo resultado de match_products, mas continua a partir de (after_similarity, after_id)
+-- sem reprocessar as páginas anteriores.
+
+create or replace function match_products_page(
+    query_embedding vector,
+    match_threshold float,
+    match_count int,
+    after_similarity float default null,
+    after_id bigint default null
+) returns table (
+    id bigint,
+    nome text,
+    descricao text,
+    categoria text,
+    tags text[],
+    preco numeric,
+    similarity float
+)
+language sql
+stable
+as $$
+    select p.id, p.nome, p.descricao, p.categoria, p.tags, p.preco,
+           1 - (e.embedding <=> query_embedding) as similarity
+      from product_embeddings e
+      join produtos p on p.id = e.product_id
+     where 1 - (e.embedding <=> query_embedding) > match_threshold
+       and (
+           after_similarity is null
+           or 1 - (e.embedding <=> query_embedding) < after_similarity
+           or (1 - (e.embedding <=> query_embedding) = after_similarity and p.id > after_id)
+       )
+     order by e.embedding <=> query_embedding, p.id
+     limit match_count;
+$$;
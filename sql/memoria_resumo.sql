@@ -0,0 +1,17 @@
+-- Resumo contínuo de cada sessão (ao lado de memoria_chat).
+-- Mantido em background pela API (app/core/conversation_summary.py):
+--   summary       texto curto com o que importa das mensagens antigas
+--   summarized_at created_at da última mensagem já incluída no resumo
+--   last_filters  última busca ativa (type, term, tag, preços, sort, page)
+-- O prompt de intenção leva o resumo + as últimas mensagens, com tamanho fixo.
+
+create table if not exists memoria_resumo (
+    session_id text primary key,
+    summary text not null default '',
+    summarized_at timestamptz,
+    last_filters jsonb,
+    updated_at timestamptz not null default now()
+);
+
+create index if not exists memoria_chat_session_created_idx
+    on memoria_chat (session_id, created_at);
@@ -0,0 +1,6 @@
+-- Hash (sha256) do texto usado para gerar cada embedding.
+-- O worker só chama a API de embeddings quando o texto do produto muda;
+-- edições de preço/estoque (que só mexem em updated_at) são ignoradas.
+-- Linhas antigas ficam com null e recebem o hash na próxima sincronização.
+
+alter table product_embeddings add column if not exists content_hash text;
@@ -0,0 +1,5 @@
+-- Um embedding por produto: permite o upsert em lote do worker
+-- (on_conflict=product_id). Sem este índice o worker grava linha a linha.
+
+create unique index if not exists product_embeddings_product_id_key
+    on product_embeddings (product_id);
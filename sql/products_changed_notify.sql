@@ -0,0 +1,24 @@
+-- Notificação de produtos alterados para o worker de embeddings (LISTEN/NOTIFY).
+-- A API escuta o canal PRODUCTS_NOTIFY_CHANNEL com uma conexão direta (DATABASE_URL
+-- sem pgbouncer em modo transaction) e enfileira o id. Só uma réplica escuta por vez.
+-- O canal é o argumento do trigger abaixo e precisa ser igual a PRODUCTS_NOTIFY_CHANNEL
+-- (a API confere na conexão e avisa no log se não bater).
+-- Alternativa sem conexão direta: Database Webhook do Supabase apontando para
+-- POST /internal/products-changed (com o header X-API-Key).
+
+create or replace function _produtos_notify_change() returns trigger
+language plpgsql
+as $$
+begin
+    perform pg_notify(
+        tg_argv[0],
+        (case when tg_op = 'DELETE' then old.id else new.id end)::text
+    );
+    return null;
+end;
+$$;
+
+drop trigger if exists produtos_notify_change on produtos;
+create trigger produtos_notify_change
+    after insert or update or delete on produtos
+    for each row execute function _produtos_notify_change('produtos_changed');
@@ -0,0 +1,124 @@
+-- Contexto completo do /query em uma única ida ao banco.
+-- Depende de: catalog_version.sql, memoria_resumo.sql, match_products e match_products_page.sql (busca vetorial).
+--
+-- Cada parte é opcional:
+--   p_session_id nulo ou p_memory_limit = 0 -> sem memória
+--   p_filters nulo                          -> sem busca exata
+--   p_embedding nulo                        -> sem busca vetorial
+--
+-- p_filters usa os mesmos nomes dos parâmetros de search_products:
+--   query_term, category, tag, min_price, max_price, exact_price,
+--   min_price_exclusive, max_price_exclusive, order_by ('price_asc' | 'price_desc')
+--
+-- Paginação por cursor (opcional, no lugar de p_offset):
+--   p_after        = {"sort": <preco ou null>, "id": <id>}  (busca exata)
+--   p_vector_after = {"similarity": <float>, "id": <id>}    (busca vetorial)
+
+create or replace function query_context(
+    p_session_id text default null,
+    p_memory_limit int default 10,
+    p_filters jsonb default null,
+    p_limit int default 6,
+    p_offset int default 0,
+    p_embedding vector default null,
+    p_match_threshold float default 0.3,
+    p_match_count int default 6,
+    p_after jsonb default null,
+    p_vector_after jsonb default null
+) returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    v_memory jsonb := '[]'::jsonb;
+    v_summary jsonb := null;
+    v_exact jsonb := null;
+    v_vector jsonb := null;
+    v_version bigint;
+    v_term text;
+    v_min numeric;
+    v_max numeric;
+    v_exact_price numeric;
+    v_order text;
+    v_after_sort numeric;
+    v_after_id bigint;
+begin
+    select version into v_version from catalog_meta where id = 1;
+
+    if p_session_id is not null and p_memory_limit > 0 then
+        select coalesce(jsonb_agg(to_jsonb(m) order by m.created_at), '[]'::jsonb)
+          into v_memory
+          from (
+              select * from memoria_chat
+               where session_id = p_session_id
+               order by created_at desc
+               limit p_memory_limit
+          ) m;
+
+        select to_jsonb(r) into v_summary
+          from memoria_resumo r
+         where r.session_id = p_session_id;
+    end if;
+
+    if p_filters is not null then
+        v_term := nullif(p_filters->>'query_term', '');
+        v_min := (p_filters->>'min_price')::numeric;
+        v_max := (p_filters->>'max_price')::numeric;
+        v_exact_price := (p_filters->>'exact_price')::numeric;
+        v_order := p_filters->>'order_by';
+        v_after_sort := (p_after->>'sort')::numeric;
+        v_after_id := (p_after->>'id')::bigint;
+
+        select coalesce(jsonb_agg(to_jsonb(p)), '[]'::jsonb)
+          into v_exact
+          from (
+              -- Só as colunas da resposta (sem embedding e demais colunas da tabela)
+              select id, nome, descricao, categoria, tags, preco from produtos
+               where (p_filters->>'category' is null or categoria = p_filters->>'category')
+                 and (p_filters->>'tag' is null or tags @> array[p_filters->>'tag'])
+                 and (v_min is null or case when coalesce((p_filters->>'min_price_exclusive')::boolean, false)
+                                            then preco > v_min else preco >= v_min end)
+                 and (v_max is null or case when coalesce((p_filters->>'max_price_exclusive')::boolean, false)
+                                            then preco < v_max else preco <= v_max end)
+                 and (v_exact_price is null or preco = v_exact_price)
+                 and (v_term is null or nome ilike '%' || v_term || '%' or descricao ilike '%' || v_term || '%')
+                 -- Cursor: mesma ordem total (preço com nulos no fim, depois id)
+                 and (
+                     v_after_id is null
+                     or (v_order is distinct from 'price_asc' and v_order is distinct from 'price_desc' and id > v_after_id)
+                     or (v_order in ('price_asc', 'price_desc') and v_after_sort is null and preco is null and id > v_after_id)
+                     or (v_order = 'price_asc' and v_after_sort is not null
+                         and (preco > v_after_sort or (preco = v_after_sort and id > v_after_id) or preco is null))
+                     or (v_order = 'price_desc' and v_after_sort is not null
+                         and (preco < v_after_sort or (preco = v_after_sort and id > v_after_id) or preco is null))
+                 )
+               order by
+                   case when v_order = 'price_asc' then preco end asc nulls last,
+                   case when v_order = 'price_desc' then preco end desc nulls last,
+                   id asc
+               limit p_limit offset case when v_after_id is null then p_offset else 0 end
+          ) p;
+    end if;
+
+    if p_embedding is not null and p_vector_after is null then
+        select coalesce(jsonb_agg(to_jsonb(v)), '[]'::jsonb)
+          into v_vector
+          from match_products(p_embedding, p_match_threshold, p_match_count) v;
+    elsif p_embedding is not null then
+        select coalesce(jsonb_agg(to_jsonb(v)), '[]'::jsonb)
+          into v_vector
+          from match_products_page(
+              p_embedding, p_match_threshold, p_match_count,
+              (p_vector_after->>'similarity')::float, (p_vector_after->>'id')::bigint
+          ) v;
+    end if;
+
+    return jsonb_build_object(
+        'memory', v_memory,
+        'summary', v_summary,
+        'catalog_version', v_version,
+        'exact', v_exact,
+        'vector', v_vector
+    );
+end;
+$$;
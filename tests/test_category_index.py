@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from app.core import category_index as module
+from app.core.category_index import CategoryIndex
+
+CATEGORIES = [f"Categoria {i:02d}" for i in range(60)] + ["Bebidas", "Doces"]
+
+
+def _index(fallback_max=100):
+    index = CategoryIndex(top_k=3, min_categories=40, timeout=0.5, fallback_max=fallback_max)
+    index._schedule_build = lambda categories, digest: None
+    return index
+
+
+def _ready(index):
+    index._names = ["Bebidas", "Doces"]
+    index._matrix = module.np.eye(2, dtype=module.np.float32)
+    index._digest = module.categories_digest(CATEGORIES)
+
+
+def _embedding(monkeypatch, vector):
+    async def fake(message):
+        return vector
+    monkeypatch.setattr(module, "generate_query_embedding_async", fake)
+
+
+def test_cold_index_sends_full_list():
+    shortlist = asyncio.run(_index().shortlist("o que tem de bom?", CATEGORIES))
+    assert sorted(shortlist) == sorted(CATEGORIES)
+
+
+def test_cold_index_caps_list_and_keeps_lexical_first():
+    shortlist = asyncio.run(_index(fallback_max=10).shortlist("tem doces?", CATEGORIES))
+    assert shortlist[0] == "Doces"
+    assert len(shortlist) == 10
+
+
+@pytest.mark.parametrize("vector", [None, []])
+def test_missing_embedding_falls_back(monkeypatch, vector):
+    index = _index()
+    _ready(index)
+    _embedding(monkeypatch, vector)
+    shortlist = asyncio.run(index.shortlist("o que tem de bom?", CATEGORIES))
+    assert len(shortlist) == len(CATEGORIES)
+
+
+def test_ready_index_uses_nearest(monkeypatch):
+    index = _index()
+    _ready(index)
+    _embedding(monkeypatch, [0.0, 1.0])
+    shortlist = asyncio.run(index.shortlist("algo gostoso", CATEGORIES))
+    assert shortlist == ["Doces", "Bebidas"]
+
+
+def test_small_catalog_goes_whole():
+    categories = ["Bebidas", "Doces"]
+    assert asyncio.run(_index().shortlist("oi", categories)) == categories
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from app.core import deadline
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+class DependencyDown(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def _is_failure(e):
+    return not isinstance(e, BadRequest)
+
+
+async def _raise(exc, delay=0.0):
+    await asyncio.sleep(delay)
+    raise exc
+
+
+async def _ok():
+    return "ok"
+
+
+def _fail(breaker, exc=None, delay=0.0):
+    async def scenario():
+        with pytest.raises(type(exc or DependencyDown())):
+            await breaker.call(lambda: _raise(exc or DependencyDown(), delay), is_failure=_is_failure)
+    asyncio.run(scenario())
+
+
+def _expire(breaker):
+    # Simula o fim de BREAKER_RESET_SECONDS
+    breaker._opened_at -= breaker.reset_seconds
+
+
+def test_opens_after_threshold_and_rejects():
+    breaker = CircuitBreaker("t_threshold", failure_threshold=3, reset_seconds=30)
+    _fail(breaker)
+    _fail(breaker)
+    assert breaker.state == CLOSED
+    _fail(breaker)
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpen):
+        asyncio.run(breaker.call(_ok))
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("t_reset", failure_threshold=2, reset_seconds=30)
+    _fail(breaker)
+    assert asyncio.run(breaker.call(_ok)) == "ok"
+    _fail(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker("t_probe", failure_threshold=1, reset_seconds=30)
+    _fail(breaker)
+    _expire(breaker)
+
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    # Chamada de teste em andamento: as outras continuam falhando na hora
+    assert not breaker.allow()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("t_probe_fail", failure_threshold=3, reset_seconds=30)
+    for _ in range(3):
+        _fail(breaker)
+    _expire(breaker)
+    _fail(breaker)
+    assert breaker.state == OPEN
+
+
+def test_fast_cancellation_releases_probe():
+    breaker = CircuitBreaker("t_cancel", failure_threshold=1, reset_seconds=30, slow_call_seconds=5)
+    _fail(breaker)
+    _expire(breaker)
+
+    async def scenario():
+        task = asyncio.create_task(breaker.call(lambda: asyncio.sleep(10)))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert breaker.state == HALF_OPEN
+    # Outra chamada de teste pode sair
+    assert breaker.allow()
+
+
+def test_slow_timeout_counts_as_failure():
+    breaker = CircuitBreaker("t_slow_cancel", failure_threshold=1, reset_seconds=30, slow_call_seconds=0.02)
+
+    async def scenario():
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.05):
+                await breaker.call(lambda: asyncio.sleep(10))
+
+    asyncio.run(scenario())
+    assert breaker.state == OPEN
+
+
+def test_slow_failure_after_deadline_counts():
+    breaker = CircuitBreaker("t_slow_deadline", failure_threshold=1, reset_seconds=30, slow_call_seconds=0.02)
+    with deadline.request_deadline(0.01):
+        _fail(breaker, delay=0.03)
+    assert breaker.state == OPEN
+
+
+def test_fast_failure_after_deadline_does_not_count():
+    breaker = CircuitBreaker("t_fast_deadline", failure_threshold=1, reset_seconds=30, slow_call_seconds=5)
+    with deadline.request_deadline(0.001):
+        asyncio.run(asyncio.sleep(0.01))
+        _fail(breaker)
+    assert breaker.state == CLOSED
+
+
+def test_slow_request_error_does_not_open():
+    breaker = CircuitBreaker("t_slow_4xx", failure_threshold=1, reset_seconds=30, slow_call_seconds=0.01)
+    _fail(breaker, BadRequest(), delay=0.02)
+    assert breaker.state == CLOSED
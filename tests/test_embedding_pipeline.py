@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from app.workers import embedding_pipeline as module
+from app.workers.embedding_pipeline import Checkpoint, EmbeddingPipeline, _Progress
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db, self.table, self.rows, self.payload, self.op = db, table, list(db[table]), None, "select"
+
+    def select(self, columns):
+        return self
+
+    def gt(self, column, value):
+        self.rows = [r for r in self.rows if r[column] > value]
+        return self
+
+    def eq(self, column, value):
+        self.rows = [r for r in self.rows if r[column] == value]
+        return self
+
+    def in_(self, column, values):
+        self.rows = [r for r in self.rows if r[column] in values]
+        return self
+
+    def order(self, column):
+        self.rows.sort(key=lambda r: r[column])
+        return self
+
+    def limit(self, n):
+        self.rows = self.rows[:n]
+        return self
+
+    def range(self, start, end):
+        self.rows = self.rows[start:end + 1]
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self.op, self.payload = "upsert", rows
+        return self
+
+    def update(self, row):
+        self.op, self.payload = "update", row
+        return self
+
+    def execute(self):
+        if self.op == "upsert":
+            by_id = {r["product_id"]: r for r in self.db[self.table]}
+            for row in self.payload:
+                by_id.setdefault(row["product_id"], {}).update(row)
+            self.db[self.table] = list(by_id.values())
+        elif self.op == "update":
+            for row in self.rows:
+                row.update(self.payload)
+        return type("Response", (), {"data": self.rows})()
+
+
+class FakeSupabase:
+    def __init__(self, products):
+        self.db = {"produtos": products, "product_embeddings": []}
+
+    def table(self, name):
+        return _Query(self.db, name)
+
+
+def _products(n):
+    return [{"id": i, "nome": f"Produto {i}", "descricao": "", "categoria": "Doces", "tags": [], "updated_at": None}
+            for i in range(1, n + 1)]
+
+
+@pytest.fixture
+def embedded(monkeypatch):
+    texts = []
+
+    def fake_batch(batch):
+        texts.extend(batch)
+        return [[0.1, 0.2] for _ in batch]
+
+    monkeypatch.setattr(module, "generate_embeddings_batch", fake_batch)
+    return texts
+
+
+def test_watermark_waits_for_out_of_order_completion():
+    progress = _Progress(None)
+    progress.add([1, 2, 3, 4])
+    progress.done([2, 3, 4])
+    # O 1 ainda está em andamento: retomar depois do 0
+    assert progress.watermark == 0
+    progress.done([1])
+    assert progress.watermark == 4
+
+    progress.add([7, 9])
+    progress.done([9])
+    assert progress.watermark == 6
+
+
+def test_watermark_starts_at_resume_point():
+    progress = _Progress(10)
+    assert progress.watermark == 10
+    progress.add([11, 12])
+    progress.done([12])
+    assert progress.watermark == 10
+
+
+def test_checkpoint_is_per_mode(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    assert checkpoint.load("sync") is None
+    checkpoint.save("sync", 42)
+    assert checkpoint.load("sync") == 42
+    assert checkpoint.load("full_reindex") is None
+    checkpoint.clear()
+    assert checkpoint.load("sync") is None
+
+
+def test_resumes_after_last_checkpoint(tmp_path, embedded):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.save("sync", 4)
+    supabase = FakeSupabase(_products(10))
+
+    result = asyncio.run(EmbeddingPipeline(supabase, checkpoint=checkpoint).run())
+
+    assert result.resumed
+    assert result.new == 6
+    assert sorted(r["product_id"] for r in supabase.db["product_embeddings"]) == [5, 6, 7, 8, 9, 10]
+    # Varredura completa: o checkpoint é apagado
+    assert checkpoint.load("sync") is None
+
+
+class _Crash(BaseException):
+    """Queda do processo no meio da escrita (não é tratada como falha de lote)."""
+
+
+def test_interrupted_run_resumes_from_watermark(tmp_path, embedded):
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+    supabase = FakeSupabase(_products(5))
+    pipeline = EmbeddingPipeline(supabase, checkpoint=checkpoint)
+    pipeline.concurrency["embed"] = 1
+    pipeline.concurrency["write"] = 1
+    pipeline.write_batch_size = 1
+    write_batch = pipeline._write_batch
+
+    def crash_on_third(batch):
+        if batch[0].product_id == 3:
+            raise _Crash()
+        write_batch(batch)
+
+    pipeline._write_batch = crash_on_third
+    with pytest.raises(_Crash):
+        asyncio.run(pipeline.run())
+    # 1 e 2 gravados; o checkpoint não passa do 3 (nunca gravado)
+    assert checkpoint.load("sync") == 2
+
+    embedded.clear()
+    result = asyncio.run(EmbeddingPipeline(supabase, checkpoint=checkpoint).run())
+    assert result.resumed
+    assert result.new == 3
+    assert any("Produto 3." in text for text in embedded)
+    assert sorted(r["product_id"] for r in supabase.db["product_embeddings"]) == [1, 2, 3, 4, 5]
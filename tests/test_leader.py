@@ -0,0 +1,74 @@
+import fakeredis
+import pytest
+
+from app.core.leader import LeaderElector, LeaseLost
+
+
+def _replica(redis_client, shards=3):
+    return LeaderElector("test-worker", shards=shards, ttl_seconds=60, redis_client=redis_client)
+
+
+def test_each_replica_owns_one_shard():
+    redis_client = fakeredis.FakeRedis()
+    first, second = _replica(redis_client), _replica(redis_client)
+    try:
+        assert first.ensure() == 0
+        assert second.ensure() == 1
+        # Já tem partição: não pega outra
+        assert first.ensure() == 0
+    finally:
+        first.release()
+        second.release()
+
+
+def test_fewer_replicas_than_shards_adopt_orphans():
+    redis_client = fakeredis.FakeRedis()
+    first, second = _replica(redis_client), _replica(redis_client)
+    try:
+        first.ensure()
+        second.ensure()
+
+        # Partição 2 sem dono: o primeiro a terminar a própria varredura adota
+        assert first.adopt() == 2
+        first.check(2)
+        assert second.adopt() is None
+
+        # Varrida e devolvida: outra réplica pode adotar no ciclo seguinte
+        first.release_shard(2)
+        with pytest.raises(LeaseLost):
+            first.check(2)
+        assert first.adopt(exclude={2}) is None
+        assert second.adopt() == 2
+    finally:
+        first.release()
+        second.release()
+
+
+def test_shard_of_crashed_replica_is_adopted():
+    redis_client = fakeredis.FakeRedis()
+    survivor, crashed = _replica(redis_client, shards=2), _replica(redis_client, shards=2)
+    try:
+        survivor.ensure()
+        assert crashed.ensure() == 1
+        assert survivor.adopt() is None
+
+        # Réplica caiu sem liberar: o lease expira
+        crashed._stop.set()
+        redis_client.delete(crashed._lock.key)
+        assert survivor.adopt() == 1
+    finally:
+        survivor.release()
+
+
+def test_adopt_requires_own_shard():
+    redis_client = fakeredis.FakeRedis()
+    owners = [_replica(redis_client, shards=2) for _ in range(2)]
+    spare = _replica(redis_client, shards=2)
+    try:
+        for owner in owners:
+            owner.ensure()
+        assert spare.ensure() is None
+        assert spare.adopt() is None
+    finally:
+        for elector in owners + [spare]:
+            elector.release()
@@ -0,0 +1,64 @@
+import base64
+import json
+from dataclasses import asdict
+
+import pytest
+
+from app.core.pagination import PageCursor, _sign, cursor_from_dict, decode_cursor, encode_cursor
+
+
+def _cursor(**fields):
+    return PageCursor(sig="abc", page=2, query="bolo", exact_after=[12.5, 40], vector_after=[0.81, 7], **fields)
+
+
+def _token(data: dict, signed: bool = True) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+    return f"{payload}.{_sign(payload)}" if signed else f"{payload}.AAAA"
+
+
+def test_round_trip():
+    cursor = _cursor(vector_depth=3)
+    assert decode_cursor(encode_cursor(cursor)) == cursor
+
+
+def test_tampered_payload_is_rejected():
+    token = encode_cursor(_cursor())
+    _, signature = token.split(".")
+    forged = _token(dict(asdict(_cursor()), exact_after=["1),id.gt.0", 40]), signed=False).split(".")[0]
+    assert decode_cursor(f"{forged}.{signature}") is None
+
+
+def test_wrong_or_missing_signature_is_rejected():
+    payload, signature = encode_cursor(_cursor()).split(".")
+    assert decode_cursor(f"{payload}.{signature[:-2]}xx") is None
+    assert decode_cursor(payload) is None
+
+
+@pytest.mark.parametrize("token", ["ção.ção", "abc.é", "é", "!!..", "."])
+def test_non_ascii_or_garbage_is_rejected(token):
+    assert decode_cursor(token) is None
+
+
+@pytest.mark.parametrize("field, value", [
+    ("exact_after", ["1),id.gt.0", 40]),
+    ("exact_after", [10.0, "40"]),
+    ("exact_after", [10.0, True]),
+    ("exact_after", [10.0]),
+    ("vector_after", {"value": 0.5, "id": 1}),
+    ("vector_after", [0.5, 1.5]),
+    ("page", 0),
+    ("page", "2"),
+    ("vector_depth", -1),
+    ("exact_done", "false"),
+])
+def test_wrongly_typed_fields_are_rejected(field, value):
+    data = dict(asdict(_cursor()), **{field: value})
+    # Mesmo com assinatura válida (chave vazada), os tipos são conferidos
+    assert decode_cursor(_token(data)) is None
+    assert cursor_from_dict(data) is None
+
+
+def test_null_sort_value_and_unknown_fields():
+    data = dict(asdict(_cursor()), exact_after=[None, 40])
+    assert decode_cursor(_token(data)).exact_after == [None, 40]
+    assert cursor_from_dict(dict(data, extra=1)) is None
@@ -0,0 +1,53 @@
+import time
+
+import fakeredis
+
+from app.core import rate_limiter
+from app.core.rate_limiter import BACKGROUND, INTERACTIVE, TokenBucketLimiter
+
+
+def _limiter(redis_client, rate_per_minute=60, burst=5, reserve_fraction=0.4):
+    return TokenBucketLimiter("test", rate_per_minute, burst, reserve_fraction, redis_client=redis_client)
+
+
+def test_background_stops_at_interactive_reserve():
+    limiter = _limiter(fakeredis.FakeRedis())
+
+    waits = [limiter.try_acquire(priority=BACKGROUND) for _ in range(5)]
+
+    # Bucket de 5 com reserva de 2: só 3 saem para o background
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] > 0 and waits[4] > 0
+    # O tráfego interativo ainda usa a reserva
+    assert limiter.try_acquire(priority=INTERACTIVE) == 0.0
+
+
+def test_tokens_refill_over_time():
+    limiter = _limiter(fakeredis.FakeRedis(), rate_per_minute=600, burst=2, reserve_fraction=0)
+
+    assert limiter.try_acquire() == 0.0
+    assert limiter.try_acquire() == 0.0
+    wait = limiter.try_acquire()
+    assert 0 < wait <= 0.1
+
+    time.sleep(wait + 0.05)
+    assert limiter.try_acquire() == 0.0
+
+
+def test_falls_back_to_local_bucket_when_redis_fails(monkeypatch):
+    limiter = _limiter(fakeredis.FakeRedis(), burst=2, reserve_fraction=0)
+
+    def broken_script(**kwargs):
+        raise ConnectionError("redis down")
+
+    limiter._script = broken_script
+    calls = []
+    original = limiter.local.try_acquire
+    monkeypatch.setattr(limiter.local, "try_acquire", lambda cost, floor: calls.append(cost) or original(cost, floor))
+
+    assert limiter.try_acquire() == 0.0
+    assert limiter.try_acquire() == 0.0
+    assert limiter.try_acquire() > 0
+    assert len(calls) == 3
+    # Não volta ao Redis antes de REDIS_RETRY_SECONDS
+    assert limiter._redis_down_until > time.monotonic() + rate_limiter.REDIS_RETRY_SECONDS - 1
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.core.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight = SingleFlight("test_share")
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert results == ["ok"] * 5
+    assert len(calls) == 1
+    # Chave liberada ao terminar: a próxima chamada executa de novo
+    assert flight._calls == {}
+
+
+def test_cancelled_waiter_leaves_shared_call_running():
+    async def scenario():
+        flight = SingleFlight("test_cancel_one")
+        release = asyncio.Event()
+
+        async def fn():
+            await release.wait()
+            return "ok"
+
+        first = asyncio.create_task(flight.do("k", fn))
+        second = asyncio.create_task(flight.do("k", fn))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return flight, await second
+
+    flight, result = asyncio.run(scenario())
+    assert result == "ok"
+    assert flight._calls == {}
+
+
+def test_last_waiter_cancelled_cancels_fn():
+    async def scenario():
+        flight = SingleFlight("test_cancel_all")
+        state = {"cancelled": False}
+
+        async def fn():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        waiters = [asyncio.create_task(flight.do("k", fn)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for task in waiters:
+            task.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight, state
+
+    flight, state = asyncio.run(scenario())
+    assert state["cancelled"]
+    assert flight._calls == {}
+
+
+def test_exception_reaches_every_waiter():
+    async def scenario():
+        flight = SingleFlight("test_error")
+
+        async def fn():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*(flight.do("k", fn) for _ in range(3)), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) and str(r) == "boom" for r in results)
+    assert flight._calls == {}